@@ -0,0 +1,175 @@
+"""
+Microbenchmarks for the CPU-side work done per answer.
+
+These are pytest-benchmark tests; the file name keeps them out of the default test run.
+Requires: pip install -e .[bench]
+
+    pytest benchmarks/bench_hotpaths.py                 # run and print timings
+    python benchmarks/compare.py                        # run and flag regressions against the baseline
+    python benchmarks/compare.py --update               # accept the current timings as the new baseline
+"""
+import json
+import os
+import sys
+import textwrap
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from rich.console import Console
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import howdoai  # noqa: E402
+from howdoai.api_client import AIResponse  # noqa: E402
+from howdoai.backends import CompletionRequest, LocalBackend  # noqa: E402
+from howdoai.config import config  # noqa: E402
+from howdoai.questionanswerer import QuestionAnswerer  # noqa: E402
+from howdoai.transports import Transport  # noqa: E402
+
+PYTHON_BLOCK = textwrap.dedent('''\
+    ```python
+    import argparse
+    import tarfile
+    from pathlib import Path
+
+
+    def create_archive(source: Path, target: Path, compression: str = "gz") -> Path:
+        """Create a compressed tar archive of every file below source."""
+        mode = f"w:{compression}" if compression else "w"
+        with tarfile.open(target, mode) as archive:
+            for path in sorted(source.rglob("*")):
+                if path.is_file():
+                    archive.add(path, arcname=path.relative_to(source))
+        return target
+
+
+    if __name__ == "__main__":
+        parser = argparse.ArgumentParser()
+        parser.add_argument("source", type=Path)
+        parser.add_argument("target", type=Path)
+        args = parser.parse_args()
+        print(create_archive(args.source, args.target))
+    ```''')
+
+BASH_BLOCK = textwrap.dedent('''\
+    ```bash
+    tar -czvf backup-$(date +%Y%m%d).tar.gz --exclude='*.log' --exclude='node_modules' ./project
+    tar -tzvf backup-$(date +%Y%m%d).tar.gz | head -n 20
+    tar -xzvf backup-$(date +%Y%m%d).tar.gz -C /tmp/restore
+    ```''')
+
+PROSE = ("To create a compressed archive, use `tar` with the `-c` (create), `-z` (gzip) and `-f` (file) "
+         "options. Add `-v` to list files as they are added, and `--exclude` to skip build artifacts. ")
+
+
+def code_heavy_answer(sections: int) -> str:
+    """
+    Builds a Markdown answer of roughly 1.5 KB per section, mostly code.
+    """
+    parts = []
+    for i in range(sections):
+        parts.append(f"### Step {i + 1}\n\n{PROSE * 2}\n\n{PYTHON_BLOCK}\n\n{PROSE}\n\n{BASH_BLOCK}\n")
+    return "\n".join(parts)
+
+
+FOLLOW_UP_TEXT = "\n".join(
+    [f"{i}. How do I {verb} a tar archive with {tool}?" for i, (verb, tool) in enumerate(
+        [(v, t) for v in ("extract", "list", "update", "split", "verify", "encrypt")
+         for t in ("gzip", "bzip2", "xz", "zstd")], 1)]
+    + ["These questions cover the most common follow-up tasks."] * 10
+)
+
+
+class PreparedTransport(Transport):
+    """
+    Returns a pre-encoded chat completion body, so only client-side work is measured.
+    """
+
+    name = "prepared"
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def post(self, url, headers, payload, settings, stream=False):
+        return PreparedResponse(self.body)
+
+
+class PreparedResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.body)
+
+
+@pytest.fixture(scope="module", params=[4, 16], ids=["6KB", "24KB"])
+def answer(request):
+    return code_heavy_answer(request.param)
+
+
+def test_format_response(benchmark, answer):
+    questionanswerer = QuestionAnswerer()
+    benchmark(questionanswerer.format_response, answer)
+
+
+def test_format_response_max_words(benchmark, answer):
+    questionanswerer = QuestionAnswerer()
+    benchmark(questionanswerer.format_response, answer, 200)
+
+
+def test_truncate_to_word_limit(benchmark, answer):
+    questionanswerer = QuestionAnswerer()
+    benchmark(questionanswerer.truncate_to_word_limit, answer, 200)
+
+
+def test_follow_up_parsing(benchmark, answer):
+    response = AIResponse(content=FOLLOW_UP_TEXT)
+    questionanswerer = QuestionAnswerer()
+    with patch('howdoai.questionanswerer.call_ai_api', return_value=response):
+        benchmark(questionanswerer.generate_follow_up_questions, "how to create a tar archive", answer, False, None)
+
+
+def test_ai_response_construction(benchmark, answer):
+    usage = {"prompt_tokens": 120, "completion_tokens": 1500, "total_tokens": 1620}
+    benchmark(AIResponse, content=answer, model=config.LOCAL_MODEL, endpoint=config.LOCAL_API_URL,
+              usage=usage, backend="local")
+
+
+def test_response_decoding(benchmark, answer):
+    body = json.dumps({
+        "id": "chatcmpl-123",
+        "object": "chat.completion",
+        "model": config.LOCAL_MODEL,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 120, "completion_tokens": 1500, "total_tokens": 1620},
+    }).encode()
+    backend = LocalBackend()
+    request = CompletionRequest(
+        messages=[{"role": "system", "content": config.SYSTEM_MESSAGE},
+                  {"role": "user", "content": "how to create a tar archive"}],
+        max_tokens=2048, temperature=0.7, settings=config.snapshot(), retries=1)
+    with patch.object(LocalBackend, 'transport', lambda self, settings: PreparedTransport(body)):
+        benchmark(backend.complete, request)
+
+
+def test_markdown_rendering(benchmark, answer):
+    result = {
+        "answer": QuestionAnswerer().format_response(answer),
+        "follow_up_questions": ["How do I extract it?", "How do I list its contents?", "How do I update it?"],
+        "execution_time": "1.00 seconds",
+        "backend": "local",
+    }
+
+    def render():
+        console = Console(file=StringIO(), width=100, force_terminal=True, color_system="truecolor")
+        with patch.object(howdoai, 'console', console):
+            howdoai.print_result("how to create a tar archive", result, False)
+
+    benchmark(render)
@@ -0,0 +1,95 @@
+"""
+Measures interactive latency while a bulk job saturates the request slots.
+
+A stand-in transport answers after a fixed delay. A bulk job keeps every slot busy while
+interactive questions arrive one at a time; the run is repeated with the interactive
+questions sent at bulk priority, which is what every request looked like before priorities.
+
+    python benchmarks/bench_scheduler.py --bulk 400 --interactive 40 --latency 0.02
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from howdoai.api_client import call_ai_api  # noqa: E402
+from howdoai.config import Configuration, config  # noqa: E402
+from howdoai.scheduler import request_scheduler  # noqa: E402
+from howdoai.transports import Transport, register_transport  # noqa: E402
+
+
+class DelayTransport(Transport):
+    name = "delay"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def post(self, url, headers, payload, settings, stream=False):
+        time.sleep(self.latency)
+        response = MagicMock(status_code=200, headers={})
+        response.json.return_value = {"choices": [{"message": {"content": "ok"}}]}
+        return response
+
+
+def run(interactive_priority: str, bulk: int, interactive: int, concurrency: int, latency: float):
+    request_scheduler.reset_stats()
+
+    def bulk_one(i):
+        call_ai_api(f"bulk question {i}", priority="bulk", tenant="batch")
+
+    def interactive_all():
+        latencies = []
+        for i in range(interactive):
+            start = time.perf_counter()
+            call_ai_api(f"interactive question {i}", priority=interactive_priority, tenant="user")
+            latencies.append(time.perf_counter() - start)
+            time.sleep(latency)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency * 4) as pool:
+        bulk_futures = [pool.submit(bulk_one, i) for i in range(bulk)]
+        latencies = sorted(interactive_all())
+        for future in bulk_futures:
+            future.result()
+    wall = time.perf_counter() - start
+    return {
+        "interactive_priority": interactive_priority,
+        "interactive_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "interactive_p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1),
+        "bulk_req_per_s": round(bulk / wall, 1),
+        "bulk_wait_p99_ms": round(request_scheduler.stats()["bulk"]["wait_p99"] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bulk', type=int, default=400, help='Bulk requests')
+    parser.add_argument('--interactive', type=int, default=40, help='Interactive requests, sent one at a time')
+    parser.add_argument('--concurrency', type=int, default=8, help='MAX_CONCURRENT_REQUESTS')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds per request')
+    args = parser.parse_args()
+
+    register_transport("delay", lambda: DelayTransport(args.latency))
+    config.update_from(Configuration.load(overrides={
+        "TRANSPORT": "delay",
+        "MAX_CONCURRENT_REQUESTS": args.concurrency,
+        "SCHEDULER_MAX_QUEUE_DEPTH": args.bulk + args.interactive,
+        "MAX_RETRIES": 1,
+    }, use_default_file=False))
+
+    results = [run(priority, args.bulk, args.interactive, args.concurrency, args.latency)
+               for priority in ("bulk", "interactive")]
+    columns = list(results[0])
+    print("  ".join(f"{c:>20}" for c in columns))
+    for result in results:
+        print("  ".join(f"{str(result[c]):>20}" for c in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Compares the requests (HTTP/1.1) and http2 transports against a local stand-in server.
+
+The stand-in server speaks HTTP/1.1 and HTTP/2 (prior knowledge) on one port and answers
+chat completions after a fixed delay, so the numbers reflect connection handling rather
+than model speed. Requires the benchmark extras: pip install 'httpx[http2]' hypercorn
+
+    python benchmarks/bench_transports.py --requests 500 --concurrency 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from howdoai.api_client import call_ai_api  # noqa: E402
+from howdoai.config import Configuration, config  # noqa: E402
+from howdoai.transports import get_transport  # noqa: E402
+
+
+class StandInServer:
+    """
+    A chat completions endpoint that counts the connections and protocols it sees.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = set()
+        self.http_versions = set()
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}/v1/chat/completions"
+        self._loop = None
+        self._stopped = None
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    async def app(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        self.connections.add(tuple(scope["client"]))
+        self.http_versions.add(scope["http_version"])
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        request = json.loads(body or b"{}")
+        await asyncio.sleep(self.latency)
+        payload = json.dumps({
+            "model": request.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": "tar -cvf archive.tar files/"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 8, "total_tokens": 18},
+        }).encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": payload})
+
+    def _serve(self):
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+
+        hypercorn_config = Config()
+        hypercorn_config.bind = [f"127.0.0.1:{self.port}"]
+        hypercorn_config.accesslog = None
+        hypercorn_config.errorlog = None
+        hypercorn_config.h2_max_concurrent_streams = 1000
+        self._loop = asyncio.new_event_loop()
+        self._stopped = asyncio.Event()
+        self._loop.run_until_complete(serve(self.app, hypercorn_config, shutdown_trigger=self._stopped.wait))
+
+    def start(self):
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("Stand-in server did not start")
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join(5)
+
+    def reset(self):
+        self.connections.clear()
+        self.http_versions.clear()
+
+
+def run(transport: str, server: StandInServer, total: int, concurrency: int, max_connections: int, max_streams: int):
+    config.update_from(Configuration.load(overrides={
+        "LOCAL_API_URL": server.url,
+        "TRANSPORT": transport,
+        "MAX_CONCURRENT_REQUESTS": concurrency,
+        "MAX_RETRIES": 1,
+        "HTTP2_MAX_CONNECTIONS": max_connections,
+        "HTTP2_MAX_STREAMS_PER_CONNECTION": max_streams,
+        "HTTP2_PRIOR_KNOWLEDGE": True,
+    }, use_default_file=False))
+
+    def one(_):
+        start = time.perf_counter()
+        call_ai_api("how to create a tar archive", backend="local")
+        return time.perf_counter() - start
+
+    # Warm up connections so both transports are measured in steady state
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(concurrency)))
+    server.reset()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = sorted(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+    get_transport(transport).close()
+    return {
+        "transport": transport,
+        "requests": total,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "req_per_s": round(total / wall, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1),
+        "connections": len(server.connections),
+        "http_versions": ",".join(sorted(server.http_versions)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300, help='Requests per transport')
+    parser.add_argument('--concurrency', type=int, default=30, help='Concurrent requests')
+    parser.add_argument('--latency', type=float, default=0.05, help='Server-side delay per request in seconds')
+    parser.add_argument('--max-connections', type=int, default=2, help='HTTP2_MAX_CONNECTIONS')
+    parser.add_argument('--max-streams', type=int, default=100, help='HTTP2_MAX_STREAMS_PER_CONNECTION')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    server = StandInServer(args.latency)
+    server.start()
+    try:
+        results = [run(transport, server, args.requests, args.concurrency, args.max_connections, args.max_streams)
+                   for transport in ("requests", "http2")]
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = list(results[0])
+    print("  ".join(f"{c:>13}" for c in columns))
+    for result in results:
+        print("  ".join(f"{str(result[c]):>13}" for c in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Runs the microbenchmarks and flags regressions against the baseline stored in the repo.
+
+Medians are compared, since they are the least sensitive to scheduling noise. A benchmark
+regresses when its median exceeds the baseline median by more than the threshold. Baselines
+are only comparable on similar machines; refresh them with --update after intended changes.
+
+    python benchmarks/compare.py                      # compare, exit 1 on regressions
+    python benchmarks/compare.py --threshold 0.1      # flag anything 10% slower
+    python benchmarks/compare.py --update             # store the current timings as the baseline
+    python benchmarks/compare.py -- -k markdown       # pass extra arguments to pytest
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_FILE = os.path.join(BENCH_DIR, "bench_hotpaths.py")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baselines", "hotpaths.json")
+
+
+def run_benchmarks(pytest_args):
+    """
+    Runs the benchmark file with pytest-benchmark and returns its JSON report.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        report = os.path.join(tmpdir, "report.json")
+        command = [sys.executable, "-m", "pytest", BENCH_FILE, "-q", "-p", "no:cacheprovider",
+                   f"--benchmark-json={report}", "--benchmark-disable-gc", "--benchmark-warmup=on", *pytest_args]
+        completed = subprocess.run(command)
+        if completed.returncode != 0:
+            sys.exit(completed.returncode)
+        with open(report) as f:
+            return json.load(f)
+
+
+def summarize(report):
+    """
+    Reduces a pytest-benchmark report to what the baseline keeps.
+    """
+    machine = report.get("machine_info", {})
+    return {
+        "machine": {
+            "python": machine.get("python_version"),
+            "implementation": machine.get("python_implementation"),
+            "cpu": (machine.get("cpu") or {}).get("brand_raw"),
+            "system": machine.get("system"),
+        },
+        "benchmarks": {
+            bench["name"]: {"median": bench["stats"]["median"], "iqr": bench["stats"]["iqr"]}
+            for bench in report["benchmarks"]
+        },
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Returns one row per benchmark: name, baseline median, current median, change and status.
+    """
+    rows = []
+    for name, stats in sorted(current["benchmarks"].items()):
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            rows.append((name, None, stats["median"], None, "new"))
+            continue
+        change = stats["median"] / base["median"] - 1
+        status = "REGRESSION" if change > threshold else ("faster" if change < -threshold else "ok")
+        rows.append((name, base["median"], stats["median"], change, status))
+    return rows
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Relative slowdown of the median that counts as a regression (default: 0.25)')
+    parser.add_argument('--update', action='store_true', help='Store the current timings as the baseline')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline file')
+    parser.add_argument('pytest_args', nargs='*', help='Extra arguments for pytest, after --')
+    args = parser.parse_args()
+
+    current = summarize(run_benchmarks(args.pytest_args))
+
+    if args.update:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}; create one with --update")
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("machine") != current["machine"]:
+        print(f"Note: the baseline was recorded on {baseline.get('machine')}; timings may not be comparable")
+
+    rows = compare(baseline, current, args.threshold)
+    width = max(len(row[0]) for row in rows)
+    print(f"\n{'benchmark':<{width}}  {'baseline':>10}  {'current':>10}  {'change':>8}  status")
+    for name, base, median, change, status in rows:
+        change_text = "-" if change is None else f"{change:+.1%}"
+        print(f"{name:<{width}}  {format_seconds(base):>10}  {format_seconds(median):>10}  {change_text:>8}  {status}")
+
+    regressions = [row[0] for row in rows if row[4] == "REGRESSION"]
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print(f"\nNo regressions above {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,34 @@
 import sys
 import argparse
-from typing import Optional, Dict, Any, List
+import sqlite3
+from typing import Optional, Dict, Any, List, Union
 import time
+from contextlib import nullcontext
 from dataclasses import dataclass
 
 from rich.console import Console
 from rich.panel import Panel
 from rich.markdown import Markdown
+from rich.syntax import Syntax
 
-from .api_client import AIRequestError, call_ai_api
-from .config import config
-from .progressbarmanager import ProgressBarManager
-from .questionanswerer import QuestionAnswerer
+from .api_client import AIRequestError, acall_ai_api, call_ai_api, resolve_backend_name, stream_ai_api
+from .backends import Backend, CompletionRequest, backend_names, get_backend, register_backend
+from .config import Configuration, ConfigWatcher, config, parse_overrides
+from .output import OUTPUT_FORMATS, write_history, write_result, write_warm_up
+from .profiling import PROFILE_FORMATS, ProfileOptions, ProfileReport, Profiler, network_timer
+from .progressbarmanager import (
+    CallbackProgressManager,
+    NullProgressManager,
+    ProgressBarManager,
+    ProgressReporter,
+    create_progress_manager,
+)
+from .questionanswerer import QuestionAnswerer, extract_code
+from .scheduler import PRIORITIES, RequestScheduler, request_scheduler
+from .routing import ModelRouter, Route, RoutingBackend, get_router, score_query
+from .history import HistoryEntry, HistoryStore, get_history_store
+from .speculation import AnswerCache, SpeculativePrefetcher, get_answer_cache, get_prefetcher
+from .warmup import KeepAlive, WarmupResult, warm_up, warm_up_once
 
 # Constants
 MAX_FOLLOW_UP_QUESTIONS = config.MAX_FOLLOW_UP_QUESTIONS
@@ -20,54 +37,323 @@ MIN_FOLLOW_UP_QUESTIONS = config.MIN_FOLLOW_UP_QUESTIONS
 # Initialize Rich console
 console = Console()    
 
-def main(query: str, max_words: Optional[int] = None, use_groq: bool = False, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+def main(query: Union[str, List[str]], max_words: Optional[int] = None, use_groq: bool = False, max_tokens: Optional[int] = None,
+         quiet: Optional[bool] = True, progress_manager: Optional[ProgressReporter] = None,
+         offline: bool = False, profile: Union[bool, str, ProfileOptions, None] = None,
+         priority: Optional[str] = "interactive", tenant: Optional[str] = None,
+         code_only: bool = False) -> Dict[str, Any]:
     """
     Executes the main logic of the program.
 
     Args:
-        query (str): The query string to be processed.
+        query (Union[str, List[str]]): The query string to be processed, or a list of related queries.
+            A list is answered with as few packed requests as possible and returns one result per query.
+            Follow-up questions are not generated for lists.
         max_words (Optional[int], optional): The maximum number of words in the formatted answer. Defaults to None.
         use_groq (bool, optional): Flag indicating whether to use GROQ for answer generation. Defaults to False.
         max_tokens (Optional[int], optional): The maximum number of tokens for answer generation. Defaults to None.
+        quiet (Optional[bool], optional): Suppress the progress display. Defaults to True, since a library
+            caller's terminal is not howdoai's to draw on. When None, the display is shown if the console is an
+            interactive terminal, as on the command line.
+        progress_manager (Optional[ProgressReporter], optional): A progress reporter to use instead of the
+            automatically selected one, e.g. a CallbackProgressManager when embedding howdoai. Defaults to None.
+        offline (bool, optional): Answer from the best match in the local history without any network call.
+            Defaults to False.
+        profile (Union[bool, str, ProfileOptions, None], optional): Profile the run with cProfile. True writes a
+            text report to stderr, a string writes the report to that file (format inferred from the extension)
+            and a ProfileOptions selects the format and memory tracing. Defaults to None.
+        priority (Optional[str], optional): The request scheduler priority of the API calls: "interactive",
+            "normal" or "bulk". Defaults to "interactive", since someone is waiting for the answer.
+        tenant (Optional[str], optional): Who the query is asked for, for fair queuing between tenants.
+            Defaults to None.
+        code_only (bool, optional): Answer with only the code or command, using a compact prompt, a small
+            token budget (config.CODE_ONLY_MAX_TOKENS unless max_tokens is given) and a stop sequence at the
+            end of the code block. No follow-up questions are generated and the speculative cache is not
+            used. Defaults to False.
 
     Returns:
-        Dict[str, Any]: A dictionary containing the answer, follow-up questions, execution time, and max tokens used (if applicable).
+        Union[Dict[str, Any], List[Dict[str, Any]]]: A dictionary (or, for a list of queries, a list of dictionaries) containing the answer, follow-up questions, execution time, and max tokens used (if applicable).
             - answer (str): The formatted answer.
             - follow_up_questions (List[str]): A list of follow-up questions.
             - execution_time (str): The execution time in seconds.
             - max_tokens (Union[int, str]): The max tokens used or "DEFAULT_MAX_TOKENS" if not specified.
+            - timings (Dict[str, float]): Seconds spent in each stage (answer, format, follow_up) and in total,
+              the part of it spent waiting in the request scheduler (queue_wait), plus warm_up when
+              WARMUP_ON_START warmed up the local endpoint during this call.
+            - usage (Dict[str, int]): Token counts over all API calls made for this query. For a list of
+              queries packed into shared requests, each query's share, with "shared_by" giving the
+              number of queries that shared the request.
+            - model (Optional[str]): The model that produced the answer.
+            - endpoint (Optional[str]): The API endpoint the answer came from.
+            - backend (Optional[str]): The name of the backend that produced the answer.
+            - cached (bool): Whether the answer was served from a cache or the history.
             - error (str): An error message if an exception occurs during execution.
+            - error_type (str): The AIRequestError error type, present together with error.
+            - language (Optional[str]): The language of the code, in code-only mode.
+            - profile (Dict[str, Any]): Wall, CPU and network wait times of the run, when profiling.
     """
+    if profile:
+        with Profiler(ProfileOptions.coerce(profile)) as profiler:
+            result = main(query, max_words, use_groq, max_tokens, quiet, progress_manager, offline,
+                          priority=priority, tenant=tenant, code_only=code_only)
+        for item in (result if isinstance(result, list) else [result]):
+            item["profile"] = profiler.report.summary()
+        return result
+
     start_time = time.time()
+    timings = {"answer": 0.0, "format": 0.0, "follow_up": 0.0}
     
-    with ProgressBarManager(console) as progress_manager:
-        questionanswerer = QuestionAnswerer(progress_manager)
+    if progress_manager is None:
+        progress_manager = create_progress_manager(console, quiet)
+
+    if offline:
+        if isinstance(query, (list, tuple)):
+            return [_offline_result(q, max_words, max_tokens, start_time, code_only) for q in query]
+        return _offline_result(query, max_words, max_tokens, start_time, code_only)
+
+    backend_name = resolve_backend_name(use_groq)
+    if backend_name == RoutingBackend.name:
+        backend_name = config.ROUTING_SMALL_BACKEND
+    if config.WARMUP_ON_START and backend_name == "local":
+        warm_up_result = warm_up_once()
+        if warm_up_result is not None:
+            timings["warm_up"] = warm_up_result.total
+
+    if code_only:
+        if isinstance(query, (list, tuple)):
+            # Packed answers need the full prompt, so code-only questions are asked one by one
+            return [main(q, max_words, use_groq, max_tokens, quiet, progress_manager,
+                         priority=priority, tenant=tenant, code_only=True) for q in query]
+        return _main_code(query, use_groq, max_tokens, progress_manager, start_time, timings, priority, tenant)
+
+    if isinstance(query, (list, tuple)):
+        return _main_many(list(query), max_words, use_groq, max_tokens, progress_manager, start_time,
+                          priority, tenant)
+
+    if config.SPECULATION_ENABLED:
+        cached = get_answer_cache().get(query, use_groq, max_tokens)
+        if cached is not None:
+            result = _cached_result(cached, max_words, use_groq, max_tokens, start_time)
+            _record_history(query, result)
+            return result
+
+    with progress_manager:
+        questionanswerer = QuestionAnswerer(progress_manager, priority, tenant)
         try:
             # Try to get main answer
+            stage_start = time.perf_counter()
             answer, task_id = questionanswerer.generate_answer(query, use_groq, max_tokens)
+            timings["answer"] = time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
             formatted_answer = questionanswerer.process_answer(answer, max_words)
+            timings["format"] = time.perf_counter() - stage_start
             
             # Try to get follow-up questions, but don't fail if they error
+            stage_start = time.perf_counter()
             try:
                 follow_up_questions = questionanswerer.generate_follow_up_questions(query, answer, use_groq, max_tokens)
             except AIRequestError:
                 follow_up_questions = []
+            timings["follow_up"] = time.perf_counter() - stage_start
                     
-            return {
+            result = {
                 "answer": formatted_answer,
                 "follow_up_questions": follow_up_questions,
-                "execution_time": f"{time.time() - start_time:.2f} seconds",
-                "max_tokens": max_tokens if max_tokens else "DEFAULT_MAX_TOKENS"
             }
+            if config.SPECULATION_ENABLED:
+                get_prefetcher().prefetch(follow_up_questions, use_groq, max_tokens)
         except AIRequestError as e:
             # Only return error response if the main answer generation fails
-            return {
+            result = {
                 "answer": f"Error: {str(e)}",
                 "follow_up_questions": [],
-                "execution_time": f"{time.time() - start_time:.2f} seconds",
-                "max_tokens": max_tokens if max_tokens else "DEFAULT_MAX_TOKENS",
-                "error": str(e)
+                "error": str(e),
+                "error_type": e.error_type
+            }
+
+    answer_response = questionanswerer.answer_response
+    timings["queue_wait"] = questionanswerer.queue_wait
+    timings["total"] = time.time() - start_time
+    result.update({
+        "execution_time": f"{timings['total']:.2f} seconds",
+        "max_tokens": max_tokens if max_tokens else "DEFAULT_MAX_TOKENS",
+        "timings": timings,
+        "usage": questionanswerer.usage,
+        "model": answer_response.model if answer_response else None,
+        "endpoint": answer_response.endpoint if answer_response else None,
+        "backend": answer_response.backend if answer_response else None,
+        "cached": False,
+    })
+    _record_history(query, result)
+    return result
+
+def _main_code(query: str, use_groq: bool, max_tokens: Optional[int], progress_manager: ProgressReporter,
+               start_time: float, timings: Dict[str, float], priority: Optional[str] = None,
+               tenant: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Answers a single query with only its code, for main(code_only=True).
+    """
+    with progress_manager:
+        questionanswerer = QuestionAnswerer(progress_manager, priority, tenant)
+        try:
+            stage_start = time.perf_counter()
+            code, language = questionanswerer.generate_code(query, use_groq, max_tokens)
+            timings["answer"] = time.perf_counter() - stage_start
+            result = {"answer": code, "language": language, "follow_up_questions": []}
+        except AIRequestError as e:
+            result = {
+                "answer": f"Error: {str(e)}",
+                "language": None,
+                "follow_up_questions": [],
+                "error": str(e),
+                "error_type": e.error_type
+            }
+
+    answer_response = questionanswerer.answer_response
+    timings["queue_wait"] = questionanswerer.queue_wait
+    timings["total"] = time.time() - start_time
+    result.update({
+        "execution_time": f"{timings['total']:.2f} seconds",
+        "max_tokens": max_tokens if max_tokens else config.CODE_ONLY_MAX_TOKENS,
+        "timings": timings,
+        "usage": questionanswerer.usage,
+        "model": answer_response.model if answer_response else None,
+        "endpoint": answer_response.endpoint if answer_response else None,
+        "backend": answer_response.backend if answer_response else None,
+        "cached": False,
+    })
+    return result
+
+def _record_history(query: str, result: Dict[str, Any]) -> None:
+    """
+    Appends a successful result to the local history, if enabled. Never fails the run.
+    """
+    if not config.HISTORY_ENABLED or "error" in result:
+        return
+    try:
+        get_history_store().add(query, result)
+    except (OSError, sqlite3.Error):
+        pass
+
+def _offline_result(query: str, max_words: Optional[int], max_tokens: Optional[int], start_time: float,
+                    code_only: bool = False) -> Dict[str, Any]:
+    """
+    Builds the result for main from the history entry that best matches the query.
+
+    In code-only mode the result holds only the code of the stored answer.
+    """
+    try:
+        entry = get_history_store().best_match(query)
+    except (OSError, sqlite3.Error) as e:
+        entry = None
+        error = f"History is not available: {str(e)}"
+    else:
+        error = "No matching answer in the history"
+    total_time = time.time() - start_time
+    result = {
+        "execution_time": f"{total_time:.2f} seconds",
+        "max_tokens": max_tokens if max_tokens else config.CODE_ONLY_MAX_TOKENS if code_only else "DEFAULT_MAX_TOKENS",
+        "timings": {"answer": 0.0, "format": 0.0, "follow_up": 0.0, "queue_wait": 0.0, "total": total_time},
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+    if code_only:
+        result["language"] = None
+    if entry is None:
+        result.update({
+            "answer": f"Error: {error}",
+            "follow_up_questions": [],
+            "model": None,
+            "endpoint": None,
+            "backend": None,
+            "cached": False,
+            "error": error,
+            "error_type": "history_miss",
+        })
+        return result
+    result.update({
+        "answer": QuestionAnswerer().truncate_to_word_limit(entry.answer, max_words) if max_words else entry.answer,
+        "follow_up_questions": entry.follow_up_questions,
+        "model": entry.model,
+        "endpoint": entry.endpoint,
+        "backend": entry.backend,
+        "cached": True,
+        "history_query": entry.query,
+    })
+    if code_only:
+        result["answer"], result["language"] = extract_code(entry.answer)
+        result["follow_up_questions"] = []
+    return result
+
+def _cached_result(cached: Dict[str, Any], max_words: Optional[int], use_groq: bool, max_tokens: Optional[int],
+                   start_time: float) -> Dict[str, Any]:
+    """
+    Builds the result for main from an answer found in the answer cache.
+    """
+    stage_start = time.perf_counter()
+    formatted_answer = QuestionAnswerer().format_response(cached["answer"], max_words)
+    format_time = time.perf_counter() - stage_start
+    follow_up_questions = cached.get("follow_up_questions", [])
+    get_prefetcher().prefetch(follow_up_questions, use_groq, max_tokens)
+    total_time = time.time() - start_time
+    return {
+        "answer": formatted_answer,
+        "follow_up_questions": follow_up_questions,
+        "execution_time": f"{total_time:.2f} seconds",
+        "max_tokens": max_tokens if max_tokens else "DEFAULT_MAX_TOKENS",
+        "timings": {"answer": 0.0, "format": format_time, "follow_up": 0.0, "queue_wait": 0.0, "total": total_time},
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        "model": cached.get("model"),
+        "endpoint": cached.get("endpoint"),
+        "backend": cached.get("backend"),
+        "cached": True,
+    }
+
+def _main_many(queries: List[str], max_words: Optional[int], use_groq: bool, max_tokens: Optional[int],
+               progress_manager: ProgressReporter, start_time: float, priority: Optional[str] = None,
+               tenant: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Answers several queries for main, returning one result dictionary per query.
+    """
+    with progress_manager:
+        questionanswerer = QuestionAnswerer(progress_manager, priority, tenant)
+        stage_start = time.perf_counter()
+        responses = questionanswerer.generate_answers(queries, use_groq, max_tokens)
+        answer_time = time.perf_counter() - stage_start
+
+    total_time = time.time() - start_time
+    results = []
+    for response in responses:
+        stage_start = time.perf_counter()
+        if isinstance(response, AIRequestError):
+            result = {
+                "answer": f"Error: {str(response)}",
+                "follow_up_questions": [],
+                "error": str(response),
+                "error_type": response.error_type
+            }
+            response = None
+        else:
+            result = {
+                "answer": questionanswerer.format_response(response.content, max_words),
+                "follow_up_questions": [],
             }
+        result.update({
+            "execution_time": f"{total_time:.2f} seconds",
+            "max_tokens": max_tokens if max_tokens else "DEFAULT_MAX_TOKENS",
+            "timings": {"answer": answer_time, "format": time.perf_counter() - stage_start,
+                        "follow_up": 0.0, "queue_wait": response.queue_wait if response else 0.0,
+                        "total": total_time},
+            "usage": response.usage if response else {},
+            "model": response.model if response else None,
+            "endpoint": response.endpoint if response else None,
+            "backend": response.backend if response else None,
+            "cached": False,
+        })
+        results.append(result)
+    for query, result in zip(queries, results):
+        _record_history(query, result)
+    return results
 
 def main_cli() -> None:
     """
@@ -77,18 +363,207 @@ def main_cli() -> None:
     and prints the result to the console.
     """
     parser = argparse.ArgumentParser(description='Get concise answers to how-to questions.')
-    parser.add_argument('query', nargs='?', help='The question to ask')
+    parser.add_argument('query', nargs='*', help='The question to ask; unquoted words are joined into one question')
+    parser.add_argument('--ask', '-a', action='append', metavar='QUESTION',
+                        help='Another question to answer together with the first (repeatable)')
     parser.add_argument('--max-words', type=int, help='Maximum number of words in the response')
     parser.add_argument('--groq', '-g', action='store_true', help='Use Groq API endpoint')
     parser.add_argument('--max-tokens', '-t', type=int, help='Maximum number of tokens for the API request')
+    parser.add_argument('--quiet', '-q', action='store_true', help='Do not show the progress display')
+    parser.add_argument('--output', '-o', choices=OUTPUT_FORMATS, default='text',
+                        help='Output format: rich text (default), a JSON document or NDJSON lines')
+    parser.add_argument('--backend', '-b', metavar='NAME',
+                        help=f"Backend to use instead of the local endpoint: {', '.join(backend_names())}, "
+                             "or module:attribute for an in-process backend")
+    parser.add_argument('--speculate', action='store_true',
+                        help='Prefetch answers to the top follow-up questions in the background')
+    parser.add_argument('--code-only', '-c', action='store_true',
+                        help='Print only the code or command, using a compact prompt and a small token budget')
+    parser.add_argument('--history', metavar='TERMS', help='Search previous answers instead of asking')
+    parser.add_argument('--offline', action='store_true',
+                        help='Answer from the best match in the history, without any network call')
+    parser.add_argument('--config', metavar='PATH', help='TOML config file (default: ~/.config/howdoai/config.toml)')
+    parser.add_argument('--set', dest='settings', action='append', metavar='NAME=VALUE',
+                        help='Override a config setting, e.g. --set read_timeout=60 (repeatable)')
+    parser.add_argument('--record', metavar='CASSETTE',
+                        help='Record API requests and responses, with their timing, to a cassette file')
+    parser.add_argument('--replay', metavar='CASSETTE', help='Serve API responses from a cassette instead of the network')
+    parser.add_argument('--replay-speed', type=float, metavar='FACTOR',
+                        help='Replay speed relative to the recording; 0 replays as fast as possible (default: 1)')
+    parser.add_argument('--warm-up', action='store_true',
+                        help='Wait for the local model to be ready and prime it first. Without a query, only warm up')
+    parser.add_argument('--keep-alive', nargs='?', type=float, const=0.0, metavar='SECONDS',
+                        help='Afterwards, keep pinging the local model so it stays loaded until interrupted '
+                             '(default interval: keep_alive_interval)')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='PATH',
+                        help='Profile the run and write the report to PATH (stderr if omitted). '
+                             '.prof/.pstats files get pstats data, .folded/.collapsed files get flame graph stacks')
+    parser.add_argument('--profile-memory', action='store_true', help='Also trace memory allocations when profiling')
     
     args = parser.parse_args()
+
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be used together")
+    # Loaded explicitly so an invalid config file or HOWDOAI_* variable is reported as a usage error
+    try:
+        overrides = parse_overrides(args.settings)
+        if args.speculate:
+            overrides["SPECULATION_ENABLED"] = True
+        if args.backend:
+            overrides["BACKEND"] = args.backend
+        if args.warm_up:
+            overrides["WARMUP_ON_START"] = True
+        if args.record or args.replay:
+            overrides["TRANSPORT"] = "record" if args.record else "replay"
+            overrides["CASSETTE_PATH"] = args.record or args.replay
+        if args.replay_speed is not None:
+            overrides["CASSETTE_REPLAY_SPEED"] = args.replay_speed
+        config.update_from(Configuration.load(args.config, overrides))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.history is not None:
+        try:
+            entries = get_history_store().search(args.history)
+        except (OSError, sqlite3.Error) as e:
+            parser.error(f"History is not available: {str(e)}")
+            return
+        if args.output != 'text':
+            write_history(entries, args.output)
+        else:
+            print_history(args.history, entries)
+        return
     
-    if not args.query:
+    questions = ([" ".join(args.query)] if args.query else []) + (args.ask or [])
+    if not questions and (args.warm_up or args.keep_alive is not None):
+        warm_up_result = warm_up()
+        if args.output != 'text':
+            write_warm_up(warm_up_result, args.output)
+        else:
+            print_warm_up(warm_up_result)
+        if not warm_up_result.ready:
+            sys.exit(1)
+        _keep_alive(args.keep_alive)
+        return
+
+    if not questions:
         parser.print_help()
         sys.exit(1)
-    
-    result = main(args.query, args.max_words, args.groq, args.max_tokens)
+    query = questions[0] if len(questions) == 1 else questions
+
+    profiler = nullcontext()
+    if args.profile or args.profile_memory:
+        try:
+            profiler = Profiler(ProfileOptions(output=args.profile, memory=args.profile_memory))
+        except ValueError as e:
+            parser.error(str(e))
+
+    machine_readable = args.output != 'text'
+    # Rendering is profiled too, since formatting Markdown is part of what the user waits for
+    with profiler:
+        result = main(query, args.max_words, args.groq, args.max_tokens,
+                      quiet=True if args.quiet or machine_readable else None, offline=args.offline, code_only=args.code_only)
+
+        if machine_readable:
+            write_result(query, result, args.output, use_groq=args.groq)
+        elif args.code_only:
+            print_code(query, result)
+        else:
+            print_result(query, result, args.groq)
+
+    if config.SPECULATION_ENABLED:
+        # Give background prefetches a chance to land in the cache before exiting
+        prefetcher = get_prefetcher()
+        prefetcher.wait(config.SPECULATION_WAIT)
+        prefetcher.shutdown()
+
+    _keep_alive(args.keep_alive)
+
+def _keep_alive(interval: Optional[float]) -> None:
+    """
+    Pings the local model until interrupted, if an interval (0 for the configured one) was given.
+
+    The config file is watched meanwhile, so edits to it apply to the following pings.
+    """
+    if interval is None:
+        return
+    # Long-running, so pick up changes to the config file without a restart
+    watcher = config.watch()
+    try:
+        with KeepAlive(interval or None):
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+    finally:
+        watcher.stop()
+
+def print_warm_up(result: WarmupResult) -> None:
+    """
+    Prints a warm-up result to the console.
+
+    Args:
+        result (WarmupResult): The warm-up result.
+    """
+    if not result.ready:
+        console.print(Panel(result.error, title="Warm-up failed", border_style="red"))
+        return
+    console.print(f"[bold green]Local model ready[/bold green] in {result.total:.2f} seconds "
+                  f"(endpoint {result.readiness_time:.2f}s, primed request {result.prime_time:.2f}s)")
+    if not result.model_listed:
+        console.print(f"[yellow]{config.LOCAL_MODEL} is not among the listed models[/yellow]")
+
+def print_history(terms: str, entries: List[HistoryEntry]) -> None:
+    """
+    Prints history search results to the console.
+
+    Args:
+        terms (str): The search terms.
+        entries (List[HistoryEntry]): The matching entries, best first.
+    """
+    if not entries:
+        console.print(f"[italic]No answers in the history match: {terms}[/italic]")
+        return
+    for entry in entries:
+        asked = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.created))
+        console.print(Panel(Markdown(entry.answer), title=entry.query, subtitle=asked, border_style="cyan"))
+
+def print_code(query: Union[str, List[str]], result: Union[Dict[str, Any], List[Dict[str, Any]]]) -> None:
+    """
+    Prints code-only results: highlighted on a terminal, as plain text when piped.
+
+    Args:
+        query (Union[str, List[str]]): The question, or list of questions, that was asked.
+        result (Union[Dict[str, Any], List[Dict[str, Any]]]): The result returned by main with code_only.
+    """
+    queries, results = (query, result) if isinstance(result, list) else ([query], [result])
+    for question, question_result in zip(queries, results):
+        if "error" in question_result:
+            Console(stderr=True).print(Panel(question_result["error"], title=f"Error: {question}", border_style="red"))
+        elif console.is_terminal:
+            console.print(Syntax(question_result["answer"], question_result.get("language") or "text",
+                                 background_color="default"))
+        else:
+            print(question_result["answer"])
+
+def print_result(query: Union[str, List[str]], result: Union[Dict[str, Any], List[Dict[str, Any]]], use_groq: bool) -> None:
+    """
+    Prints a result returned by main to the console as rich panels.
+
+    Args:
+        query (Union[str, List[str]]): The question, or list of questions, that was asked.
+        result (Union[Dict[str, Any], List[Dict[str, Any]]]): The result returned by main.
+        use_groq (bool): Whether the Groq API endpoint was used.
+    """
+    if isinstance(result, list):
+        for question, question_result in zip(query, result):
+            if "error" in question_result:
+                console.print(Panel(question_result["error"], title=f"Error: {question}", border_style="red"))
+            else:
+                console.print(Panel(Markdown(question_result["answer"]), title=question, border_style="green"))
+        console.print(f"\n[italic]Execution time: {result[0]['execution_time']}[/italic]")
+        return
     
     if "error" in result:
         console.print(Panel(result["error"], title="Error", border_style="red"))
@@ -101,9 +576,18 @@ def main_cli() -> None:
         console.print(f"{question}")
     
     console.print(f"\n[italic]Execution time: {result['execution_time']}[/italic]")
+    if "warm_up" in result.get("timings", {}):
+        console.print(f"[italic]Including local model warm-up: {result['timings']['warm_up']:.2f} seconds[/italic]")
+    if result.get("history_query"):
+        console.print(f"[italic]Answer from the history, originally asked as: {result['history_query']}[/italic]")
+    elif result.get("cached"):
+        console.print("[italic]Answer served from the speculative cache[/italic]")
     
-    if args.groq:
+    backend = result.get("backend")
+    if use_groq:
         console.print("[bold blue]Using Groq API endpoint[/bold blue]")
+    elif backend and backend != "local":
+        console.print(f"[bold green]Using {backend} backend[/bold green]")
     else:
         console.print("[bold green]Using local API endpoint[/bold green]")
 
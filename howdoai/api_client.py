@@ -1,19 +1,7 @@
-import requests
-import time
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Iterator, Optional, List
 from dataclasses import dataclass, field
 from .config import config
 
-# Define all constants from the config class
-SYSTEM_MESSAGE = config.SYSTEM_MESSAGE
-DEFAULT_MAX_TOKENS = config.DEFAULT_MAX_TOKENS
-DEFAULT_TEMPERATURE = config.DEFAULT_TEMPERATURE
-GROQ_API_KEY = config.GROQ_API_KEY
-LOCAL_MODEL = config.LOCAL_MODEL
-GROQ_MODEL = config.GROQ_MODEL
-LOCAL_API_URL = config.LOCAL_API_URL
-GROQ_API_URL = config.GROQ_API_URL
-
 @dataclass
 class AIResponse:
     """
@@ -21,11 +9,23 @@ class AIResponse:
 
     Attributes:
         content (str): The content of the response.
+        model (Optional[str]): The model that produced the response.
+        endpoint (Optional[str]): The URL the request was sent to.
+        usage (Dict[str, int]): Token counts reported by the API (prompt_tokens, completion_tokens, total_tokens).
+        backend (Optional[str]): The name of the backend that produced the response.
+        queue_wait (float): Seconds the request waited for a slot in the request scheduler.
+
+    The metadata fields are excluded from comparisons, so two responses with the same content compare equal.
     """
     content: str
     follow_up_questions: List[str] = field(default_factory=list)
     task_id: Optional[str] = None
     execution_time: Optional[float] = None
+    model: Optional[str] = field(default=None, compare=False)
+    endpoint: Optional[str] = field(default=None, compare=False)
+    usage: Dict[str, int] = field(default_factory=dict, compare=False)
+    backend: Optional[str] = field(default=None, compare=False)
+    queue_wait: float = field(default=0.0, compare=False)
 
 class AIRequestError(Exception):
     """
@@ -44,7 +44,49 @@ class AIRequestError(Exception):
         self.suggestion = suggestion
         super().__init__(self.message)
 
-def call_ai_api(query: str, use_groq: bool = False, max_tokens: Optional[int] = None, retries: int = 3) -> AIResponse:
+def resolve_backend_name(use_groq: bool = False, backend: Optional[str] = None) -> str:
+    """
+    Returns the name of the backend a call should use.
+
+    An explicit backend wins, then the Groq flag, then the BACKEND setting, then "local".
+    """
+    if backend:
+        return backend
+    if use_groq:
+        return "groq"
+    return config.BACKEND or "local"
+
+
+def _prepare(query: str, use_groq: bool, max_tokens: Optional[int], retries: Optional[int], backend: Optional[str],
+             priority: Optional[str] = None, tenant: Optional[str] = None, system_message: Optional[str] = None,
+             stop: Optional[List[str]] = None):
+    from .backends import CompletionRequest, get_backend
+    from .scheduler import DEFAULT_TENANT, validate_priority
+
+    try:
+        priority = validate_priority(priority)
+    except ValueError as e:
+        raise AIRequestError(str(e), error_type="invalid_request")
+    settings = config.snapshot()
+    request = CompletionRequest(
+        messages=[
+            {"role": "system", "content": system_message if system_message is not None else settings.SYSTEM_MESSAGE},
+            {"role": "user", "content": query if query else ""}
+        ],
+        max_tokens=max_tokens if max_tokens is not None else settings.DEFAULT_MAX_TOKENS,
+        temperature=settings.DEFAULT_TEMPERATURE,
+        settings=settings,
+        retries=retries if retries is not None else settings.MAX_RETRIES,
+        priority=priority,
+        tenant=tenant or DEFAULT_TENANT,
+        stop=stop
+    )
+    return get_backend(resolve_backend_name(use_groq, backend)), request
+
+
+def call_ai_api(query: str, use_groq: bool = False, max_tokens: Optional[int] = None, retries: Optional[int] = None,
+                backend: Optional[str] = None, priority: Optional[str] = None, tenant: Optional[str] = None,
+                system_message: Optional[str] = None, stop: Optional[List[str]] = None) -> AIResponse:
     """
     Calls the AI API with the given query and returns the AI response.
 
@@ -52,7 +94,13 @@ def call_ai_api(query: str, use_groq: bool = False, max_tokens: Optional[int] =
         query (str): The user's query to be sent to the AI API.
         use_groq (bool): Whether to use the Groq API endpoint.
         max_tokens (Optional[int]): Maximum number of tokens for the API request.
-        retries (int): Number of retry attempts for transient failures.
+        retries (Optional[int]): Number of attempts for transient failures. Defaults to config.MAX_RETRIES.
+        backend (Optional[str]): The backend to use instead of the one selected by use_groq and config.BACKEND.
+        priority (Optional[str]): The scheduling priority: "interactive", "normal" (the default) or "bulk".
+        tenant (Optional[str]): Who the request is made for; requests of the same priority are served
+            round-robin between tenants.
+        system_message (Optional[str]): The system message to send instead of config.SYSTEM_MESSAGE.
+        stop (Optional[List[str]]): Sequences that end the completion when generated.
 
     Returns:
         AIResponse: The response from the AI API.
@@ -60,105 +108,33 @@ def call_ai_api(query: str, use_groq: bool = False, max_tokens: Optional[int] =
     Raises:
         AIRequestError: If the API request fails.
     """
-    if use_groq:
-        if not GROQ_API_KEY:
-            raise AIRequestError(
-                "Groq API key is required but not found",
-                error_type="configuration_error",
-                suggestion="Please set the GROQ_API_KEY environment variable"
-            )
-        api_url = GROQ_API_URL
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {GROQ_API_KEY}"
-        }
-        model = GROQ_MODEL
-    else:
-        api_url = LOCAL_API_URL
-        headers = {"Content-Type": "application/json"}
-        model = LOCAL_MODEL
-
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": SYSTEM_MESSAGE},
-            {"role": "user", "content": query if query else ""}
-        ],
-        "temperature": DEFAULT_TEMPERATURE,
-        "max_tokens": max_tokens if max_tokens is not None else DEFAULT_MAX_TOKENS,
-        "stream": False
-    }
-
-    last_exception = None
-    for attempt in range(retries):
-        try:
-            response = requests.post(
-                api_url,
-                headers=headers,
-                json=data,
-                timeout=(3.05, 30)  # Connect timeout, read timeout
-            )
-            
-            # Handle rate limiting
-            if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                time.sleep(retry_after)
-                continue
-                
-            response.raise_for_status()
-            result = response.json()
-            return AIResponse(content=result["choices"][0]["message"]["content"])
-            
-        except requests.exceptions.Timeout as e:
-            last_exception = AIRequestError(
-                "Request timed out",
-                error_type="timeout",
-                suggestion="Please check your internet connection and try again"
-            )
-        except requests.exceptions.ConnectionError as e:
-            last_exception = AIRequestError(
-                "Connection error occurred",
-                error_type="connection_error",
-                suggestion="Please check your internet connection and API endpoint availability"
-            )
-        except requests.exceptions.HTTPError as e:
-            status_code = e.response.status_code if e.response else None
-            error_message = str(e)
-            
-            if status_code == 401:
-                error_message = "Invalid API key"
-                suggestion = "Please verify your API key is correct"
-            elif status_code == 403:
-                error_message = "Access denied"
-                suggestion = "Please check your API permissions"
-            elif status_code == 429:
-                error_message = "Rate limit exceeded"
-                suggestion = "Please wait before making more requests"
-            elif status_code >= 500:
-                error_message = "Server error occurred"
-                suggestion = "Please try again later"
-                
-            last_exception = AIRequestError(
-                f"API request failed: {error_message}",
-                error_type="http_error",
-                status_code=status_code,
-                suggestion=suggestion
-            )
-        except ValueError as e:  # JSON decode error
-            last_exception = AIRequestError(
-                "Invalid response from API",
-                error_type="invalid_response",
-                suggestion="Please check the API endpoint configuration"
-            )
-        except Exception as e:
-            last_exception = AIRequestError(
-                f"Unexpected error: {str(e)}",
-                error_type="unexpected_error"
-            )
-            
-        # Exponential backoff before retry
-        if attempt < retries - 1:
-            time.sleep(2 ** attempt)
-    
-    # If we've exhausted all retries, raise the last exception
-    raise last_exception
\ No newline at end of file
+    selected, request = _prepare(query, use_groq, max_tokens, retries, backend, priority, tenant, system_message, stop)
+    return selected.complete(request)
+
+
+async def acall_ai_api(query: str, use_groq: bool = False, max_tokens: Optional[int] = None,
+                       retries: Optional[int] = None, backend: Optional[str] = None,
+                       priority: Optional[str] = None, tenant: Optional[str] = None,
+                       system_message: Optional[str] = None, stop: Optional[List[str]] = None) -> AIResponse:
+    """
+    Async variant of call_ai_api.
+
+    Raises:
+        AIRequestError: If the API request fails.
+    """
+    selected, request = _prepare(query, use_groq, max_tokens, retries, backend, priority, tenant, system_message, stop)
+    return await selected.acomplete(request)
+
+
+def stream_ai_api(query: str, use_groq: bool = False, max_tokens: Optional[int] = None,
+                  backend: Optional[str] = None, priority: Optional[str] = None,
+                  tenant: Optional[str] = None, system_message: Optional[str] = None,
+                  stop: Optional[List[str]] = None) -> Iterator[str]:
+    """
+    Streaming variant of call_ai_api, yielding the answer in chunks as they are generated.
+
+    Raises:
+        AIRequestError: If the API request fails.
+    """
+    selected, request = _prepare(query, use_groq, max_tokens, 1, backend, priority, tenant, system_message, stop)
+    return selected.stream(request)
@@ -0,0 +1,514 @@
+import asyncio
+import importlib
+import json
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import requests
+
+from .api_client import AIRequestError, AIResponse
+from .config import Configuration
+from .profiling import network_timer
+from .scheduler import DEFAULT_PRIORITY, DEFAULT_TENANT, request_scheduler
+from .transports import Transport, get_transport
+
+
+@dataclass
+class CompletionRequest:
+    """
+    A chat completion request, independent of the backend that serves it.
+
+    Attributes:
+        messages (List[Dict[str, str]]): The chat messages, OpenAI style.
+        max_tokens (int): The maximum number of tokens to generate.
+        temperature (float): The sampling temperature.
+        settings (Configuration): The configuration snapshot to use for this request.
+        retries (int): Number of attempts for transient failures.
+        priority (str): The request scheduler priority: "interactive", "normal" or "bulk".
+        tenant (str): Who the request is made for, for fair queuing in the request scheduler.
+        stop (Optional[List[str]]): Sequences that end the completion when generated. They are not included.
+    """
+    messages: List[Dict[str, str]]
+    max_tokens: int
+    temperature: float
+    settings: Configuration
+    retries: int = 1
+    priority: str = DEFAULT_PRIORITY
+    tenant: str = DEFAULT_TENANT
+    stop: Optional[List[str]] = None
+
+
+class Backend(ABC):
+    """
+    A source of chat completions.
+
+    Subclasses implement complete. The async and streaming methods have default
+    implementations built on it, which backends with native support should override.
+    """
+
+    name = "backend"
+
+    @abstractmethod
+    def complete(self, request: CompletionRequest) -> AIResponse:
+        """
+        Returns the completion for a request.
+
+        Raises:
+            AIRequestError: If the completion fails.
+        """
+
+    async def acomplete(self, request: CompletionRequest) -> AIResponse:
+        """
+        Returns the completion for a request without blocking the event loop.
+        """
+        return await asyncio.to_thread(self.complete, request)
+
+    def stream(self, request: CompletionRequest) -> Iterator[str]:
+        """
+        Yields the completion for a request in chunks as they are generated.
+        """
+        yield self.complete(request).content
+
+
+# Errors a retry cannot fix: requests shed by the scheduler (retrying would only add to the load),
+# configuration problems and requests missing from a replayed cassette
+NON_RETRYABLE_ERRORS = ("overloaded", "configuration_error", "cassette_miss")
+
+
+def map_request_exception(e: Exception) -> AIRequestError:
+    """
+    Converts an exception raised while talking to an HTTP API into an AIRequestError.
+    """
+    if isinstance(e, AIRequestError):
+        return e
+    if isinstance(e, requests.exceptions.Timeout):
+        return AIRequestError(
+            "Request timed out",
+            error_type="timeout",
+            suggestion="Please check your internet connection and try again"
+        )
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return AIRequestError(
+            "Connection error occurred",
+            error_type="connection_error",
+            suggestion="Please check your internet connection and API endpoint availability"
+        )
+    if isinstance(e, requests.exceptions.HTTPError):
+        status_code = e.response.status_code if e.response is not None else None
+        error_message = str(e)
+        suggestion = None
+
+        if status_code == 401:
+            error_message = "Invalid API key"
+            suggestion = "Please verify your API key is correct"
+        elif status_code == 403:
+            error_message = "Access denied"
+            suggestion = "Please check your API permissions"
+        elif status_code == 429:
+            error_message = "Rate limit exceeded"
+            suggestion = "Please wait before making more requests"
+        elif status_code is not None and status_code >= 500:
+            error_message = "Server error occurred"
+            suggestion = "Please try again later"
+
+        return AIRequestError(
+            f"API request failed: {error_message}",
+            error_type="http_error",
+            status_code=status_code,
+            suggestion=suggestion
+        )
+    if isinstance(e, (ValueError, KeyError, IndexError, TypeError)):  # JSON decode error or unexpected shape
+        return AIRequestError(
+            "Invalid response from API",
+            error_type="invalid_response",
+            suggestion="Please check the API endpoint configuration"
+        )
+    return AIRequestError(
+        f"Unexpected error: {str(e)}",
+        error_type="unexpected_error"
+    )
+
+
+class OpenAICompatibleBackend(Backend):
+    """
+    A backend for HTTP endpoints implementing the OpenAI chat completions API.
+
+    Subclasses provide the endpoint, model and headers from the configuration.
+    """
+
+    @abstractmethod
+    def endpoint(self, settings: Configuration) -> str:
+        """
+        Returns the chat completions URL.
+        """
+
+    @abstractmethod
+    def model(self, settings: Configuration) -> str:
+        """
+        Returns the model to request.
+        """
+
+    def headers(self, settings: Configuration) -> Dict[str, str]:
+        return {"Content-Type": "application/json"}
+
+    def transport(self, settings: Configuration) -> Transport:
+        try:
+            return get_transport(settings.TRANSPORT)
+        except ValueError as e:
+            raise AIRequestError(
+                str(e),
+                error_type="configuration_error",
+                suggestion="Please check the TRANSPORT setting"
+            )
+
+    def payload(self, request: CompletionRequest, stream: bool = False) -> Dict[str, Any]:
+        payload = {
+            "model": self.model(request.settings),
+            "messages": request.messages,
+            "temperature": request.temperature,
+            "max_tokens": request.max_tokens,
+            "stream": stream
+        }
+        if request.stop:
+            payload["stop"] = request.stop
+        return payload
+
+    def complete(self, request: CompletionRequest) -> AIResponse:
+        settings = request.settings
+        api_url = self.endpoint(settings)
+        headers = self.headers(settings)
+        data = self.payload(request)
+        transport = self.transport(settings)
+
+        last_exception = None
+        queue_wait = 0.0
+        for attempt in range(request.retries):
+            try:
+                with request_scheduler.slot(request.priority, request.tenant) as ticket:
+                    queue_wait += ticket.wait
+                    started = time.perf_counter()
+                    try:
+                        response = transport.post(api_url, headers, data, settings)
+                    finally:
+                        network_timer.record(time.perf_counter() - started)
+
+                # Handle rate limiting
+                if response.status_code == 429:
+                    last_exception = AIRequestError(
+                        "API request failed: Rate limit exceeded",
+                        error_type="rate_limit",
+                        status_code=429,
+                        suggestion="Please wait before making more requests"
+                    )
+                    if attempt < request.retries - 1:
+                        retry_after = int(response.headers.get('Retry-After', 1))
+                        time.sleep(retry_after)
+                    continue
+
+                response.raise_for_status()
+                result = response.json()
+                return AIResponse(
+                    content=result["choices"][0]["message"]["content"],
+                    model=result.get("model") or data["model"],
+                    endpoint=api_url,
+                    usage=result.get("usage") or {},
+                    backend=self.name,
+                    queue_wait=queue_wait
+                )
+            except AIRequestError as e:
+                if e.error_type in NON_RETRYABLE_ERRORS:
+                    raise
+                last_exception = e
+            except Exception as e:
+                last_exception = map_request_exception(e)
+
+            # Exponential backoff before retry
+            if attempt < request.retries - 1:
+                time.sleep(2 ** attempt)
+
+        # If we've exhausted all retries, raise the last exception
+        raise last_exception
+
+    def stream(self, request: CompletionRequest) -> Iterator[str]:
+        settings = request.settings
+        transport = self.transport(settings)
+        try:
+            with request_scheduler.slot(request.priority, request.tenant):
+                started = time.perf_counter()
+                try:
+                    response = transport.post(self.endpoint(settings), self.headers(settings),
+                                              self.payload(request, stream=True), settings, stream=True)
+                finally:
+                    network_timer.record(time.perf_counter() - started)
+                try:
+                    response.raise_for_status()
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        chunk = line[len("data:"):].strip()
+                        if chunk == "[DONE]":
+                            break
+                        delta = json.loads(chunk)["choices"][0].get("delta", {})
+                        if delta.get("content"):
+                            yield delta["content"]
+                finally:
+                    response.close()
+        except Exception as e:
+            raise map_request_exception(e)
+
+
+class LocalBackend(OpenAICompatibleBackend):
+    """
+    The local OpenAI-compatible server (e.g. LM Studio) at LOCAL_API_URL.
+    """
+
+    name = "local"
+
+    def endpoint(self, settings: Configuration) -> str:
+        return settings.LOCAL_API_URL
+
+    def model(self, settings: Configuration) -> str:
+        return settings.LOCAL_MODEL
+
+
+class GroqBackend(OpenAICompatibleBackend):
+    """
+    The Groq API at GROQ_API_URL, authenticated with GROQ_API_KEY.
+    """
+
+    name = "groq"
+
+    def endpoint(self, settings: Configuration) -> str:
+        return settings.GROQ_API_URL
+
+    def model(self, settings: Configuration) -> str:
+        return settings.GROQ_MODEL
+
+    def headers(self, settings: Configuration) -> Dict[str, str]:
+        if not settings.GROQ_API_KEY:
+            raise AIRequestError(
+                "Groq API key is required but not found",
+                error_type="configuration_error",
+                suggestion="Please set the GROQ_API_KEY environment variable"
+            )
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {settings.GROQ_API_KEY}"
+        }
+
+
+class StubBackend(Backend):
+    """
+    A deterministic in-process backend for tests and benchmarks.
+
+    The answer echoes the last user message, so the same request always gets the same
+    response, and token counts are whitespace-separated word counts.
+    """
+
+    name = "stub"
+
+    def complete(self, request: CompletionRequest) -> AIResponse:
+        prompt = request.messages[-1]["content"] if request.messages else ""
+        words = f"Stub answer to: {prompt}".split()[:max(1, request.max_tokens)]
+        content = " ".join(words)
+        for stop in request.stop or []:
+            content = content.split(stop)[0]
+        prompt_tokens = sum(len(m["content"].split()) for m in request.messages)
+        return AIResponse(
+            content=content,
+            model="stub",
+            endpoint="stub://",
+            usage={"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                   "total_tokens": prompt_tokens + len(words)},
+            backend=self.name
+        )
+
+    def stream(self, request: CompletionRequest) -> Iterator[str]:
+        for i, word in enumerate(self.complete(request).content.split(" ")):
+            yield word if i == 0 else " " + word
+
+
+_STREAM_END = object()
+
+
+class LlamaCppBackend(Backend):
+    """
+    Runs a GGUF model in-process with llama-cpp-python, skipping the HTTP hop entirely.
+
+    The model file is read from LLAMA_CPP_MODEL_PATH and loaded on first use. Requires
+    the optional ``llama-cpp-python`` package.
+    """
+
+    name = "llama-cpp"
+
+    def __init__(self):
+        self._llama = None
+        self._model_path = None
+        self._lock = threading.Lock()
+
+    def _load(self, settings: Configuration):
+        try:
+            from llama_cpp import Llama
+        except ImportError:
+            raise AIRequestError(
+                "The llama-cpp backend requires the llama-cpp-python package",
+                error_type="configuration_error",
+                suggestion="Please install it with: pip install llama-cpp-python"
+            )
+        if not settings.LLAMA_CPP_MODEL_PATH:
+            raise AIRequestError(
+                "No model file configured for the llama-cpp backend",
+                error_type="configuration_error",
+                suggestion="Please set the LLAMA_CPP_MODEL_PATH setting"
+            )
+        if self._llama is None or self._model_path != settings.LLAMA_CPP_MODEL_PATH:
+            try:
+                self._llama = Llama(model_path=settings.LLAMA_CPP_MODEL_PATH, verbose=False)
+            except Exception as e:
+                raise AIRequestError(
+                    f"Cannot load model {settings.LLAMA_CPP_MODEL_PATH}: {str(e)}",
+                    error_type="configuration_error",
+                    suggestion="Please check that LLAMA_CPP_MODEL_PATH is a GGUF model file"
+                )
+            self._model_path = settings.LLAMA_CPP_MODEL_PATH
+        return self._llama
+
+    def complete(self, request: CompletionRequest) -> AIResponse:
+        # llama.cpp contexts are not thread-safe, so requests are served one at a time
+        with self._lock:
+            llama = self._load(request.settings)
+            try:
+                result = llama.create_chat_completion(
+                    messages=request.messages,
+                    max_tokens=request.max_tokens,
+                    temperature=request.temperature,
+                    stop=request.stop
+                )
+            except Exception as e:
+                raise AIRequestError(f"Unexpected error: {str(e)}", error_type="unexpected_error")
+        return AIResponse(
+            content=result["choices"][0]["message"]["content"],
+            model=self._model_path,
+            endpoint=f"llama-cpp://{self._model_path}",
+            usage=result.get("usage") or {},
+            backend=self.name
+        )
+
+    def stream(self, request: CompletionRequest) -> Iterator[str]:
+        # Generation runs in a thread that holds the lock, so a consumer that stops reading
+        # early cannot keep other llama-cpp requests waiting
+        chunks: "queue.Queue[Any]" = queue.Queue()
+        cancelled = threading.Event()
+
+        def generate():
+            try:
+                with self._lock:
+                    llama = self._load(request.settings)
+                    for chunk in llama.create_chat_completion(
+                        messages=request.messages,
+                        max_tokens=request.max_tokens,
+                        temperature=request.temperature,
+                        stop=request.stop,
+                        stream=True
+                    ):
+                        if cancelled.is_set():
+                            break
+                        content = chunk["choices"][0].get("delta", {}).get("content")
+                        if content:
+                            chunks.put(content)
+            except AIRequestError as e:
+                chunks.put(e)
+            except Exception as e:
+                chunks.put(AIRequestError(f"Unexpected error: {str(e)}", error_type="unexpected_error"))
+            finally:
+                chunks.put(_STREAM_END)
+
+        threading.Thread(target=generate, name="howdoai-llama-cpp-stream", daemon=True).start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, AIRequestError):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+
+
+def _routing_backend() -> Backend:
+    from .routing import RoutingBackend
+    return RoutingBackend()
+
+
+_registry: Dict[str, Callable[[], Backend]] = {}
+_instances: Dict[str, Backend] = {}
+_registry_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[], Backend]) -> None:
+    """
+    Registers a backend factory under a name usable with --backend.
+
+    Args:
+        name (str): The backend name.
+        factory (Callable[[], Backend]): Called once, on first use, to create the backend.
+    """
+    with _registry_lock:
+        _registry[name] = factory
+        _instances.pop(name, None)
+
+
+def backend_names() -> List[str]:
+    """
+    Returns the names of the registered backends.
+    """
+    return sorted(_registry)
+
+
+def get_backend(name: str) -> Backend:
+    """
+    Returns the backend with the given name.
+
+    Besides registered names, ``"package.module:attribute"`` loads an in-process backend
+    from any importable module. The attribute may be a Backend subclass, a factory or an
+    instance.
+
+    Raises:
+        AIRequestError: If the backend is unknown or cannot be loaded.
+    """
+    with _registry_lock:
+        if name in _instances:
+            return _instances[name]
+        factory = _registry.get(name)
+        if factory is None and ":" in name:
+            module_name, _, attribute = name.partition(":")
+            try:
+                factory = getattr(importlib.import_module(module_name), attribute)
+            except (ImportError, AttributeError, ValueError) as e:
+                # ValueError covers an empty module name, as in ":attribute"
+                raise AIRequestError(
+                    f"Cannot load backend {name}: {str(e)}",
+                    error_type="configuration_error",
+                    suggestion="Please check the module path given with --backend"
+                )
+        if factory is None:
+            raise AIRequestError(
+                f"Unknown backend: {name}",
+                error_type="configuration_error",
+                suggestion=f"Please use one of: {', '.join(sorted(_registry))}, or module:attribute"
+            )
+        backend = factory if isinstance(factory, Backend) else factory()
+        _instances[name] = backend
+        return backend
+
+
+register_backend(LocalBackend.name, LocalBackend)
+register_backend(GroqBackend.name, GroqBackend)
+register_backend(StubBackend.name, StubBackend)
+register_backend(LlamaCppBackend.name, LlamaCppBackend)
+register_backend("auto", _routing_backend)
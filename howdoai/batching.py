@@ -0,0 +1,103 @@
+import re
+from typing import List
+
+ANSWER_MARKER = "### ANSWER {index}"
+ANSWER_MARKER_PATTERN = re.compile(r"^\s*#{1,6}\s*ANSWER\s+(\d+)\s*:?\s*$", re.MULTILINE | re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimates the number of tokens in a text.
+
+    Uses the common approximation of four characters per token, which is close enough
+    for packing decisions and needs no tokenizer.
+    """
+    return len(text) // 4 + 1
+
+
+def build_batch_prompt(questions: List[str]) -> str:
+    """
+    Builds a single prompt asking for separately delimited answers to several questions.
+
+    Args:
+        questions (List[str]): The questions to answer.
+
+    Returns:
+        str: The combined prompt.
+    """
+    lines = [
+        f"Answer each of the following {len(questions)} questions separately.",
+        "Start each answer with a line containing only its marker, exactly as shown, "
+        "and do not add any text before the first marker:",
+        "",
+    ]
+    for index, question in enumerate(questions, 1):
+        lines.append(f"{ANSWER_MARKER.format(index=index)}")
+        lines.append(f"Question: {question}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def pack_questions(questions: List[str], answer_tokens: int, token_budget: int, max_questions: int) -> List[List[int]]:
+    """
+    Groups questions into batches that fit within a token budget.
+
+    Questions are packed in order. A batch is closed when adding the next question would
+    make its estimated prompt plus the completion allowance (answer_tokens per question)
+    exceed the budget, or when it holds max_questions questions. A question that does not
+    fit the budget on its own gets a batch of its own.
+
+    Args:
+        questions (List[str]): The questions to pack.
+        answer_tokens (int): The completion tokens to allow for each answer.
+        token_budget (int): The maximum estimated tokens (prompt and completion) per request.
+        max_questions (int): The maximum number of questions per request.
+
+    Returns:
+        List[List[int]]: The indices of the questions in each batch.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for index, question in enumerate(questions):
+        cost = estimate_tokens(question) + answer_tokens
+        if current and (current_tokens + cost > token_budget or len(current) >= max(1, max_questions)):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(index)
+        current_tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_batch_answer(text: str, count: int) -> List[str]:
+    """
+    Splits a combined answer into one answer per question.
+
+    Args:
+        text (str): The response to a prompt built by build_batch_prompt.
+        count (int): The number of questions in the prompt.
+
+    Returns:
+        List[str]: The answers, in question order.
+
+    Raises:
+        ValueError: If the markers are missing, duplicated, out of range, or an answer is empty.
+    """
+    matches = list(ANSWER_MARKER_PATTERN.finditer(text))
+    answers = {}
+    for position, match in enumerate(matches):
+        index = int(match.group(1))
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(text)
+        if index < 1 or index > count or index in answers:
+            raise ValueError(f"Unexpected answer marker {index}")
+        answer = text[match.end():end].strip()
+        answer = re.sub(r"^Question:.*\n?", "", answer).strip()
+        if not answer:
+            raise ValueError(f"Empty answer for question {index}")
+        answers[index] = answer
+    if len(answers) != count:
+        raise ValueError(f"Expected {count} answers, found {len(answers)}")
+    return [answers[index] for index in range(1, count + 1)]
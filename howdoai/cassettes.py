@@ -0,0 +1,252 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .api_client import AIRequestError
+from .config import Configuration
+from .transports import Transport, get_transport
+
+CASSETTE_VERSION = 1
+REDACTED_HEADERS = ("authorization", "api-key", "x-api-key")
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def request_key(url: str, payload: Dict[str, Any]) -> str:
+    """
+    Returns the key a request is matched on when replaying: its URL and JSON body.
+    """
+    return url + " " + json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+class Cassette:
+    """
+    Recorded HTTP interactions, stored as JSON lines (gzip-compressed if the path ends in .gz).
+
+    The first line is a header; every following line is one interaction holding the request
+    (URL, redacted headers, JSON body), the response status, headers and body, the time to
+    the response headers and, for streamed responses, every line with the delay before it.
+
+    Args:
+        path (str): The cassette file.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._interactions: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._positions: Dict[str, int] = defaultdict(int)
+
+    def append(self, interaction: Dict[str, Any]) -> None:
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with _open(self.path, "a") as f:
+                if new:
+                    f.write(json.dumps({"howdoai_cassette": CASSETTE_VERSION}) + "\n")
+                f.write(json.dumps(interaction, separators=(",", ":")) + "\n")
+
+    def interactions(self) -> List[Dict[str, Any]]:
+        """
+        Returns all recorded interactions in order.
+        """
+        if not os.path.exists(self.path):
+            return []
+        with _open(self.path, "r") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return [record for record in records if "howdoai_cassette" not in record]
+
+    def next_for(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the next recorded interaction for a request key, cycling through repeats.
+        """
+        with self._lock:
+            if self._interactions is None:
+                self._interactions = defaultdict(list)
+                for interaction in self.interactions():
+                    request = interaction["request"]
+                    self._interactions[request_key(request["url"], request["body"])].append(interaction)
+            recorded = self._interactions.get(key)
+            if not recorded:
+                return None
+            interaction = recorded[self._positions[key] % len(recorded)]
+            self._positions[key] += 1
+            return interaction
+
+
+class _CassetteTransport(Transport):
+    """
+    Keeps one Cassette per CASSETTE_PATH.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cassettes: Dict[str, Cassette] = {}
+
+    def cassette(self, settings: Configuration) -> Cassette:
+        if not settings.CASSETTE_PATH:
+            raise AIRequestError(
+                "No cassette file configured",
+                error_type="configuration_error",
+                suggestion="Please set CASSETTE_PATH, e.g. with --record or --replay"
+            )
+        with self._lock:
+            if settings.CASSETTE_PATH not in self._cassettes:
+                self._cassettes[settings.CASSETTE_PATH] = Cassette(settings.CASSETTE_PATH)
+            return self._cassettes[settings.CASSETTE_PATH]
+
+
+class _RecordingResponse:
+    """
+    Passes a streamed response through, recording every line and the delay before it.
+    """
+
+    def __init__(self, response, on_close):
+        self._response = response
+        self._on_close = on_close
+        self._chunks: List[Tuple[float, str]] = []
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    def json(self):
+        return self._response.json()
+
+    def raise_for_status(self):
+        return self._response.raise_for_status()
+
+    def iter_lines(self, decode_unicode: bool = True):
+        last = time.perf_counter()
+        for line in self._response.iter_lines(decode_unicode=decode_unicode):
+            now = time.perf_counter()
+            self._chunks.append((round(now - last, 6), line if isinstance(line, str) else line.decode("utf-8")))
+            last = now
+            yield line
+
+    def close(self):
+        try:
+            self._response.close()
+        finally:
+            if self._on_close is not None:
+                self._on_close(self._chunks)
+                self._on_close = None
+
+
+class RecordingTransport(_CassetteTransport):
+    """
+    Sends requests with the CASSETTE_RECORD_TRANSPORT transport and appends every
+    interaction, with its timing, to the cassette at CASSETTE_PATH.
+    """
+
+    name = "record"
+
+    def post(self, url, headers, payload, settings, stream=False):
+        if settings.CASSETTE_RECORD_TRANSPORT in ("record", "replay"):
+            raise AIRequestError(
+                f"Cannot record through the {settings.CASSETTE_RECORD_TRANSPORT} transport",
+                error_type="configuration_error",
+                suggestion="Please set CASSETTE_RECORD_TRANSPORT to a network transport such as requests"
+            )
+        cassette = self.cassette(settings)
+        inner = get_transport(settings.CASSETTE_RECORD_TRANSPORT)
+        started = time.perf_counter()
+        response = inner.post(url, headers, payload, settings, stream=stream)
+        latency = time.perf_counter() - started
+        interaction = {
+            "request": {
+                "url": url,
+                "headers": {name: ("REDACTED" if name.lower() in REDACTED_HEADERS else value)
+                            for name, value in headers.items()},
+                "body": payload,
+                "stream": stream,
+            },
+            "response": {
+                "status": response.status_code,
+                "headers": dict(response.headers),
+                "latency": round(latency, 6),
+            },
+        }
+        if stream:
+            def on_close(chunks):
+                interaction["response"]["chunks"] = chunks
+                cassette.append(interaction)
+            return _RecordingResponse(response, on_close)
+        try:
+            interaction["response"]["body"] = response.json()
+        except ValueError:
+            interaction["response"]["body"] = None
+        cassette.append(interaction)
+        return response
+
+
+class ReplayResponse:
+    """
+    A recorded response with the parts of the requests.Response interface the backends use.
+
+    Args:
+        recorded (Dict[str, Any]): The recorded response.
+        speed (float): Replay speed relative to the recording; 0 replays without delays.
+    """
+
+    def __init__(self, recorded: Dict[str, Any], speed: float):
+        self._recorded = recorded
+        self._speed = speed
+        self.status_code = recorded["status"]
+        self.headers = CaseInsensitiveDict(recorded.get("headers") or {})
+
+    def json(self):
+        if self._recorded.get("body") is None:
+            raise ValueError("The recorded response has no JSON body")
+        return self._recorded["body"]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error (replayed)", response=self)
+
+    def iter_lines(self, decode_unicode: bool = True) -> Iterator[str]:
+        for delay, line in self._recorded.get("chunks", []):
+            _pause(delay, self._speed)
+            yield line
+
+    def close(self):
+        pass
+
+
+def _pause(seconds: float, speed: float) -> None:
+    if speed > 0 and seconds > 0:
+        time.sleep(seconds / speed)
+
+
+class ReplayTransport(_CassetteTransport):
+    """
+    Serves responses from the cassette at CASSETTE_PATH instead of the network.
+
+    Requests are matched on their URL and JSON body; repeated requests get the recorded
+    responses in turn, starting over when they run out. Responses are delayed by the recorded
+    latencies divided by CASSETTE_REPLAY_SPEED, or not at all when it is 0.
+    """
+
+    name = "replay"
+
+    def post(self, url, headers, payload, settings, stream=False):
+        cassette = self.cassette(settings)
+        interaction = cassette.next_for(request_key(url, payload))
+        if interaction is None:
+            raise AIRequestError(
+                f"No recorded response for this request in {cassette.path}",
+                error_type="cassette_miss",
+                suggestion="Please record it first with --record"
+            )
+        recorded = interaction["response"]
+        _pause(recorded.get("latency", 0.0), settings.CASSETTE_REPLAY_SPEED)
+        return ReplayResponse(recorded, settings.CASSETTE_REPLAY_SPEED)
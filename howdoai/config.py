@@ -1,19 +1,42 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, replace
+import logging
 import os
+import threading
+from typing import Any, Dict, Mapping, Optional
+
 from dotenv import load_dotenv
 
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+ENV_PREFIX = "HOWDOAI_"
+DEFAULT_CONFIG_FILE = os.path.join("~", ".config", "howdoai", "config.toml")
+
 
 @dataclass
 class Configuration:
     """
     Represents the configuration settings for the AI assistant.
 
+    Settings are layered: the class defaults below, then a TOML config file, then
+    environment variables (``HOWDOAI_<NAME>``, plus the plain ``GROQ_API_KEY``), then
+    overrides given on the command line. Later layers win.
+
     Attributes:
         LOCAL_API_URL (str): The URL for the local API.
         GROQ_API_URL (str): The URL for the GROQ API.
         SYSTEM_MESSAGE (str): The system message for the AI assistant.
+        CODE_ONLY_SYSTEM_MESSAGE (str): The compact system message used in code-only mode.
+        CODE_ONLY_MAX_TOKENS (int): The default maximum number of tokens in code-only mode.
         DEFAULT_MAX_TOKENS (int): The default maximum number of tokens.
         DEFAULT_TEMPERATURE (float): The default temperature value.
         MAX_FOLLOW_UP_QUESTIONS (int): The maximum number of follow-up questions.
@@ -21,6 +44,51 @@ class Configuration:
         GROQ_API_KEY (str): The GROQ API key.
         LOCAL_MODEL (str): The local model for the AI assistant.
         GROQ_MODEL (str): The GROQ model for the AI assistant.
+        CONNECT_TIMEOUT (float): Seconds to wait for a connection to the API.
+        READ_TIMEOUT (float): Seconds to wait for the API to respond.
+        MAX_RETRIES (int): Number of attempts for transient API failures.
+        MAX_CONCURRENT_REQUESTS (int): Maximum number of API requests in flight at once.
+        SCHEDULER_RESERVED_INTERACTIVE_SLOTS (int): Request slots normal and bulk requests leave free for
+            interactive ones.
+        SCHEDULER_MAX_QUEUE_DEPTH (int): Maximum number of requests waiting for a slot before requests are shed.
+        BACKEND (str): The backend to use when Groq is not requested: a registered name such as "local",
+            "stub" or "llama-cpp", or "module:attribute". Empty means "local".
+        LLAMA_CPP_MODEL_PATH (str): The GGUF model file for the in-process llama-cpp backend.
+        ROUTING_SMALL_BACKEND (str): The backend the "auto" backend sends simple queries to.
+        ROUTING_LARGE_BACKEND (str): The backend the "auto" backend sends hard queries to.
+        ROUTING_THRESHOLD (float): Complexity score (0 to 1) from which queries go to the large backend.
+        ROUTING_LONG_QUERY_WORDS (int): Query length, in words, that counts as fully long when scoring.
+        ROUTING_HARD_KEYWORDS (str): Comma-separated words that make a query score as harder.
+        ROUTING_SIMPLE_KEYWORDS (str): Comma-separated words that make a query score as simpler.
+        ROUTING_MIN_SAMPLES (int): Outcomes needed for a score bucket before they change the routing.
+        ROUTING_MAX_FAILURE_RATE (float): Failure rate of the small backend in a score bucket above which
+            its queries go to the large backend.
+        ROUTING_STATS_PATH (str): File for the recorded routing outcomes. Empty to keep them in memory.
+        TRANSPORT (str): How HTTP backends send requests: "requests" (HTTP/1.1), "http2", or "record" and
+            "replay" to record interactions to and serve them from the cassette at CASSETTE_PATH.
+        HTTP2_MAX_CONNECTIONS (int): Number of connections the http2 transport opens.
+        HTTP2_MAX_STREAMS_PER_CONNECTION (int): Maximum concurrent requests per http2 connection.
+        HTTP2_PRIOR_KNOWLEDGE (bool): Speak HTTP/2 to plain http:// endpoints without negotiation.
+        CASSETTE_PATH (str): The cassette file used by the record and replay transports.
+        CASSETTE_RECORD_TRANSPORT (str): The transport the record transport sends requests with.
+        CASSETTE_REPLAY_SPEED (float): Replay speed relative to the recording; 0 replays as fast as possible.
+        BATCH_TOKEN_BUDGET (int): Estimated tokens (prompt and completion) allowed per packed multi-question request.
+        BATCH_MAX_QUESTIONS (int): Maximum number of questions packed into one request.
+        CACHE_PATH (str): File for the answer cache shared between runs. Empty for an in-memory cache.
+        CACHE_TTL (float): Seconds a cached answer stays valid.
+        CACHE_MAX_ENTRIES (int): Maximum number of cached answers.
+        SPECULATION_ENABLED (bool): Whether to prefetch answers to follow-up questions in the background.
+        SPECULATION_TOP_N (int): How many follow-up questions to prefetch per answer.
+        SPECULATION_MAX_INFLIGHT (int): Maximum number of follow-up questions prefetched at once.
+        SPECULATION_BUDGET (int): Maximum number of API requests speculation may make per process.
+        SPECULATION_WAIT (float): Seconds the CLI waits for prefetching to finish before exiting.
+        HISTORY_ENABLED (bool): Whether answered questions are recorded in the local history.
+        HISTORY_PATH (str): The SQLite database holding the history.
+        HISTORY_MIN_OVERLAP (float): The fraction of a question's words, stop words aside, a history
+            entry must contain to answer it offline.
+        WARMUP_ON_START (bool): Whether to wait for the local endpoint and prime it before the first question.
+        WARMUP_TIMEOUT (float): Seconds to wait for the local endpoint to list its models.
+        KEEP_ALIVE_INTERVAL (float): Seconds between keep-alive pings, kept below common idle unload timeouts.
     """
 
     LOCAL_API_URL: str = "http://localhost:1234/v1/chat/completions"
@@ -38,18 +106,317 @@ def hello_world():\
     print('Hello, World!')\
 ```\
 "
+    CODE_ONLY_SYSTEM_MESSAGE: str = ("Reply with only the command or code that answers the question, as a single "
+                                     "fenced code block starting with ``` and the language name. No explanation.")
+    CODE_ONLY_MAX_TOKENS: int = 96
     DEFAULT_MAX_TOKENS: int = 150
     DEFAULT_TEMPERATURE: float = 0.7
     MAX_FOLLOW_UP_QUESTIONS: int = 5
     MIN_FOLLOW_UP_QUESTIONS: int = 3
-    GROQ_API_KEY: str = os.getenv("GROQ_API_KEY")
+    GROQ_API_KEY: str = None
     LOCAL_MODEL: str = "lmstudio-community/Meta-Llama-3-8B-Instruct-GGUF"
     GROQ_MODEL: str = "llama3-70b-8192"
+    CONNECT_TIMEOUT: float = 3.05
+    READ_TIMEOUT: float = 30.0
+    MAX_RETRIES: int = 3
+    MAX_CONCURRENT_REQUESTS: int = 8
+    SCHEDULER_RESERVED_INTERACTIVE_SLOTS: int = 1
+    SCHEDULER_MAX_QUEUE_DEPTH: int = 256
+    BACKEND: str = ""
+    LLAMA_CPP_MODEL_PATH: str = ""
+    ROUTING_SMALL_BACKEND: str = "local"
+    ROUTING_LARGE_BACKEND: str = "groq"
+    ROUTING_THRESHOLD: float = 0.5
+    ROUTING_LONG_QUERY_WORDS: int = 40
+    ROUTING_HARD_KEYWORDS: str = ("why,explain,difference,compare,optimize,debug,design,architecture,concurrency,"
+                                  "thread,race condition,deadlock,memory leak,security,algorithm,complexity,"
+                                  "refactor,migrate,trade-off,performance,scale,fix")
+    ROUTING_SIMPLE_KEYWORDS: str = "command,shortcut,flag,syntax,install,list,rename,delete,copy,print"
+    ROUTING_MIN_SAMPLES: int = 5
+    ROUTING_MAX_FAILURE_RATE: float = 0.2
+    ROUTING_STATS_PATH: str = os.path.join("~", ".cache", "howdoai", "routing.json")
+    TRANSPORT: str = "requests"
+    HTTP2_MAX_CONNECTIONS: int = 2
+    HTTP2_MAX_STREAMS_PER_CONNECTION: int = 100
+    HTTP2_PRIOR_KNOWLEDGE: bool = False
+    CASSETTE_PATH: str = ""
+    CASSETTE_RECORD_TRANSPORT: str = "requests"
+    CASSETTE_REPLAY_SPEED: float = 1.0
+    BATCH_TOKEN_BUDGET: int = 4096
+    BATCH_MAX_QUESTIONS: int = 8
+    CACHE_PATH: str = os.path.join("~", ".cache", "howdoai", "answers.json")
+    CACHE_TTL: float = 900.0
+    CACHE_MAX_ENTRIES: int = 256
+    SPECULATION_ENABLED: bool = False
+    SPECULATION_TOP_N: int = 2
+    SPECULATION_MAX_INFLIGHT: int = 1
+    SPECULATION_BUDGET: int = 6
+    SPECULATION_WAIT: float = 30.0
+    HISTORY_ENABLED: bool = True
+    HISTORY_PATH: str = os.path.join("~", ".local", "share", "howdoai", "history.db")
+    HISTORY_MIN_OVERLAP: float = 0.5
+    WARMUP_ON_START: bool = False
+    WARMUP_TIMEOUT: float = 60.0
+    KEEP_ALIVE_INTERVAL: float = 240.0
+
+    def __post_init__(self):
+        self._lock = threading.RLock()
+        self._config_file = None
+        self._overrides = {}
 
     @classmethod
     def load_from_env(cls):
-        # Load configuration from environment variables or config files
-        return cls()
+        """
+        Loads the configuration from the defaults and environment variables only.
+        """
+        return cls.load(config_file=None, use_default_file=False)
+
+    @classmethod
+    def load(cls, config_file: Optional[str] = None, overrides: Optional[Mapping[str, Any]] = None,
+             environ: Optional[Mapping[str, str]] = None, use_default_file: bool = True,
+             strict: bool = True) -> "Configuration":
+        """
+        Builds a configuration from all layers.
+
+        Args:
+            config_file (Optional[str]): Path to a TOML config file. When None, ``HOWDOAI_CONFIG`` or
+                ``~/.config/howdoai/config.toml`` is used if present (unless use_default_file is False).
+            overrides (Optional[Mapping[str, Any]]): Values from the command line, applied last.
+            environ (Optional[Mapping[str, str]]): The environment to read. Defaults to os.environ.
+            use_default_file (bool): Whether to look for a config file when none is given.
+            strict (bool): Whether invalid settings raise. When False, an invalid setting or an
+                unreadable config file is logged and skipped, and the other settings still apply.
+
+        Returns:
+            Configuration: The merged configuration.
+
+        Raises:
+            ValueError: If a setting is unknown or cannot be converted to its type.
+            OSError: If the config file cannot be read.
+        """
+        environ = os.environ if environ is None else environ
+        if config_file is None and use_default_file:
+            config_file = environ.get(ENV_PREFIX + "CONFIG")
+            if config_file is None and os.path.exists(os.path.expanduser(DEFAULT_CONFIG_FILE)):
+                config_file = DEFAULT_CONFIG_FILE
+
+        values = {}
+        if config_file:
+            try:
+                raw_values = read_config_file(config_file)
+            except (OSError, ValueError) as e:
+                if strict:
+                    raise
+                logger.warning("Ignoring the config file: %s", e)
+                raw_values = {}
+            values.update(cls._coerce_all(raw_values, config_file, strict))
+        values.update(cls._from_environ(environ, strict))
+        if overrides:
+            values.update(cls._coerce_all(overrides, "command line", strict))
+
+        instance = cls(**values)
+        instance._config_file = config_file
+        instance._overrides = dict(overrides or {})
+        return instance
+
+    @classmethod
+    def _from_environ(cls, environ: Mapping[str, str], strict: bool = True) -> Dict[str, Any]:
+        values = {}
+        if environ.get("GROQ_API_KEY"):
+            values["GROQ_API_KEY"] = environ["GROQ_API_KEY"]
+        for f in fields(cls):
+            raw = environ.get(ENV_PREFIX + f.name)
+            if raw is not None:
+                values.update(cls._coerce_all({f.name: raw}, ENV_PREFIX + f.name, strict))
+        return values
+
+    @classmethod
+    def _coerce_all(cls, raw_values: Mapping[str, Any], source: str, strict: bool = True) -> Dict[str, Any]:
+        values = {}
+        for key, value in raw_values.items():
+            try:
+                values[key.upper()] = cls._coerce(key.upper(), value, source)
+            except ValueError as e:
+                if strict:
+                    raise
+                logger.warning("Ignoring a setting: %s", e)
+        return values
+
+    @classmethod
+    def _coerce(cls, name: str, value: Any, source: str) -> Any:
+        types = {f.name: f.type for f in fields(cls)}
+        if name not in types:
+            raise ValueError(f"Unknown setting {name!r} in {source}")
+        expected = types[name]
+        if value is None or isinstance(value, expected) and not (expected is int and isinstance(value, bool)):
+            return value
+        try:
+            if expected is bool:
+                if isinstance(value, str) and value.strip().lower() in ("1", "true", "yes", "on"):
+                    return True
+                if isinstance(value, str) and value.strip().lower() in ("0", "false", "no", "off", ""):
+                    return False
+                raise ValueError(value)
+            if expected in (int, float) and isinstance(value, bool):
+                raise ValueError(value)
+            return expected(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value {value!r} for {name} in {source}: expected {expected.__name__}")
+
+    def snapshot(self) -> "Configuration":
+        """
+        Returns a consistent copy of the current settings.
+
+        Callers that read several settings for one request should use a snapshot, so a
+        concurrent reload cannot hand them a mix of old and new values.
+        """
+        with self._lock:
+            copy = replace(self)
+            copy._config_file = self._config_file
+            copy._overrides = dict(self._overrides)
+            return copy
+
+    def update_from(self, other: "Configuration") -> None:
+        """
+        Replaces all settings in place with those of another configuration.
+
+        Modules hold a reference to the shared ``config`` object, so updating it in place
+        makes new values visible everywhere without a restart.
+        """
+        with self._lock:
+            for f in fields(self):
+                setattr(self, f.name, getattr(other, f.name))
+            self._config_file = other._config_file
+            self._overrides = dict(other._overrides)
+
+    def reload(self) -> None:
+        """
+        Re-reads the config file and environment, keeping the command line overrides.
+
+        Raises:
+            ValueError: If the new settings are invalid. The current settings are kept.
+        """
+        self.update_from(self.load(self._config_file, self._overrides, use_default_file=False))
+
+    def watch(self, interval: float = 2.0) -> "ConfigWatcher":
+        """
+        Starts reloading the configuration whenever its config file changes.
+
+        Args:
+            interval (float): Seconds between checks of the file's modification time.
+
+        Returns:
+            ConfigWatcher: The running watcher. Call its stop method to end watching.
+        """
+        watcher = ConfigWatcher(self, interval)
+        watcher.start()
+        return watcher
+
+
+class ConfigWatcher:
+    """
+    Polls a configuration's TOML file and reloads the configuration when it changes.
+
+    Intended for long-running processes. Requests already in flight keep the settings
+    they started with; only new requests see the reloaded values. If the changed file
+    is invalid the previous settings stay in effect.
+
+    Args:
+        configuration (Configuration): The configuration to keep up to date.
+        interval (float): Seconds between checks.
+    """
+
+    def __init__(self, configuration: Configuration, interval: float = 2.0):
+        self.configuration = configuration
+        self.interval = interval
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="howdoai-config-watcher", daemon=True)
+        self._mtime = self._current_mtime()
+
+    def _current_mtime(self) -> Optional[float]:
+        path = self.configuration._config_file
+        if not path:
+            return None
+        try:
+            return os.stat(os.path.expanduser(path)).st_mtime
+        except OSError:
+            return None
+
+    def check(self) -> bool:
+        """
+        Reloads the configuration if the file changed since the last check.
+
+        Returns:
+            bool: True if the configuration was reloaded.
+        """
+        mtime = self._current_mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            self.configuration.reload()
+        except (OSError, ValueError) as e:
+            self.last_error = e
+            logger.warning("Keeping previous configuration, reload failed: %s", e)
+            return False
+        self.last_error = None
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def read_config_file(path: str) -> Dict[str, Any]:
+    """
+    Reads settings from a TOML file.
+
+    Keys are setting names in any case, e.g. ``read_timeout = 60``. Settings may also be
+    placed under a ``[howdoai]`` table.
+
+    Raises:
+        ValueError: If TOML support is unavailable or the file cannot be parsed.
+        OSError: If the file cannot be read.
+    """
+    if tomllib is None:
+        raise ValueError("Reading config files requires Python 3.11+ or the 'tomli' package")
+    with open(os.path.expanduser(path), "rb") as f:
+        try:
+            data = tomllib.load(f)
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError(f"Invalid config file {path}: {e}")
+    return data.get("howdoai", data)
+
+
+def parse_overrides(assignments) -> Dict[str, str]:
+    """
+    Parses ``NAME=VALUE`` strings given on the command line.
+
+    Raises:
+        ValueError: If an assignment has no ``=``.
+    """
+    overrides = {}
+    for assignment in assignments or []:
+        name, sep, value = assignment.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid setting {assignment!r}: expected NAME=VALUE")
+        overrides[name.strip().upper()] = value
+    return overrides
+
+
+def _load_at_import() -> Configuration:
+    # A bad HOWDOAI_* variable or config file must not make importing howdoai fail, nor drop
+    # the valid settings; the CLI loads the configuration again and reports the error properly
+    return Configuration.load(strict=False)
 
 
-config = Configuration.load_from_env()
+config = _load_at_import()
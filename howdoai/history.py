@@ -0,0 +1,229 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .config import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    query TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    follow_up_questions TEXT NOT NULL,
+    model TEXT,
+    endpoint TEXT,
+    backend TEXT,
+    timings TEXT NOT NULL,
+    usage TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    query, answer, content='entries', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts(rowid, query, answer) VALUES (new.id, new.query, new.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, query, answer) VALUES ('delete', old.id, old.query, old.answer);
+END;
+"""
+
+
+@dataclass
+class HistoryEntry:
+    """
+    A question and answer recorded in the history.
+
+    Attributes:
+        id (int): The entry's row id.
+        created (float): When the entry was recorded, as a Unix timestamp.
+        query (str): The question.
+        answer (str): The formatted answer.
+        follow_up_questions (List[str]): The follow-up questions generated for the answer.
+        model (Optional[str]): The model that produced the answer.
+        endpoint (Optional[str]): The endpoint the answer came from.
+        backend (Optional[str]): The backend that produced the answer.
+        timings (Dict[str, float]): The stage timings of the original run.
+        usage (Dict[str, int]): The token counts of the original run.
+    """
+    id: int
+    created: float
+    query: str
+    answer: str
+    follow_up_questions: List[str] = field(default_factory=list)
+    model: Optional[str] = None
+    endpoint: Optional[str] = None
+    backend: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+# Words that say nothing about what a question is about, ignored when matching questions
+STOP_WORDS = frozenset("""
+    a an and are as at be by can could do does for from get how i if in into is it its me my of on or
+    should that the there this to use using want way what when where which will with would you your
+""".split())
+# Best keyword matches checked for enough overlap before the lookup counts as a miss
+MATCH_CANDIDATES = 5
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def _keywords(text: str) -> List[str]:
+    return list(dict.fromkeys(word for word in _words(text) if word not in STOP_WORDS))
+
+
+def _match_expression(words: List[str], match_all: bool) -> str:
+    # Quote every word so user input can never be parsed as FTS5 query syntax
+    return (" AND " if match_all else " OR ").join(f'"{word}"' for word in words)
+
+
+class HistoryStore:
+    """
+    Stores answered questions in SQLite with a full-text index over questions and answers.
+
+    The database uses write-ahead logging, so several howdoai processes can record and
+    search concurrently.
+
+    Args:
+        path (str): The database file. ``":memory:"`` keeps the history in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path if path == ":memory:" else os.path.expanduser(path)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+
+    def add(self, query: str, result: Dict[str, Any]) -> int:
+        """
+        Records a successful result returned by main.
+
+        Returns:
+            int: The id of the new entry.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO entries (created, query, answer, follow_up_questions, model, endpoint, backend, timings, usage)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(),
+                    query,
+                    result["answer"],
+                    json.dumps(list(result.get("follow_up_questions", []))),
+                    result.get("model"),
+                    result.get("endpoint"),
+                    result.get("backend"),
+                    json.dumps(result.get("timings") or {}),
+                    json.dumps(result.get("usage") or {}),
+                )
+            )
+            return cursor.lastrowid
+
+    def _query(self, expression: str, limit: int) -> List[HistoryEntry]:
+        if not expression:
+            return []
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT entries.* FROM entries_fts JOIN entries ON entries.id = entries_fts.rowid"
+                " WHERE entries_fts MATCH ? ORDER BY bm25(entries_fts, 10.0, 1.0), entries.created DESC LIMIT ?",
+                (expression, limit)
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def search(self, text: str, limit: int = 10) -> List[HistoryEntry]:
+        """
+        Returns the entries whose question or answer contains all words of the text, best matches first.
+        """
+        return self._query(_match_expression(_words(text), match_all=True), limit)
+
+    def best_match(self, query: str, min_overlap: Optional[float] = None) -> Optional[HistoryEntry]:
+        """
+        Returns the entry that best answers a question, or None if no entry is relevant enough.
+
+        Stop words such as "how" and "to" are ignored. Matches on the question count ten times as
+        much as matches on the answer, and the best entry containing at least min_overlap of the
+        remaining words is returned.
+
+        Args:
+            query (str): The question.
+            min_overlap (Optional[float]): The fraction of the question's words an entry must contain.
+                Defaults to config.HISTORY_MIN_OVERLAP.
+        """
+        keywords = _keywords(query)
+        if not keywords:
+            return None
+        min_overlap = config.HISTORY_MIN_OVERLAP if min_overlap is None else min_overlap
+        for entry in self._query(_match_expression(keywords, match_all=False), MATCH_CANDIDATES):
+            if self._matched_words(entry.id, keywords) >= min_overlap * len(keywords):
+                return entry
+        return None
+
+    def _matched_words(self, entry_id: int, words: List[str]) -> int:
+        # Each word is matched through the index, so stemming applies ("files" matches "file")
+        with self._lock:
+            return sum(
+                self._connection.execute(
+                    "SELECT 1 FROM entries_fts WHERE entries_fts MATCH ? AND rowid = ?",
+                    (_match_expression([word], match_all=True), entry_id)
+                ).fetchone() is not None
+                for word in words
+            )
+
+    def recent(self, limit: int = 10) -> List[HistoryEntry]:
+        """
+        Returns the most recently recorded entries.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT * FROM entries ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [self._entry(row) for row in rows]
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> HistoryEntry:
+        return HistoryEntry(
+            id=row["id"],
+            created=row["created"],
+            query=row["query"],
+            answer=row["answer"],
+            follow_up_questions=json.loads(row["follow_up_questions"]),
+            model=row["model"],
+            endpoint=row["endpoint"],
+            backend=row["backend"],
+            timings=json.loads(row["timings"]),
+            usage=json.loads(row["usage"]),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+_store = None
+_store_path = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """
+    Returns the shared history store at config.HISTORY_PATH.
+    """
+    global _store, _store_path
+    with _store_lock:
+        if _store is None or _store_path != config.HISTORY_PATH:
+            _store = HistoryStore(config.HISTORY_PATH)
+            _store_path = config.HISTORY_PATH
+        return _store
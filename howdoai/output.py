@@ -0,0 +1,127 @@
+import json
+import sys
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, List, Optional, TextIO, Union
+
+from .api_client import resolve_backend_name
+from .config import config
+
+OUTPUT_FORMATS = ("text", "json", "ndjson")
+
+
+def build_record(query: str, result: Dict[str, Any], use_groq: bool = False) -> Dict[str, Any]:
+    """
+    Builds a machine-readable record from a result returned by main.
+
+    Unlike the result itself, every field has a fixed type: timings are float seconds,
+    token counts are integers and max_tokens is always the effective limit.
+
+    Args:
+        query (str): The question the result answers.
+        result (Dict[str, Any]): The dictionary returned by main.
+        use_groq (bool): Whether the Groq API endpoint was requested.
+
+    Returns:
+        Dict[str, Any]: A JSON-serializable record.
+    """
+    max_tokens = result.get("max_tokens")
+    usage = result.get("usage") or {}
+    timings = result.get("timings") or {}
+    return {
+        "query": query,
+        "answer": None if "error" in result else result.get("answer"),
+        "language": result.get("language"),
+        "follow_up_questions": list(result.get("follow_up_questions", [])),
+        "model": result.get("model"),
+        "endpoint": result.get("endpoint"),
+        "backend": result.get("backend") or resolve_backend_name(use_groq),
+        "max_tokens": max_tokens if isinstance(max_tokens, int) else config.DEFAULT_MAX_TOKENS,
+        "timings": {stage: float(seconds) for stage, seconds in timings.items()},
+        "usage": {
+            key: int(usage.get(key) or 0)
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens")
+        },
+        "usage_shared_by": int(usage.get("shared_by") or 1),
+        "cached": bool(result.get("cached", False)),
+        "error": result.get("error"),
+        "error_type": result.get("error_type"),
+    }
+
+
+def format_records(records: Iterable[Dict[str, Any]], output_format: str) -> str:
+    """
+    Serializes records as JSON or NDJSON.
+
+    Args:
+        records (Iterable[Dict[str, Any]]): The records built by build_record.
+        output_format (str): "json" for a single document or "ndjson" for one compact line per record.
+
+    Returns:
+        str: The serialized records, ending with a newline.
+
+    Raises:
+        ValueError: If the output format is not supported.
+    """
+    records = list(records)
+    if output_format == "ndjson":
+        return "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+    if output_format == "json":
+        document = records[0] if len(records) == 1 else records
+        return json.dumps(document, indent=2) + "\n"
+    raise ValueError(f"Unsupported output format: {output_format}")
+
+
+def write_result(query: Union[str, List[str]], result: Union[Dict[str, Any], List[Dict[str, Any]]],
+                 output_format: str, use_groq: bool = False, stream: Optional[TextIO] = None) -> None:
+    """
+    Writes a result in a machine-readable format without building any rich renderables.
+
+    Args:
+        query (Union[str, List[str]]): The question the result answers, or the list of questions.
+        result (Union[Dict[str, Any], List[Dict[str, Any]]]): The dictionary, or list of dictionaries, returned by main.
+        output_format (str): "json" or "ndjson".
+        use_groq (bool): Whether the Groq API endpoint was requested.
+        stream (Optional[TextIO]): Where to write. Defaults to sys.stdout.
+    """
+    if stream is None:
+        stream = sys.stdout
+    if isinstance(result, list):
+        records = [build_record(q, r, use_groq) for q, r in zip(query, result)]
+    else:
+        records = [build_record(query, result, use_groq)]
+    stream.write(format_records(records, output_format))
+    stream.flush()
+
+
+def write_history(entries, output_format: str, stream: Optional[TextIO] = None) -> None:
+    """
+    Writes history entries in a machine-readable format.
+
+    Args:
+        entries (List[HistoryEntry]): The entries to write.
+        output_format (str): "json" or "ndjson".
+        stream (Optional[TextIO]): Where to write. Defaults to sys.stdout.
+    """
+    if stream is None:
+        stream = sys.stdout
+    records = [asdict(entry) for entry in entries]
+    if output_format == "json":
+        stream.write(json.dumps(records, indent=2) + "\n")
+    else:
+        stream.write(format_records(records, output_format) if records else "")
+    stream.flush()
+
+
+def write_warm_up(result, output_format: str, stream: Optional[TextIO] = None) -> None:
+    """
+    Writes a warm-up result in a machine-readable format.
+
+    Args:
+        result (WarmupResult): The warm-up result.
+        output_format (str): "json" or "ndjson".
+        stream (Optional[TextIO]): Where to write. Defaults to sys.stdout.
+    """
+    if stream is None:
+        stream = sys.stdout
+    stream.write(format_records([asdict(result)], output_format))
+    stream.flush()
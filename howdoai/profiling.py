@@ -0,0 +1,256 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_FORMATS = ("text", "pstats", "collapsed")
+
+
+class NetworkTimer:
+    """
+    Accumulates the wall time spent waiting on network requests, per thread.
+
+    The HTTP backends record every request here, which lets a profile separate time
+    spent waiting on the API from CPU time spent in howdoai itself. Each thread keeps its
+    own totals, so requests made by background threads (speculation, keep-alive) do not
+    count towards a run profiled in another thread.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def record(self, seconds: float) -> None:
+        self._local.total = getattr(self._local, "total", 0.0) + seconds
+        self._local.requests = getattr(self._local, "requests", 0) + 1
+
+    def snapshot(self) -> Tuple[float, int]:
+        """
+        Returns the seconds spent waiting and the number of requests made by the calling thread.
+        """
+        return getattr(self._local, "total", 0.0), getattr(self._local, "requests", 0)
+
+
+network_timer = NetworkTimer()
+
+
+@dataclass
+class ProfileOptions:
+    """
+    Options for profiling a run.
+
+    Attributes:
+        output (Optional[str]): File to write the report to. None or "-" writes a text report to stderr.
+        output_format (Optional[str]): "text", "pstats" (for pstats/snakeviz) or "collapsed" (folded stacks
+            for flamegraph.pl or speedscope). When None it is inferred from the output file extension:
+            .prof/.pstats for pstats, .folded/.collapsed for collapsed, text otherwise.
+        memory (bool): Also trace memory allocations with tracemalloc.
+        sort (str): The pstats sort key for text reports.
+        limit (int): The number of functions and allocation sites shown in text reports.
+    """
+    output: Optional[str] = None
+    output_format: Optional[str] = None
+    memory: bool = False
+    sort: str = "cumulative"
+    limit: int = 30
+
+    @classmethod
+    def coerce(cls, profile: Union[bool, str, "ProfileOptions"]) -> "ProfileOptions":
+        if isinstance(profile, cls):
+            return profile
+        if isinstance(profile, str):
+            return cls(output=profile)
+        return cls()
+
+    def resolved_format(self) -> str:
+        if self.output_format:
+            return self.output_format
+        extension = os.path.splitext(self.output or "")[1].lower()
+        if extension in (".prof", ".pstats"):
+            return "pstats"
+        if extension in (".folded", ".collapsed"):
+            return "collapsed"
+        return "text"
+
+
+@dataclass
+class ProfileReport:
+    """
+    The outcome of a profiled run.
+
+    Attributes:
+        wall_time (float): Seconds from start to end of the run.
+        cpu_time (float): CPU seconds used by the profiled thread during the run.
+        network_wait (float): Seconds the profiled thread spent waiting on API requests.
+        network_requests (int): Number of API requests the profiled thread made.
+        own_cpu_time (float): CPU seconds spent in howdoai's own functions, excluding callees outside the package.
+        peak_memory (Optional[int]): Peak traced memory in bytes, when memory tracing was on.
+        top_allocations (List[str]): The largest allocation sites, when memory tracing was on.
+    """
+    wall_time: float
+    cpu_time: float
+    network_wait: float
+    network_requests: int
+    own_cpu_time: float
+    peak_memory: Optional[int] = None
+    top_allocations: List[str] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "network_wait": self.network_wait,
+            "network_requests": self.network_requests,
+            "own_cpu_time": self.own_cpu_time,
+            "other_time": max(0.0, self.wall_time - self.network_wait - self.cpu_time),
+            "peak_memory": self.peak_memory,
+        }
+
+
+def collapsed_stacks(stats: pstats.Stats) -> List[str]:
+    """
+    Converts profile statistics to folded stacks ("a;b;c microseconds" lines).
+
+    cProfile only records caller/callee pairs, not full stacks, so time below a function
+    reached from several callers is split between them in proportion to each caller's
+    share of the function's cumulative time.
+    """
+    raw = stats.stats
+    children: Dict[Any, List[Tuple[Any, float]]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, (_, _, _, edge_cumulative) in callers.items():
+            children.setdefault(caller, []).append((func, edge_cumulative))
+
+    def label(func) -> str:
+        filename, line, name = func
+        if filename == "~":
+            return name
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    lines: Dict[str, float] = {}
+
+    def walk(func, stack: List[str], path: set, fraction: float) -> None:
+        _, _, total, cumulative, _ = raw[func]
+        stack = stack + [label(func)]
+        key = ";".join(stack)
+        lines[key] = lines.get(key, 0.0) + total * fraction
+        for child, edge_cumulative in children.get(func, []):
+            child_cumulative = raw[child][3]
+            if child in path or child_cumulative <= 0:
+                continue
+            walk(child, stack, path | {child}, fraction * edge_cumulative / child_cumulative)
+
+    for func, (_, _, _, _, callers) in raw.items():
+        if not callers:
+            walk(func, [], {func}, 1.0)
+    return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in lines.items() if round(seconds * 1e6) > 0]
+
+
+class Profiler:
+    """
+    Profiles a block of code with cProfile and, optionally, tracemalloc.
+
+    Use as a context manager; the report is written when the block exits and is available
+    as the report attribute. Only the thread that enters the block is measured, and function
+    times are CPU times, so waiting on the network or on other threads shows up as network
+    wait or other time rather than in the functions that waited.
+
+    Args:
+        options (ProfileOptions): What to measure and where to write the report.
+
+    Raises:
+        ValueError: If the output format is unknown, is pstats without an output file, or the
+            output file cannot be written.
+    """
+
+    def __init__(self, options: Optional[ProfileOptions] = None):
+        self.options = options or ProfileOptions()
+        output_format = self.options.resolved_format()
+        if output_format not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format: {output_format}. Please use one of: {', '.join(PROFILE_FORMATS)}")
+        if output_format == "pstats" and self.options.output in (None, "-"):
+            raise ValueError("The pstats profile format needs an output file")
+        if self.options.output not in (None, "-"):
+            directory = os.path.dirname(os.path.abspath(self.options.output))
+            if not os.path.isdir(directory) or not os.access(directory, os.W_OK):
+                raise ValueError(f"Cannot write the profile to {self.options.output}: "
+                                 f"{directory} is not a writable directory")
+        self.report: Optional[ProfileReport] = None
+        self.stats: Optional[pstats.Stats] = None
+        # CPU time of this thread, matching the per-thread network wait
+        self._profile = cProfile.Profile(time.thread_time)
+
+    def __enter__(self):
+        if self.options.memory:
+            tracemalloc.start()
+        self._network_start = network_timer.snapshot()
+        self._cpu_start = time.thread_time()
+        self._wall_start = time.perf_counter()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._profile.disable()
+        wall_time = time.perf_counter() - self._wall_start
+        cpu_time = time.thread_time() - self._cpu_start
+        network_total, network_requests = network_timer.snapshot()
+        peak_memory = None
+        top_allocations = []
+        if self.options.memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            top_allocations = [str(stat) for stat in snapshot.statistics("lineno")[:self.options.limit]]
+
+        self.stats = pstats.Stats(self._profile)
+        own_cpu_time = sum(total for (filename, _, _), (_, _, total, _, _) in self.stats.stats.items()
+                       if filename.startswith(PACKAGE_DIR))
+        self.report = ProfileReport(
+            wall_time=wall_time,
+            cpu_time=cpu_time,
+            network_wait=network_total - self._network_start[0],
+            network_requests=network_requests - self._network_start[1],
+            own_cpu_time=own_cpu_time,
+            peak_memory=peak_memory,
+            top_allocations=top_allocations,
+        )
+        self.write()
+
+    def format_text(self) -> str:
+        report = self.report
+        summary = report.summary()
+        lines = [
+            "howdoai profile",
+            f"  wall time:        {report.wall_time:.3f} s",
+            f"  network wait:     {report.network_wait:.3f} s ({report.network_requests} requests)",
+            f"  CPU time:         {report.cpu_time:.3f} s",
+            f"    in howdoai:     {report.own_cpu_time:.3f} s",
+            f"  other (idle/IO):  {summary['other_time']:.3f} s",
+        ]
+        if report.peak_memory is not None:
+            lines.append(f"  peak memory:      {report.peak_memory / 1024:.1f} KiB")
+            lines.append("")
+            lines.append("Top allocations:")
+            lines.extend(f"  {allocation}" for allocation in report.top_allocations)
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats(self.options.sort).print_stats(self.options.limit)
+        return "\n".join(lines) + "\n\n" + stream.getvalue()
+
+    def write(self) -> None:
+        output = self.options.output
+        output_format = self.options.resolved_format()
+        if output_format == "pstats":
+            self.stats.dump_stats(output)
+            return
+        text = "\n".join(collapsed_stacks(self.stats)) + "\n" if output_format == "collapsed" else self.format_text()
+        if not output or output == "-":
+            sys.stderr.write(text)
+        else:
+            with open(output, "w") as f:
+                f.write(text)
@@ -1,5 +1,28 @@
+from typing import Any, Callable, Optional, Protocol, runtime_checkable
+
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
 
+
+@runtime_checkable
+class ProgressReporter(Protocol):
+    """
+    The interface QuestionAnswerer uses to report progress.
+
+    Any object implementing these methods (and the context manager protocol) can be
+    passed where a ProgressBarManager is expected.
+    """
+
+    def start_progress(self, description: str) -> Any: ...
+
+    def update_progress(self, task_id: Any, advance: float, description: str) -> None: ...
+
+    def complete_progress(self, task_id: Any, description: str) -> None: ...
+
+    def __enter__(self) -> "ProgressReporter": ...
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None: ...
+
+
 class ProgressBarManager:
     """
     A class that manages the progress bar for tasks.
@@ -44,4 +67,92 @@ class ProgressBarManager:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.progress.stop()
\ No newline at end of file
+        self.progress.stop()
+
+
+class NullProgressManager:
+    """
+    A progress reporter that does nothing.
+
+    Used for library calls, piped output and ``--quiet`` runs, where a live display
+    (and the refresh thread behind it) would be pure overhead.
+    """
+
+    def __init__(self):
+        self._next_task_id = 0
+
+    def start_progress(self, description):
+        self._next_task_id += 1
+        return self._next_task_id
+
+    def update_progress(self, task_id, advance, description):
+        pass
+
+    def complete_progress(self, task_id, description):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class CallbackProgressManager:
+    """
+    A progress reporter that forwards every progress event to a callback.
+
+    Intended for embedding howdoai in other applications that have their own way of
+    showing progress.
+
+    Args:
+        callback (Callable[[str, int, float, str], None]): Called as
+            ``callback(event, task_id, completed, description)`` where ``event`` is one of
+            ``"start"``, ``"update"`` or ``"complete"`` and ``completed`` is the task's
+            percentage of completion.
+    """
+
+    def __init__(self, callback: Callable[[str, int, float, str], None]):
+        self.callback = callback
+        self._completed = {}
+
+    def start_progress(self, description):
+        task_id = len(self._completed) + 1
+        self._completed[task_id] = 0.0
+        self.callback("start", task_id, 0.0, description)
+        return task_id
+
+    def update_progress(self, task_id, advance, description):
+        completed = min(self._completed.get(task_id, 0.0) + advance, 100.0)
+        self._completed[task_id] = completed
+        self.callback("update", task_id, completed, description)
+
+    def complete_progress(self, task_id, description):
+        self._completed[task_id] = 100.0
+        self.callback("complete", task_id, 100.0, description)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def create_progress_manager(console=None, quiet: Optional[bool] = None) -> ProgressReporter:
+    """
+    Selects the progress reporter for a run.
+
+    Args:
+        console (Optional[Console]): The console to draw the progress bar on.
+        quiet (Optional[bool]): Force (True) or suppress (False) quiet mode. When None, quiet
+            mode is used if there is no console or it is not attached to a terminal.
+
+    Returns:
+        ProgressReporter: A ProgressBarManager for interactive terminals, otherwise a
+            NullProgressManager.
+    """
+    if quiet is None:
+        quiet = console is None or not console.is_terminal
+    if quiet:
+        return NullProgressManager()
+    return ProgressBarManager(console)
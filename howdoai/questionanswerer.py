@@ -1,40 +1,113 @@
-from typing import Optional
+from typing import Optional, Dict, List, Tuple, Union
 import time
 import random
-from .progressbarmanager import ProgressBarManager
-from .api_client import call_ai_api, AIRequestError
+import re
+from .progressbarmanager import NullProgressManager, ProgressReporter
+from .api_client import call_ai_api, resolve_backend_name, AIRequestError, AIResponse
+from .batching import build_batch_prompt, pack_questions, split_batch_answer
 
 from .config import config
 
+# Ends a code-only completion at the closing fence of its first code block. The opening
+# fence names the language, so it does not match unless the model leaves the language out.
+CODE_ONLY_STOP = ["\n```\n"]
+
+
+def extract_code(text: str) -> Tuple[str, Optional[str]]:
+    """
+    Extracts the code from the first fenced code block of an answer.
+
+    The closing fence may be missing, since code-only requests stop generating at it.
+    Answers without a fence give their first inline code span, such as the command in
+    "Use `ls -la`.", or the whole answer stripped when they have none.
+
+    Args:
+        text (str): The answer.
+
+    Returns:
+        Tuple[str, Optional[str]]: The code and the language named on the opening fence, if any.
+    """
+    match = re.search(r"```[ \t]*([\w+#.-]*)[^\n]*\n(.*?)(?:\n?```|\Z)", text, re.DOTALL)
+    if match:
+        return match.group(2).strip("\n"), match.group(1) or None
+    inline = re.search(r"`([^`\n]+)`", text)
+    if inline:
+        return inline.group(1).strip(), None
+    return text.strip(), None
+
+
+def _stopped_at_opening_fence(text: str) -> bool:
+    # Nothing, or only an introduction such as "Here is the command:", came before the stop
+    text = text.strip()
+    return "```" not in text and (not text or text.endswith(":"))
+
+
+def share_usage(usage: Dict[str, int], shares: int) -> List[Dict[str, int]]:
+    """
+    Splits the token counts of a request answering several questions between them.
+
+    Counts are split as evenly as whole tokens allow, so they add up to the request's counts.
+    Each share records how many questions the request was shared by under "shared_by".
+
+    Args:
+        usage (Dict[str, int]): The token counts of the shared request.
+        shares (int): The number of questions the request answered.
+
+    Returns:
+        List[Dict[str, int]]: One usage dictionary per question.
+    """
+    split = [{"shared_by": shares} for _ in range(shares)]
+    for key, value in usage.items():
+        quotient, remainder = divmod(int(value or 0), shares)
+        for i, share in enumerate(split):
+            share[key] = quotient + (1 if i < remainder else 0)
+    return split
 
-# Constants
-MAX_FOLLOW_UP_QUESTIONS = config.MAX_FOLLOW_UP_QUESTIONS
-MIN_FOLLOW_UP_QUESTIONS = config.MIN_FOLLOW_UP_QUESTIONS
 
 class QuestionAnswerer:
     """
     A class that generates answers to questions and generates follow-up questions based on a given question and answer.
 
     Args:
-        progress_manager (ProgressBarManager): An instance of the ProgressBarManager class.
+        progress_manager (Optional[ProgressReporter]): The progress reporter to use. Defaults to
+            a NullProgressManager, which reports nothing.
+        priority (Optional[str]): The request scheduler priority of all API calls: "interactive",
+            "normal" (the default) or "bulk".
+        tenant (Optional[str]): Who the API calls are made for, for fair queuing between tenants.
 
     Attributes:
-        progress_manager (ProgressBarManager): An instance of the ProgressBarManager class.
+        progress_manager (ProgressReporter): The progress reporter in use.
         task_id (Optional[int]): The ID of the current task.
+        answer_response (Optional[AIResponse]): The API response the answer was generated from.
+        usage (Dict[str, int]): Token counts accumulated over all API calls made by this instance.
+        queue_wait (float): Seconds all API calls made by this instance waited in the request scheduler.
 
     Methods:
         generate_answer: Generates an answer to a given question.
+        generate_answers: Generates answers to several questions, packing them into shared requests.
+        generate_code: Generates only the code or command that answers a question.
         process_answer: Processes the generated answer.
         format_response: Formats the answer.
         truncate_to_word_limit: Truncates the text to a specified word limit.
         generate_follow_up_questions: Generates follow-up questions based on a given question and answer.
     """
 
-    def __init__(self, progress_manager: ProgressBarManager):
-        self.progress_manager = progress_manager
+    def __init__(self, progress_manager: Optional[ProgressReporter] = None, priority: Optional[str] = None,
+                 tenant: Optional[str] = None):
+        self.progress_manager = progress_manager if progress_manager is not None else NullProgressManager()
+        self.priority = priority
+        self.tenant = tenant
         self.task_id = None
+        self.answer_response = None
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        self.queue_wait = 0.0
+
+    def _record_usage(self, response: AIResponse) -> None:
+        for key in self.usage:
+            self.usage[key] += int(response.usage.get(key) or 0)
+        self.queue_wait += response.queue_wait
 
-    def generate_answer(self, query: str, use_groq: bool, max_tokens: Optional[int]) -> str:
+    def generate_answer(self, query: str, use_groq: bool, max_tokens: Optional[int], retries: Optional[int] = None) -> str:
         """
         Generates an answer to a given question.
 
@@ -42,6 +115,7 @@ class QuestionAnswerer:
             query (str): The question to generate an answer for.
             use_groq (bool): Flag indicating whether to use GROQ for generating the answer.
             max_tokens (Optional[int]): The maximum number of tokens for the generated answer.
+            retries (Optional[int]): Number of attempts for transient failures. Defaults to config.MAX_RETRIES.
 
         Returns:
             str: The generated answer.
@@ -49,11 +123,104 @@ class QuestionAnswerer:
         self.task_id = self.progress_manager.start_progress("Generating answer...")
         # Logic for generating the answer
         self.progress_manager.update_progress(self.task_id, 30, "[green]Sending request to AI...")
-        result = call_ai_api(query, use_groq, max_tokens)
+        result = call_ai_api(query, use_groq, max_tokens, retries=retries, priority=self.priority, tenant=self.tenant)
+        self.answer_response = result
+        self._record_usage(result)
         self.progress_manager.update_progress(self.task_id, 40, "[green]Processing AI response...")
         answer = result.content.strip()
         return answer, self.task_id
 
+    def generate_answers(self, queries: List[str], use_groq: bool, max_tokens: Optional[int]) -> List[Union[AIResponse, AIRequestError]]:
+        """
+        Generates answers to several questions, packing them into as few requests as possible.
+
+        Questions are grouped under config.BATCH_TOKEN_BUDGET and each group is sent as one
+        request with delimited answers, which saves resending the system message and a round
+        trip per question. If a combined response cannot be split back into one answer per
+        question, the questions of that group are asked individually instead.
+
+        Args:
+            queries (List[str]): The questions to generate answers for.
+            use_groq (bool): Flag indicating whether to use GROQ for generating the answers.
+            max_tokens (Optional[int]): The maximum number of tokens for each answer.
+
+        Returns:
+            List[Union[AIResponse, AIRequestError]]: One entry per question, in order: a response
+                whose content is that question's answer, or the error that prevented answering it.
+                Answers from a shared request carry their share of its usage (see share_usage).
+        """
+        answer_tokens = max_tokens if max_tokens else config.DEFAULT_MAX_TOKENS
+        batches = pack_questions(queries, answer_tokens, config.BATCH_TOKEN_BUDGET, config.BATCH_MAX_QUESTIONS)
+        results = [None] * len(queries)
+        self.task_id = self.progress_manager.start_progress(f"Generating {len(queries)} answers...")
+        for batch in batches:
+            if len(batch) > 1:
+                try:
+                    response = call_ai_api(build_batch_prompt([queries[i] for i in batch]), use_groq,
+                                           answer_tokens * len(batch), priority=self.priority, tenant=self.tenant)
+                    self._record_usage(response)
+                    answers = split_batch_answer(response.content, len(batch))
+                except AIRequestError as e:
+                    for i in batch:
+                        results[i] = e
+                    answers = None
+                except ValueError:
+                    # The model did not follow the answer format, ask the questions one by one
+                    answers = None
+                else:
+                    for i, answer, usage in zip(batch, answers, share_usage(response.usage, len(batch))):
+                        results[i] = AIResponse(content=answer.strip(), model=response.model,
+                                                endpoint=response.endpoint, usage=usage,
+                                                backend=response.backend, queue_wait=response.queue_wait)
+            for i in batch:
+                if results[i] is None:
+                    try:
+                        response = call_ai_api(queries[i], use_groq, max_tokens, priority=self.priority,
+                                               tenant=self.tenant)
+                        self._record_usage(response)
+                        results[i] = AIResponse(content=response.content.strip(), model=response.model,
+                                                endpoint=response.endpoint, usage=response.usage,
+                                                backend=response.backend, queue_wait=response.queue_wait)
+                    except AIRequestError as e:
+                        results[i] = e
+            self.progress_manager.update_progress(self.task_id, 100 * len(batch) / len(queries),
+                                                  "[green]Generating answers...")
+        self.progress_manager.complete_progress(self.task_id, "[green]Answers generated")
+        return results
+
+    def generate_code(self, query: str, use_groq: bool, max_tokens: Optional[int]) -> Tuple[str, Optional[str]]:
+        """
+        Generates only the code or command that answers a question.
+
+        Uses the compact config.CODE_ONLY_SYSTEM_MESSAGE and a small token budget, and stops
+        generating at the end of the first code block. If the stop sequence cut the answer off
+        before any code, the question is asked again without it.
+
+        Args:
+            query (str): The question to generate code for.
+            use_groq (bool): Flag indicating whether to use GROQ for generating the code.
+            max_tokens (Optional[int]): The maximum number of tokens. Defaults to config.CODE_ONLY_MAX_TOKENS.
+
+        Returns:
+            Tuple[str, Optional[str]]: The code and its language, if the model named one.
+        """
+        self.task_id = self.progress_manager.start_progress("Generating code...")
+        self.progress_manager.update_progress(self.task_id, 30, "[green]Sending request to AI...")
+        max_tokens = max_tokens if max_tokens else config.CODE_ONLY_MAX_TOKENS
+        result = call_ai_api(query, use_groq, max_tokens, priority=self.priority, tenant=self.tenant,
+                             system_message=config.CODE_ONLY_SYSTEM_MESSAGE, stop=CODE_ONLY_STOP)
+        self._record_usage(result)
+        if _stopped_at_opening_fence(result.content):
+            # The model introduced the code and opened a bare fence, which the stop sequence matched
+            self.progress_manager.update_progress(self.task_id, 30, "[green]Asking again without a stop sequence...")
+            result = call_ai_api(query, use_groq, max_tokens, priority=self.priority, tenant=self.tenant,
+                                 system_message=config.CODE_ONLY_SYSTEM_MESSAGE)
+            self._record_usage(result)
+        self.answer_response = result
+        code, language = extract_code(result.content)
+        self.progress_manager.complete_progress(self.task_id, "[green]Code generated")
+        return code, language
+
     def process_answer(self, answer: str, max_words: Optional[int]) -> str:
         """
         Processes the generated answer.
@@ -114,7 +281,8 @@ class QuestionAnswerer:
 
         return truncated
     
-    def generate_follow_up_questions(self, initial_query: str, initial_response: str, use_groq: bool, max_tokens: Optional[int]) -> str:
+    def generate_follow_up_questions(self, initial_query: str, initial_response: str, use_groq: bool, max_tokens: Optional[int],
+                                     retries: Optional[int] = None) -> str:
         """
         Generates follow-up questions based on a given question and answer.
 
@@ -123,9 +291,13 @@ class QuestionAnswerer:
             initial_response (str): The initial answer.
             use_groq (bool): Flag indicating whether to use GROQ for generating the follow-up questions.
             max_tokens (Optional[int]): The maximum number of tokens for the generated follow-up questions.
+            retries (Optional[int]): Number of attempts for transient failures. Defaults to config.MAX_RETRIES.
 
         Returns:
             str: The generated follow-up questions.
+
+        Raises:
+            AIRequestError: If the request fails, with the error type of the underlying failure.
         """
         try:
             prompt = f"""
@@ -139,16 +311,24 @@ class QuestionAnswerer:
             """
             task = self.progress_manager.start_progress("[blue]Generating follow-up questions...")
             self.progress_manager.update_progress(task, 10, "[blue]Preparing follow-up request...")
-            response = call_ai_api(prompt, use_groq, max_tokens)
+            # Writing follow-up questions is a simple task, so a routed setup keeps it on the small backend
+            backend = config.ROUTING_SMALL_BACKEND if resolve_backend_name(use_groq) == "auto" else None
+            response = call_ai_api(prompt, use_groq, max_tokens, retries=retries, backend=backend,
+                                   priority=self.priority, tenant=self.tenant)
+            self._record_usage(response)
             self.progress_manager.update_progress(task, 50, "[blue]Processing follow-up response...")
             generated_text = response.content
             questions = [q.strip() for q in generated_text.split('\n') if q.strip().endswith('?')]
 
             self.progress_manager.update_progress(task, 20, "[blue]Finalizing follow-up questions...")
-            while len(questions) < MIN_FOLLOW_UP_QUESTIONS:
+            while len(questions) < config.MIN_FOLLOW_UP_QUESTIONS:
                 questions.append(f"Can you elaborate more on {random.choice(['the topic', 'this subject', 'this area', 'this concept'])}?")
 
             self.progress_manager.complete_progress(task, "[blue]Follow-up questions generated")
-            return questions[:MAX_FOLLOW_UP_QUESTIONS]
+            return questions[:config.MAX_FOLLOW_UP_QUESTIONS]
+        except AIRequestError as e:
+            # Keep the error type, so callers can tell rate limiting from other failures
+            raise AIRequestError(f"Error generating follow-up questions: {str(e)}", error_type=e.error_type,
+                                 status_code=e.status_code, suggestion=e.suggestion)
         except Exception as e:
             raise AIRequestError(f"Error generating follow-up questions: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,324 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from .api_client import AIRequestError, AIResponse
+from .backends import Backend, CompletionRequest, get_backend
+from .config import Configuration, config
+
+# Errors another backend would fail on too, so they are not escalated
+NO_ESCALATION_ERRORS = ("invalid_request", "overloaded")
+# Outcomes are averaged exactly until this many samples, then exponentially
+EWMA_ALPHA = 0.1
+BUCKETS = 10
+# Seconds between writes of the recorded outcomes; the rest are written at exit
+SAVE_INTERVAL = 5.0
+
+_FENCED_CODE = re.compile(r"```")
+_CODE_CHARACTERS = re.compile(r"[{};]|=>|->|::|\w\(.*\)|`[^`]+`")
+
+
+def _keywords(setting: str) -> List[str]:
+    return [keyword.strip().lower() for keyword in setting.split(",") if keyword.strip()]
+
+
+def _matches(text: str, keywords: List[str]) -> List[str]:
+    # Keywords match as word prefixes, so "thread" also matches "threads" and "threading"
+    return [keyword for keyword in keywords if re.search(r"\b" + re.escape(keyword), text)]
+
+
+def score_query(query: str, settings: Optional[Configuration] = None) -> float:
+    """
+    Estimates how hard a query is from its text alone, between 0 (a simple lookup) and 1.
+
+    Long queries, code and ROUTING_HARD_KEYWORDS raise the score; ROUTING_SIMPLE_KEYWORDS
+    lower it. Scoring is a handful of regular expressions, so it adds no noticeable latency.
+
+    Args:
+        query (str): The query.
+        settings (Optional[Configuration]): The configuration to take the ROUTING_* settings from.
+            Defaults to the current configuration.
+
+    Returns:
+        float: The complexity score.
+    """
+    settings = settings or config.snapshot()
+    text = query.lower()
+    score = 0.4 * min(1.0, len(text.split()) / max(1, settings.ROUTING_LONG_QUERY_WORDS))
+    if _FENCED_CODE.search(text) or text.count("\n") > 1 and _CODE_CHARACTERS.search(text):
+        score += 0.3
+    elif _CODE_CHARACTERS.search(text):
+        score += 0.1
+    score += min(0.5, 0.25 * len(_matches(text, _keywords(settings.ROUTING_HARD_KEYWORDS))))
+    score -= min(0.2, 0.1 * len(_matches(text, _keywords(settings.ROUTING_SIMPLE_KEYWORDS))))
+    if text.count("?") > 1:
+        score += 0.1
+    return round(max(0.0, min(1.0, score)), 3)
+
+
+@dataclass
+class Route:
+    """
+    Where the router sends a query, and why.
+
+    Attributes:
+        backend (str): The backend to send the query to.
+        score (float): The complexity score of the query.
+        bucket (int): The score bucket outcomes are recorded under.
+        reason (str): Why the backend was chosen.
+        fallback (Optional[str]): The backend to retry on if the chosen one fails.
+    """
+    backend: str
+    score: float
+    bucket: int
+    reason: str
+    fallback: Optional[str] = None
+
+
+@dataclass
+class Outcomes:
+    """
+    Recorded outcomes of one backend on the queries of one score bucket.
+
+    Attributes:
+        samples (int): Number of recorded requests.
+        failure_rate (float): Moving average of failed requests: errors and empty answers.
+        successes (int): Number of requests that did not fail.
+        latency (float): Moving average of the seconds successful requests took, excluding queue wait.
+        truncation_rate (float): Moving average of answers that used up the token limit. Reported
+            only: complete answers often use up a small limit too, so it does not change the routing.
+    """
+    samples: int = 0
+    failure_rate: float = 0.0
+    successes: int = 0
+    latency: float = 0.0
+    truncation_rate: float = 0.0
+
+    def record(self, latency: float, failed: bool, truncated: bool = False) -> None:
+        self.samples += 1
+        alpha = max(1.0 / self.samples, EWMA_ALPHA)
+        self.failure_rate += alpha * (float(failed) - self.failure_rate)
+        self.truncation_rate += alpha * (float(truncated) - self.truncation_rate)
+        if not failed:
+            self.successes += 1
+            self.latency += max(1.0 / self.successes, EWMA_ALPHA) * (latency - self.latency)
+
+
+class ModelRouter:
+    """
+    Sends simple queries to a small, fast backend and hard ones to a large backend.
+
+    A query goes to ROUTING_LARGE_BACKEND when its score_query score reaches ROUTING_THRESHOLD,
+    and to ROUTING_SMALL_BACKEND otherwise. The router records the latency and failures of both
+    backends per score bucket, and once a bucket has ROUTING_MIN_SAMPLES outcomes it also sends
+    that bucket's simple queries to the large backend when the small backend fails more often
+    than ROUTING_MAX_FAILURE_RATE, or when the large backend answers them as fast.
+
+    Args:
+        path (Optional[str]): File to persist the recorded outcomes in, so they carry over between
+            runs. It is written at most every SAVE_INTERVAL seconds and by flush. When None, the
+            outcomes live in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = os.path.expanduser(path) if path else None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._outcomes: Dict[str, Dict[int, Outcomes]] = self._load()
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def _load(self) -> Dict[str, Dict[int, Outcomes]]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            return {backend: {int(bucket): Outcomes(**outcomes) for bucket, outcomes in buckets.items()}
+                    for backend, buckets in stored.items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            return {}
+
+    def flush(self) -> None:
+        """
+        Writes the recorded outcomes to the file if any were recorded since the last write.
+        """
+        if not self.path:
+            return
+        # The file is written outside the outcomes lock, so routing never waits for the disk
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                stats = self._stats()
+                self._dirty = False
+                self._last_save = time.monotonic()
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(stats, f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                # Saving is best effort; routing still works from the outcomes in memory
+                pass
+
+    def _known(self, backend: str, bucket: int, min_samples: int) -> Optional[Outcomes]:
+        outcomes = self._outcomes.get(backend, {}).get(bucket)
+        return outcomes if outcomes is not None and outcomes.samples >= min_samples else None
+
+    def route(self, query: str, settings: Optional[Configuration] = None) -> Route:
+        """
+        Chooses the backend for a query.
+
+        Args:
+            query (str): The query.
+            settings (Optional[Configuration]): The configuration to take the ROUTING_* settings from.
+                Defaults to the current configuration.
+
+        Returns:
+            Route: The chosen backend.
+        """
+        settings = settings or config.snapshot()
+        small, large = settings.ROUTING_SMALL_BACKEND, settings.ROUTING_LARGE_BACKEND
+        score = score_query(query, settings)
+        bucket = min(BUCKETS - 1, int(score * BUCKETS))
+        if score >= settings.ROUTING_THRESHOLD:
+            return Route(large, score, bucket, "complex query")
+        min_samples = max(1, settings.ROUTING_MIN_SAMPLES)
+        with self._lock:
+            small_outcomes = self._known(small, bucket, min_samples)
+            large_outcomes = self._known(large, bucket, min_samples)
+        if small_outcomes is not None and small_outcomes.failure_rate > settings.ROUTING_MAX_FAILURE_RATE:
+            return Route(large, score, bucket, f"{small} fails on similar queries")
+        if (small_outcomes is not None and large_outcomes is not None and small_outcomes.successes
+                and large_outcomes.successes and large_outcomes.latency <= small_outcomes.latency):
+            return Route(large, score, bucket, f"{large} is as fast on similar queries")
+        return Route(small, score, bucket, "simple query", fallback=large if large != small else None)
+
+    def record(self, route: Route, latency: float, failed: bool, truncated: bool = False) -> None:
+        """
+        Records the outcome of a routed request.
+
+        Args:
+            route (Route): The route the request took.
+            latency (float): Seconds the request took, excluding queue wait.
+            failed (bool): Whether the request failed or its answer was empty.
+            truncated (bool): Whether the answer used up the token limit.
+        """
+        with self._lock:
+            outcomes = self._outcomes.setdefault(route.backend, {}).setdefault(route.bucket, Outcomes())
+            outcomes.record(latency, failed, truncated)
+            self._dirty = True
+            due = time.monotonic() - self._last_save >= SAVE_INTERVAL
+        if due:
+            self.flush()
+
+    def _stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        return {backend: {str(bucket): asdict(outcomes) for bucket, outcomes in sorted(buckets.items())}
+                for backend, buckets in self._outcomes.items()}
+
+    def stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Returns the recorded outcomes per backend and score bucket.
+
+        Returns:
+            Dict[str, Dict[str, Dict[str, Any]]]: For each backend and bucket (0 to 9, by score
+                tenths): the samples, failure rate, successes, mean latency in seconds and truncation rate.
+        """
+        with self._lock:
+            return self._stats()
+
+
+def _truncated(response: AIResponse, request: CompletionRequest) -> bool:
+    return int(response.usage.get("completion_tokens") or 0) >= request.max_tokens > 0
+
+
+class RoutingBackend(Backend):
+    """
+    Routes every request to a small or a large backend with the shared ModelRouter.
+
+    Requests are scored on their last message. When the small backend fails or answers with
+    nothing, the request is retried once on the large backend. Select it with ``--backend auto``
+    or ``backend = "auto"``.
+    """
+
+    name = "auto"
+
+    def _route(self, request: CompletionRequest) -> Route:
+        settings = request.settings
+        if self.name in (settings.ROUTING_SMALL_BACKEND, settings.ROUTING_LARGE_BACKEND):
+            raise AIRequestError(
+                f"The {self.name} backend cannot route to itself",
+                error_type="configuration_error",
+                suggestion="Please set ROUTING_SMALL_BACKEND and ROUTING_LARGE_BACKEND to other backends"
+            )
+        prompt = request.messages[-1]["content"] if request.messages else ""
+        return get_router().route(prompt, settings)
+
+    def complete(self, request: CompletionRequest) -> AIResponse:
+        route = self._route(request)
+        router = get_router()
+        start = time.perf_counter()
+        try:
+            response = get_backend(route.backend).complete(request)
+        except AIRequestError as e:
+            router.record(route, time.perf_counter() - start, failed=True)
+            if route.fallback is None or e.error_type in NO_ESCALATION_ERRORS:
+                raise
+            return self._escalate(route, request)
+        router.record(route, time.perf_counter() - start - response.queue_wait,
+                      failed=not response.content.strip(), truncated=_truncated(response, request))
+        if not response.content.strip() and route.fallback is not None:
+            return self._escalate(route, request)
+        return response
+
+    def _escalate(self, route: Route, request: CompletionRequest) -> AIResponse:
+        escalated = Route(route.fallback, route.score, route.bucket, f"{route.backend} failed")
+        start = time.perf_counter()
+        try:
+            response = get_backend(escalated.backend).complete(request)
+        except AIRequestError:
+            get_router().record(escalated, time.perf_counter() - start, failed=True)
+            raise
+        get_router().record(escalated, time.perf_counter() - start - response.queue_wait,
+                            failed=not response.content.strip(), truncated=_truncated(response, request))
+        return response
+
+    def stream(self, request: CompletionRequest) -> Iterator[str]:
+        route = self._route(request)
+        start = time.perf_counter()
+        chunks = 0
+        try:
+            for chunk in get_backend(route.backend).stream(request):
+                chunks += 1
+                yield chunk
+        except AIRequestError as e:
+            get_router().record(route, time.perf_counter() - start, failed=True)
+            # Once part of the answer is out, it cannot be taken back
+            if chunks or route.fallback is None or e.error_type in NO_ESCALATION_ERRORS:
+                raise
+            yield from get_backend(route.fallback).stream(request)
+            return
+        get_router().record(route, time.perf_counter() - start, failed=not chunks)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    """
+    Returns the shared router, persisting its outcomes to ROUTING_STATS_PATH.
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter(config.ROUTING_STATS_PATH or None)
+            atexit.register(_router.flush)
+        return _router
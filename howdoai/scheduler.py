@@ -0,0 +1,235 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from .api_client import AIRequestError
+from .config import config
+
+PRIORITIES = ("interactive", "normal", "bulk")
+DEFAULT_PRIORITY = "normal"
+DEFAULT_TENANT = "default"
+
+
+@dataclass
+class Ticket:
+    """
+    A request waiting for, or holding, a slot in the scheduler.
+
+    Attributes:
+        priority (str): The priority class: "interactive", "normal" or "bulk".
+        tenant (str): The tenant the request is queued for.
+        enqueued (float): When the request was queued, from time.monotonic.
+        wait (float): Seconds the request spent queued, set when it is granted or shed.
+        state (str): "queued", "granted", "shed" or "released".
+    """
+    priority: str
+    tenant: str
+    enqueued: float
+    wait: float = 0.0
+    state: str = "queued"
+
+
+@dataclass
+class _PriorityMetrics:
+    granted: int = 0
+    shed: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    waits: Deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+
+    def record(self, wait: float) -> None:
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.waits.append(wait)
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def validate_priority(priority: Optional[str]) -> str:
+    """
+    Returns the priority class to use, defaulting to "normal".
+
+    Raises:
+        ValueError: If the priority is not one of PRIORITIES.
+    """
+    if priority is None:
+        return DEFAULT_PRIORITY
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}. Please use one of: {', '.join(PRIORITIES)}")
+    return priority
+
+
+class RequestScheduler:
+    """
+    Grants API request slots by priority, fairly between tenants.
+
+    At most config.MAX_CONCURRENT_REQUESTS requests hold a slot at once. Waiting requests
+    are served strictly by priority class, and within a class round-robin between tenants,
+    so one tenant's large job cannot hold up another's requests. Normal and bulk requests
+    leave config.SCHEDULER_RESERVED_INTERACTIVE_SLOTS slots free, so an interactive request
+    never waits for a bulk request to finish. When config.SCHEDULER_MAX_QUEUE_DEPTH requests
+    are already waiting, the newest request of the heaviest tenant in the lowest waiting
+    class is shed to make room, or the arriving request itself if nothing lower is waiting.
+
+    Settings are read on every acquire, so a configuration reload takes effect without a restart.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._active: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._queues: Dict[str, "OrderedDict[str, Deque[Ticket]]"] = {priority: OrderedDict() for priority in PRIORITIES}
+        self._metrics: Dict[str, _PriorityMetrics] = {priority: _PriorityMetrics() for priority in PRIORITIES}
+
+    def _queued(self, priority: Optional[str] = None) -> int:
+        priorities = PRIORITIES if priority is None else (priority,)
+        return sum(len(tickets) for p in priorities for tickets in self._queues[p].values())
+
+    def _shed_one(self, below: str) -> bool:
+        for priority in reversed(PRIORITIES[PRIORITIES.index(below) + 1:]):
+            queues = self._queues[priority]
+            if not queues:
+                continue
+            tenant = max(queues, key=lambda t: len(queues[t]))
+            ticket = queues[tenant].pop()
+            if not queues[tenant]:
+                del queues[tenant]
+            self._finish_waiting(ticket, "shed")
+            self._condition.notify_all()
+            return True
+        return False
+
+    def _finish_waiting(self, ticket: Ticket, state: str) -> None:
+        ticket.wait = time.monotonic() - ticket.enqueued
+        ticket.state = state
+        metrics = self._metrics[ticket.priority]
+        if state == "granted":
+            metrics.record(ticket.wait)
+        else:
+            metrics.shed += 1
+
+    def _dispatch(self) -> None:
+        capacity = max(1, config.MAX_CONCURRENT_REQUESTS)
+        shared_capacity = max(1, capacity - max(0, config.SCHEDULER_RESERVED_INTERACTIVE_SLOTS))
+        granted = False
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            limit = capacity if priority == "interactive" else shared_capacity
+            while queues and sum(self._active.values()) < limit:
+                tenant, tickets = next(iter(queues.items()))
+                ticket = tickets.popleft()
+                # Round-robin: the tenant goes to the back of the line
+                del queues[tenant]
+                if tickets:
+                    queues[tenant] = tickets
+                self._active[priority] += 1
+                self._finish_waiting(ticket, "granted")
+                granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def acquire(self, priority: Optional[str] = None, tenant: Optional[str] = None) -> Ticket:
+        """
+        Waits for a request slot.
+
+        Args:
+            priority (Optional[str]): The priority class. Defaults to "normal".
+            tenant (Optional[str]): The tenant to queue the request for. Defaults to "default".
+
+        Returns:
+            Ticket: The granted ticket, to be passed to release.
+
+        Raises:
+            AIRequestError: If the request was shed because the queue is full.
+        """
+        ticket = Ticket(validate_priority(priority), tenant or DEFAULT_TENANT, time.monotonic())
+        with self._condition:
+            if self._queued() >= max(1, config.SCHEDULER_MAX_QUEUE_DEPTH) and not self._shed_one(ticket.priority):
+                self._finish_waiting(ticket, "shed")
+            else:
+                self._queues[ticket.priority].setdefault(ticket.tenant, deque()).append(ticket)
+                self._dispatch()
+                try:
+                    self._condition.wait_for(lambda: ticket.state != "queued")
+                except BaseException:
+                    self._abandon(ticket)
+                    raise
+        if ticket.state == "shed":
+            raise AIRequestError(
+                f"Request shed: too many {ticket.priority} requests are waiting",
+                error_type="overloaded",
+                suggestion="Please retry later, or raise SCHEDULER_MAX_QUEUE_DEPTH"
+            )
+        return ticket
+
+    def _abandon(self, ticket: Ticket) -> None:
+        # The waiting thread was interrupted; make sure the ticket neither waits nor holds a slot
+        if ticket.state == "queued":
+            tickets = self._queues[ticket.priority].get(ticket.tenant)
+            if tickets is not None and ticket in tickets:
+                tickets.remove(ticket)
+                if not tickets:
+                    del self._queues[ticket.priority][ticket.tenant]
+            ticket.state = "released"
+        elif ticket.state == "granted":
+            ticket.state = "released"
+            self._active[ticket.priority] -= 1
+            self._dispatch()
+
+    def release(self, ticket: Ticket) -> None:
+        with self._condition:
+            if ticket.state != "granted":
+                return
+            ticket.state = "released"
+            self._active[ticket.priority] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, tenant: Optional[str] = None) -> Iterator[Ticket]:
+        """
+        Holds a request slot for the duration of a with block.
+        """
+        ticket = self.acquire(priority, tenant)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns queue and wait-time metrics per priority class.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: For each priority: active and queued requests, granted and
+                shed counts, and the mean, p50, p99 and maximum queue wait in seconds (percentiles
+                over the last 1024 granted requests).
+        """
+        with self._condition:
+            return {
+                priority: {
+                    "active": self._active[priority],
+                    "queued": self._queued(priority),
+                    "granted": metrics.granted,
+                    "shed": metrics.shed,
+                    "wait_mean": metrics.total_wait / metrics.granted if metrics.granted else 0.0,
+                    "wait_p50": _percentile(metrics.waits, 0.5),
+                    "wait_p99": _percentile(metrics.waits, 0.99),
+                    "wait_max": metrics.max_wait,
+                }
+                for priority, metrics in self._metrics.items()
+            }
+
+    def reset_stats(self) -> None:
+        with self._condition:
+            self._metrics = {priority: _PriorityMetrics() for priority in PRIORITIES}
+
+
+request_scheduler = RequestScheduler()
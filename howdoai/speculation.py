@@ -0,0 +1,250 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
+from .api_client import AIRequestError
+from .config import config
+from .questionanswerer import QuestionAnswerer
+
+
+def strip_numbering(question: str) -> str:
+    """
+    Removes list numbering such as "1. " that generated follow-up questions carry.
+    """
+    return re.sub(r"^\s*(?:\d+[.)]|[-*])\s*", "", question).strip()
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a question for cache lookups, ignoring numbering, case and whitespace differences.
+    """
+    return " ".join(strip_numbering(question).lower().split())
+
+
+class AnswerCache:
+    """
+    A small answer cache with a time-to-live, optionally persisted to a JSON file.
+
+    The file lets answers prefetched by one CLI run be used by the next one.
+
+    Args:
+        path (Optional[str]): File to persist entries in. When None, the cache lives in memory only.
+        ttl (float): Seconds an entry stays valid.
+        max_entries (int): Maximum number of entries kept; the oldest are evicted first.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 900.0, max_entries: int = 256):
+        self.path = os.path.expanduser(path) if path else None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    @staticmethod
+    def key(question: str, use_groq: bool, max_tokens: Optional[int]) -> str:
+        return f"{'groq' if use_groq else 'local'}|{max_tokens or ''}|{normalize_question(question)}"
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    def _evict(self, now: float) -> None:
+        expired = [k for k, entry in self._entries.items() if now - entry["created"] > self.ttl]
+        for k in expired:
+            del self._entries[k]
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            for k in sorted(self._entries, key=lambda k: self._entries[k]["created"])[:overflow]:
+                del self._entries[k]
+
+    def get(self, question: str, use_groq: bool = False, max_tokens: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached entry for a question, or None if there is no valid entry.
+        """
+        with self._lock:
+            entry = self._entries.get(self.key(question, use_groq, max_tokens))
+            if entry is None or time.time() - entry["created"] > self.ttl:
+                return None
+            return dict(entry)
+
+    def put(self, question: str, use_groq: bool, max_tokens: Optional[int], entry: Dict[str, Any]) -> None:
+        """
+        Stores an entry for a question and persists the cache if it has a file.
+        """
+        with self._lock:
+            if self.path:
+                # Merge with entries written by other processes since we loaded the file
+                for k, v in self._load().items():
+                    self._entries.setdefault(k, v)
+            now = time.time()
+            self._entries[self.key(question, use_groq, max_tokens)] = dict(entry, created=now)
+            self._evict(now)
+            try:
+                self._save()
+            except OSError:
+                pass
+
+
+class SpeculativePrefetcher:
+    """
+    Precomputes answers to follow-up questions in the background.
+
+    Speculation is kept from competing with real requests: at most max_inflight speculative
+    requests run at a time, at most budget API requests are spent over the prefetcher's
+    lifetime, and speculation stops as soon as the API reports rate limiting.
+
+    Args:
+        cache (AnswerCache): Where prefetched answers are stored.
+        top_n (int): How many follow-up questions to prefetch per answer.
+        max_inflight (int): Maximum number of questions being prefetched at once.
+        budget (int): Maximum number of API requests speculation may make.
+    """
+
+    def __init__(self, cache: AnswerCache, top_n: int = 2, max_inflight: int = 1, budget: int = 6):
+        self.cache = cache
+        self.top_n = top_n
+        self.budget = budget
+        self.paused = False
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_inflight),
+                                            thread_name_prefix="howdoai-speculation")
+        # Only unfinished prefetches are kept, so a long-lived prefetcher does not accumulate them
+        self._futures: Set[Future] = set()
+
+    def _reserve(self, requests: int) -> bool:
+        with self._lock:
+            if self.paused or self.budget < requests:
+                return False
+            self.budget -= requests
+            return True
+
+    def prefetch(self, questions: List[str], use_groq: bool = False, max_tokens: Optional[int] = None) -> List[Future]:
+        """
+        Schedules the top questions for background answering.
+
+        Questions that are already cached or being prefetched are skipped.
+
+        Returns:
+            List[Future]: The futures of the scheduled prefetches.
+        """
+        futures = []
+        for question in questions[:self.top_n]:
+            key = self.cache.key(question, use_groq, max_tokens)
+            with self._lock:
+                if key in self._pending or self.cache.get(question, use_groq, max_tokens) is not None:
+                    continue
+                self._pending.add(key)
+            future = self._executor.submit(self._prefetch_one, question, key, use_groq, max_tokens)
+            with self._lock:
+                self._futures.add(future)
+            future.add_done_callback(self._forget)
+            futures.append(future)
+        return futures
+
+    def _forget(self, future: Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+
+    def _prefetch_one(self, question: str, key: str, use_groq: bool, max_tokens: Optional[int]) -> bool:
+        try:
+            # An answer and its follow-up questions cost two requests
+            if not self._reserve(2):
+                return False
+            # Prefetches must never hold up the questions someone is waiting for
+            questionanswerer = QuestionAnswerer(priority="bulk")
+            query = strip_numbering(question)
+            # One attempt per request, so the budget reserved above is never exceeded
+            try:
+                answer, _ = questionanswerer.generate_answer(query, use_groq, max_tokens, retries=1)
+            except AIRequestError as e:
+                self._pause_if_rate_limited(e)
+                return False
+            try:
+                follow_up_questions = questionanswerer.generate_follow_up_questions(
+                    query, answer, use_groq, max_tokens, retries=1)
+            except AIRequestError as e:
+                self._pause_if_rate_limited(e)
+                follow_up_questions = []
+            response = questionanswerer.answer_response
+            self.cache.put(question, use_groq, max_tokens, {
+                "answer": answer,
+                "follow_up_questions": follow_up_questions,
+                "model": response.model,
+                "endpoint": response.endpoint,
+                "backend": response.backend,
+                "usage": questionanswerer.usage,
+            })
+            return True
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _pause_if_rate_limited(self, error: AIRequestError) -> None:
+        if error.error_type == "rate_limit" or error.status_code == 429:
+            self.paused = True
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits for scheduled prefetches to finish, up to timeout seconds in total.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                future.result(timeout=remaining)
+            except Exception:
+                pass
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_cache = None
+_prefetcher = None
+_singleton_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Returns the shared answer cache configured by the CACHE_* settings.
+    """
+    global _cache
+    with _singleton_lock:
+        if _cache is None:
+            _cache = AnswerCache(config.CACHE_PATH or None, config.CACHE_TTL, config.CACHE_MAX_ENTRIES)
+        return _cache
+
+
+def get_prefetcher() -> SpeculativePrefetcher:
+    """
+    Returns the shared prefetcher configured by the SPECULATION_* settings.
+    """
+    global _prefetcher
+    cache = get_answer_cache()
+    with _singleton_lock:
+        if _prefetcher is None:
+            _prefetcher = SpeculativePrefetcher(cache, config.SPECULATION_TOP_N,
+                                                config.SPECULATION_MAX_INFLIGHT, config.SPECULATION_BUDGET)
+        return _prefetcher
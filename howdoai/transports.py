@@ -0,0 +1,278 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from .api_client import AIRequestError
+from .config import Configuration
+
+
+class Transport(ABC):
+    """
+    Sends HTTP requests for the OpenAI-compatible backends.
+
+    Transports return objects with the parts of the ``requests.Response`` interface the
+    backends use (status_code, headers, json, raise_for_status and iter_lines) and raise
+    ``requests`` exceptions, so the backends' retry and error handling work unchanged. A transport
+    that cannot work with the current setup raises an AIRequestError with error_type
+    "configuration_error" instead, which is not retried.
+    """
+
+    name = "transport"
+
+    @abstractmethod
+    def post(self, url: str, headers: Dict[str, str], payload: Dict[str, Any], settings: Configuration,
+             stream: bool = False):
+        """
+        Sends a POST request with a JSON body.
+
+        Args:
+            url (str): The URL to post to.
+            headers (Dict[str, str]): The request headers.
+            payload (Dict[str, Any]): The JSON body.
+            settings (Configuration): The configuration snapshot for this request.
+            stream (bool): Whether the response body will be read incrementally with iter_lines.
+                The caller must then close the response.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    HTTP/1.1 with ``requests``, one connection per concurrent request.
+    """
+
+    name = "requests"
+
+    def post(self, url, headers, payload, settings, stream=False):
+        kwargs = {"stream": True} if stream else {}
+        return requests.post(
+            url,
+            headers=headers,
+            json=payload,
+            timeout=(settings.CONNECT_TIMEOUT, settings.READ_TIMEOUT),
+            **kwargs
+        )
+
+
+class _HttpxResponse:
+    """
+    Adapts an httpx response to the subset of the requests.Response interface the backends use.
+    """
+
+    def __init__(self, response, on_close: Optional[Callable[[], None]] = None):
+        self._response = response
+        self._on_close = on_close
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    def json(self):
+        return self._response.json()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} Error for url: {self._response.url}", response=self)
+
+    def iter_lines(self, decode_unicode: bool = True):
+        try:
+            for line in self._response.iter_lines():
+                yield line
+        except Exception as e:
+            raise _to_requests_exception(e)
+
+    def close(self):
+        try:
+            self._response.close()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+def _to_requests_exception(e: Exception) -> Exception:
+    import httpx
+
+    if isinstance(e, httpx.TimeoutException):
+        return requests.exceptions.Timeout(str(e))
+    if isinstance(e, (httpx.ConnectError, httpx.RemoteProtocolError, httpx.NetworkError)):
+        return requests.exceptions.ConnectionError(str(e))
+    return e
+
+
+class _ClientGeneration:
+    """
+    The http2 transport's clients, one per connection, with the requests in flight on each.
+
+    A generation is closed once it is replaced and no request uses it.
+    """
+
+    def __init__(self, clients: List[Any], streams: int):
+        self.clients = clients
+        self.streams = streams
+        self.in_flight = [0] * len(clients)
+        self.retired = False
+
+    def close(self) -> None:
+        for client in self.clients:
+            client.close()
+
+
+class Http2Transport(Transport):
+    """
+    HTTP/2 with ``httpx``, multiplexing concurrent requests over a few connections.
+
+    The transport keeps HTTP2_MAX_CONNECTIONS clients of one connection each and sends every
+    request on the least busy one, with at most HTTP2_MAX_STREAMS_PER_CONNECTION requests in
+    flight on each; further requests wait for a stream to free up. Plain ``http://``
+    endpoints are only spoken to over HTTP/2 with HTTP2_PRIOR_KNOWLEDGE, which suits local
+    servers known to support it. Requires the optional ``httpx[http2]`` package.
+    """
+
+    name = "http2"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stream_freed = threading.Condition(self._lock)
+        self._generation: Optional[_ClientGeneration] = None
+        self._client_key: Optional[Tuple[int, int, bool]] = None
+
+    def _retire(self, generation: _ClientGeneration) -> None:
+        # Called with the lock held; requests still using the clients close them when they finish
+        generation.retired = True
+        if not any(generation.in_flight):
+            generation.close()
+
+    def _release(self, generation: _ClientGeneration, index: int) -> None:
+        with self._lock:
+            generation.in_flight[index] -= 1
+            if generation.retired and not any(generation.in_flight):
+                generation.close()
+            self._stream_freed.notify()
+
+    def _current_generation(self, httpx, settings: Configuration) -> _ClientGeneration:
+        # Called with the lock held
+        key = (settings.HTTP2_MAX_CONNECTIONS, settings.HTTP2_MAX_STREAMS_PER_CONNECTION,
+               settings.HTTP2_PRIOR_KNOWLEDGE)
+        if self._generation is None or self._client_key != key:
+            if self._generation is not None:
+                self._retire(self._generation)
+                # Requests waiting on the old clients can use the new ones
+                self._stream_freed.notify_all()
+            clients = [
+                httpx.Client(
+                    http1=not settings.HTTP2_PRIOR_KNOWLEDGE,
+                    http2=True,
+                    limits=httpx.Limits(max_connections=1, max_keepalive_connections=1)
+                )
+                for _ in range(max(1, settings.HTTP2_MAX_CONNECTIONS))
+            ]
+            self._generation = _ClientGeneration(clients, max(1, settings.HTTP2_MAX_STREAMS_PER_CONNECTION))
+            self._client_key = key
+        return self._generation
+
+    def _acquire(self, settings: Configuration) -> Tuple[_ClientGeneration, int]:
+        try:
+            import httpx
+        except ImportError:
+            raise AIRequestError(
+                "The http2 transport requires the httpx package",
+                error_type="configuration_error",
+                suggestion="Please install it with: pip install 'httpx[http2]'"
+            )
+        with self._lock:
+            while True:
+                generation = self._current_generation(httpx, settings)
+                index = min(range(len(generation.clients)), key=generation.in_flight.__getitem__)
+                if generation.in_flight[index] < generation.streams:
+                    generation.in_flight[index] += 1
+                    return generation, index
+                self._stream_freed.wait()
+
+    def post(self, url, headers, payload, settings, stream=False):
+        generation, index = self._acquire(settings)
+        client = generation.clients[index]
+
+        def finish():
+            self._release(generation, index)
+
+        try:
+            import httpx
+
+            timeout = httpx.Timeout(settings.READ_TIMEOUT, connect=settings.CONNECT_TIMEOUT)
+            request = client.build_request("POST", url, headers=headers, json=payload, timeout=timeout)
+            response = client.send(request, stream=stream)
+        except Exception as e:
+            finish()
+            raise _to_requests_exception(e)
+        if stream:
+            return _HttpxResponse(response, on_close=finish)
+        try:
+            response.read()
+        except Exception as e:
+            raise _to_requests_exception(e)
+        finally:
+            response.close()
+            finish()
+        return _HttpxResponse(response)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._generation is not None:
+                self._retire(self._generation)
+                self._generation = None
+                self._client_key = None
+                self._stream_freed.notify_all()
+
+
+def _recording_transport() -> Transport:
+    from .cassettes import RecordingTransport
+    return RecordingTransport()
+
+
+def _replay_transport() -> Transport:
+    from .cassettes import ReplayTransport
+    return ReplayTransport()
+
+
+_transports: Dict[str, Callable[[], Transport]] = {
+    RequestsTransport.name: RequestsTransport,
+    Http2Transport.name: Http2Transport,
+    "record": _recording_transport,
+    "replay": _replay_transport,
+}
+_instances: Dict[str, Transport] = {}
+_lock = threading.Lock()
+
+
+def register_transport(name: str, factory: Callable[[], Transport]) -> None:
+    """
+    Registers a transport factory under a name usable with the TRANSPORT setting.
+    """
+    with _lock:
+        _transports[name] = factory
+        old = _instances.pop(name, None)
+    if old is not None:
+        old.close()
+
+
+def transport_names():
+    return sorted(_transports)
+
+
+def get_transport(name: str) -> Transport:
+    """
+    Returns the transport with the given name, creating it on first use.
+
+    Raises:
+        ValueError: If no transport is registered under the name.
+    """
+    with _lock:
+        if name not in _instances:
+            if name not in _transports:
+                raise ValueError(f"Unknown transport: {name}. Please use one of: {', '.join(sorted(_transports))}")
+            _instances[name] = _transports[name]()
+        return _instances[name]
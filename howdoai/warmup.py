@@ -0,0 +1,182 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import requests
+
+from .api_client import AIRequestError, call_ai_api
+from .config import Configuration, config
+
+PRIME_PROMPT = "Reply with OK."
+POLL_INTERVAL = 0.5
+
+
+def models_url(chat_url: str) -> str:
+    """
+    Derives the model listing URL (``.../v1/models``) from a chat completions URL.
+    """
+    base = chat_url.rstrip("/")
+    for suffix in ("/chat/completions", "/completions"):
+        if base.endswith(suffix):
+            return base[:-len(suffix)] + "/models"
+    return base + "/models"
+
+
+@dataclass
+class WarmupResult:
+    """
+    The outcome of warming up the local endpoint.
+
+    Attributes:
+        ready (bool): Whether the server answered the model listing and the primed request.
+        models (List[str]): The model ids the server listed.
+        model_listed (bool): Whether LOCAL_MODEL was among the listed models.
+        readiness_time (float): Seconds until the model listing answered.
+        prime_time (float): Seconds the primed request took, which includes any model load.
+        total (float): Seconds the whole warm-up took.
+        error (Optional[str]): Why the warm-up failed, if it did.
+    """
+    ready: bool
+    models: List[str] = field(default_factory=list)
+    model_listed: bool = False
+    readiness_time: float = 0.0
+    prime_time: float = 0.0
+    total: float = 0.0
+    error: Optional[str] = None
+
+
+def wait_until_ready(settings: Configuration, timeout: Optional[float] = None) -> List[str]:
+    """
+    Polls the model listing of the local endpoint until it answers.
+
+    Args:
+        settings (Configuration): The configuration to take LOCAL_API_URL and timeouts from.
+        timeout (Optional[float]): Seconds to keep polling. Defaults to settings.WARMUP_TIMEOUT.
+
+    Returns:
+        List[str]: The listed model ids.
+
+    Raises:
+        AIRequestError: If the endpoint does not answer within the timeout.
+    """
+    url = models_url(settings.LOCAL_API_URL)
+    deadline = time.monotonic() + (settings.WARMUP_TIMEOUT if timeout is None else timeout)
+    while True:
+        try:
+            response = requests.get(url, timeout=(settings.CONNECT_TIMEOUT, settings.READ_TIMEOUT))
+            response.raise_for_status()
+            return [model.get("id") for model in response.json().get("data", []) if model.get("id")]
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if time.monotonic() + POLL_INTERVAL >= deadline:
+                raise AIRequestError(
+                    f"Local endpoint is not ready: {str(e)}",
+                    error_type="connection_error",
+                    suggestion="Please check that the local server is running and LOCAL_API_URL is correct"
+                )
+            time.sleep(POLL_INTERVAL)
+
+
+def prime(max_tokens: int = 1, priority: Optional[str] = None) -> float:
+    """
+    Sends a tiny request to the local endpoint so the model is loaded and the system prompt is cached.
+
+    Args:
+        max_tokens (int): The number of tokens to generate.
+        priority (Optional[str]): The request scheduler priority. Defaults to "normal".
+
+    Returns:
+        float: Seconds the request took.
+
+    Raises:
+        AIRequestError: If the request fails.
+    """
+    start = time.perf_counter()
+    call_ai_api(PRIME_PROMPT, max_tokens=max_tokens, retries=1, backend="local", priority=priority)
+    return time.perf_counter() - start
+
+
+def warm_up(timeout: Optional[float] = None) -> WarmupResult:
+    """
+    Waits for the local endpoint to list its models, then primes it with a tiny request.
+
+    Never raises; failures are reported in the result so callers can carry on cold.
+
+    Args:
+        timeout (Optional[float]): Seconds to wait for readiness. Defaults to config.WARMUP_TIMEOUT.
+
+    Returns:
+        WarmupResult: The readiness and latency of the warm-up.
+    """
+    settings = config.snapshot()
+    start = time.perf_counter()
+    result = WarmupResult(ready=False)
+    try:
+        result.models = wait_until_ready(settings, timeout)
+        result.readiness_time = time.perf_counter() - start
+        result.model_listed = settings.LOCAL_MODEL in result.models
+        result.prime_time = prime()
+        result.ready = True
+    except AIRequestError as e:
+        result.error = str(e)
+    result.total = time.perf_counter() - start
+    return result
+
+
+_warm_up_result = None
+_warm_up_lock = threading.Lock()
+
+
+def warm_up_once() -> Optional[WarmupResult]:
+    """
+    Warms up the local endpoint the first time it is called in a process.
+
+    Returns:
+        Optional[WarmupResult]: The warm-up result on the first call, None afterwards.
+    """
+    global _warm_up_result
+    with _warm_up_lock:
+        if _warm_up_result is not None:
+            return None
+        _warm_up_result = warm_up()
+        return _warm_up_result
+
+
+class KeepAlive:
+    """
+    Primes the local endpoint periodically so the server does not unload an idle model.
+
+    Args:
+        interval (Optional[float]): Seconds between pings. Defaults to config.KEEP_ALIVE_INTERVAL.
+    """
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval if interval is not None else config.KEEP_ALIVE_INTERVAL
+        self.pings = 0
+        self.failures = 0
+        self.last_latency: Optional[float] = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="howdoai-keep-alive", daemon=True)
+
+    def start(self) -> "KeepAlive":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.last_latency = prime(priority="bulk")
+                self.pings += 1
+            except AIRequestError:
+                self.failures += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(self.interval + 1)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -12,6 +12,10 @@ setup(
            'rich',
            'python-dotenv'
        ],
+       extras_require={
+           'http2': ['httpx[http2]'],
+           'bench': ['httpx[http2]', 'hypercorn', 'pytest-benchmark'],
+       },
        entry_points={
            'console_scripts': [
                'howdoai = howdoai:main_cli',
@@ -1,8 +1,29 @@
+import os
+
+# Keep test runs out of the user's answer history
+os.environ.setdefault("HOWDOAI_HISTORY_ENABLED", "false")
+os.environ.setdefault("HOWDOAI_ROUTING_STATS_PATH", "")
+
 from rich.console import Console
-from howdoai.progressbarmanager import ProgressBarManager
-from howdoai.questionanswerer import QuestionAnswerer
+from howdoai.progressbarmanager import (
+    CallbackProgressManager, NullProgressManager, ProgressBarManager, create_progress_manager)
+from howdoai.questionanswerer import QuestionAnswerer, extract_code
 from howdoai.api_client import call_ai_api, AIResponse, AIRequestError
 from howdoai import main, main_cli
+from howdoai.output import build_record, format_records
+from howdoai.batching import build_batch_prompt, pack_questions, split_batch_answer
+from howdoai.backends import Backend, CompletionRequest, LlamaCppBackend, StubBackend, get_backend, register_backend
+from howdoai.api_client import acall_ai_api, stream_ai_api
+from howdoai.transports import Http2Transport, register_transport
+from howdoai.history import HistoryStore
+from howdoai.profiling import ProfileOptions, Profiler, collapsed_stacks, network_timer
+from howdoai import warmup
+from howdoai.cassettes import Cassette
+from howdoai.scheduler import RequestScheduler
+from howdoai.routing import ModelRouter, Route, score_query
+from howdoai.warmup import KeepAlive, models_url, warm_up
+from howdoai.speculation import AnswerCache, SpeculativePrefetcher
+from howdoai.config import Configuration, ConfigWatcher, config, parse_overrides
 import requests
 import unittest
 from unittest.mock import patch, MagicMock, call
@@ -10,6 +31,12 @@ from io import StringIO
 import sys
 import os
 import re
+import json
+import tempfile
+import pstats
+import asyncio
+import threading
+import time
 
 # Add the parent directory to sys.path to allow imports from the howdoai package
 sys.path.insert(0, os.path.abspath(
@@ -137,9 +164,10 @@ class TestHowDoAICLI(unittest.TestCase):
 
     @patch('sys.argv', ['howdoai'])
     @patch('sys.stdout', new_callable=StringIO)
-    @patch('sys.exit')
+    @patch('sys.exit', side_effect=SystemExit)
     def test_cli_no_query(self, mock_exit, mock_stdout):
-        main_cli()
+        with self.assertRaises(SystemExit):
+            main_cli()
 
         output = mock_stdout.getvalue()
         self.assertIn("usage:", output)
@@ -167,7 +195,7 @@ class TestHelperFunctions(unittest.TestCase):
         self.assertEqual(questionanswerer.format_response(
             input_text, max_words=5), expected_output)
 
-    @patch('howdoai.api_client.requests.post')
+    @patch('howdoai.transports.requests.post')
     def test_call_ai_api_success(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -178,7 +206,7 @@ class TestHelperFunctions(unittest.TestCase):
         result = call_ai_api("Test query")
         self.assertEqual(result, AIResponse(content="Test response"))
 
-    @patch('howdoai.api_client.requests.post')
+    @patch('howdoai.transports.requests.post')
     def test_call_ai_api_failure(self, mock_post):
         mock_post.side_effect = requests.exceptions.RequestException(
             "API error")
@@ -186,7 +214,7 @@ class TestHelperFunctions(unittest.TestCase):
         with self.assertRaises(AIRequestError):
             call_ai_api("Test query")
 
-    @patch('howdoai.api_client.requests.post')
+    @patch('howdoai.transports.requests.post')
     def test_call_ai_api_empty_query(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -301,9 +329,10 @@ class TestMainCLI(unittest.TestCase):
 
     @patch('sys.argv', ['howdoai'])
     @patch('sys.stdout', new_callable=StringIO)
-    @patch('sys.exit')
+    @patch('sys.exit', side_effect=SystemExit)
     def test_cli_no_query(self, mock_exit, mock_stdout):
-        main_cli()
+        with self.assertRaises(SystemExit):
+            main_cli()
         output = mock_stdout.getvalue()
         self.assertIn("usage:", output)
         self.assertIn("howdoai", output)
@@ -311,7 +340,7 @@ class TestMainCLI(unittest.TestCase):
 
 
 class TestHowDoAIGroq(unittest.TestCase):
-    @patch('howdoai.api_client.requests.post')
+    @patch('howdoai.transports.requests.post')
     def test_call_ai_api_local(self, mock_post):
         """
         Test case for calling the AI API locally.
@@ -339,7 +368,7 @@ class TestHowDoAIGroq(unittest.TestCase):
         self.assertEqual(args[0], "http://localhost:1234/v1/chat/completions")
         self.assertNotIn('Authorization', kwargs['headers'])
 
-    @patch('howdoai.api_client.requests.post')
+    @patch('howdoai.transports.requests.post')
     def test_call_ai_api_groq(self, mock_post):
         """
         Test case for calling the AI API with Groq.
@@ -390,7 +419,7 @@ class TestHowDoAIGroq(unittest.TestCase):
         self.assertIn("Question 1?", output_cleaned)
         self.assertIn("Using Groq API endpoint", output_cleaned)
 
-        mock_main.assert_called_once_with("test query", None, True, None)
+        mock_main.assert_called_once_with("test query", None, True, None, quiet=None, offline=False, code_only=False)
 
 
 class TestHowDoAIMaxTokens(unittest.TestCase):
@@ -431,7 +460,7 @@ class TestHowDoAIMaxTokens(unittest.TestCase):
 
         self.assertEqual(mock_main.call_count, 1)
         self.assertEqual(mock_main.call_args, call(
-            'test query', None, False, 20))
+            'test query', None, False, 20, quiet=None, offline=False, code_only=False))
 
     @patch('howdoai.main')  # Mock the main function
     def test_cli_argument_parsing(self, mock_main):
@@ -447,7 +476,1160 @@ class TestHowDoAIMaxTokens(unittest.TestCase):
             main_cli()
 
         # Verify that the main function was called with the correct arguments
-        mock_main.assert_called_once_with('test query', None, False, 20)
+        mock_main.assert_called_once_with('test query', None, False, 20, quiet=None, offline=False, code_only=False)
+
+
+class TestProgressReporters(unittest.TestCase):
+    def test_create_progress_manager_not_a_terminal(self):
+        console = Console(file=StringIO())
+        self.assertIsInstance(create_progress_manager(console), NullProgressManager)
+
+    def test_create_progress_manager_quiet(self):
+        console = Console(file=StringIO(), force_terminal=True)
+        self.assertIsInstance(create_progress_manager(console, quiet=True), NullProgressManager)
+        self.assertIsInstance(create_progress_manager(console), ProgressBarManager)
+
+    def test_question_answerer_defaults_to_null_progress(self):
+        self.assertIsInstance(QuestionAnswerer().progress_manager, NullProgressManager)
+
+    @patch('howdoai.progressbarmanager.ProgressBarManager')
+    def test_main_defaults_to_quiet_on_a_terminal(self, mock_progress_bar):
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+        config.BACKEND = "stub"
+
+        with patch('howdoai.console', Console(file=StringIO(), force_terminal=True)):
+            main("how to list files")
+
+        mock_progress_bar.assert_not_called()
+
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_callback_progress_manager(self, mock_call_ai_api):
+        mock_call_ai_api.return_value = AIResponse(content="Use tar -cvf.")
+        events = []
+        progress = CallbackProgressManager(lambda *event: events.append(event))
+
+        result = main("how to create a tar archive", progress_manager=progress)
+
+        self.assertEqual(result["answer"], "Use tar -cvf.")
+        self.assertEqual(events[0], ("start", 1, 0.0, "Generating answer..."))
+        self.assertIn(("complete", 1, 100.0, "[green]Answer generated"), events)
+
+    @patch('sys.argv', ['howdoai', '--quiet', 'test query'])
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('howdoai.main')
+    def test_cli_quiet(self, mock_main, mock_stdout):
+        mock_main.return_value = {
+            "answer": "Answer",
+            "follow_up_questions": [],
+            "execution_time": "0.00 seconds",
+        }
+        main_cli()
+        mock_main.assert_called_once_with('test query', None, False, None, quiet=True, offline=False, code_only=False)
+
+
+class TestMachineReadableOutput(unittest.TestCase):
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_main_reports_typed_metrics(self, mock_call_ai_api):
+        mock_call_ai_api.return_value = AIResponse(
+            content="Use tar -cvf.", model="test-model", endpoint="http://test",
+            usage={"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15})
+
+        result = main("how to create a tar archive", quiet=True)
+
+        self.assertEqual(result["model"], "test-model")
+        self.assertEqual(result["endpoint"], "http://test")
+        self.assertEqual(result["usage"], {"prompt_tokens": 20, "completion_tokens": 10, "total_tokens": 30})
+        self.assertEqual(set(result["timings"]), {"answer", "format", "follow_up", "queue_wait", "total"})
+        self.assertFalse(result["cached"])
+
+    def test_build_record_error(self):
+        record = build_record("q", {
+            "answer": "Error: Request timed out",
+            "follow_up_questions": [],
+            "execution_time": "0.10 seconds",
+            "max_tokens": "DEFAULT_MAX_TOKENS",
+            "error": "Request timed out",
+            "error_type": "timeout",
+        })
+        self.assertIsNone(record["answer"])
+        self.assertEqual(record["error_type"], "timeout")
+        self.assertIsInstance(record["max_tokens"], int)
+        self.assertEqual(record["usage"]["total_tokens"], 0)
+
+    def test_format_ndjson(self):
+        output = format_records([{"a": 1}, {"a": 2}], "ndjson")
+        self.assertEqual(output, '{"a":1}\n{"a":2}\n')
+
+    @patch('sys.argv', ['howdoai', '--output', 'json', 'test query'])
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('howdoai.main')
+    def test_cli_json_output(self, mock_main, mock_stdout):
+        mock_main.return_value = {
+            "answer": "Answer",
+            "follow_up_questions": ["Question 1?"],
+            "execution_time": "0.50 seconds",
+            "max_tokens": 20,
+            "timings": {"answer": 0.4, "total": 0.5},
+        }
+        main_cli()
+
+        record = json.loads(mock_stdout.getvalue())
+        self.assertEqual(record["answer"], "Answer")
+        self.assertEqual(record["timings"]["total"], 0.5)
+        self.assertEqual(record["max_tokens"], 20)
+        mock_main.assert_called_once_with('test query', None, False, None, quiet=True, offline=False, code_only=False)
+
+
+class TestLayeredConfiguration(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.config_file = os.path.join(self.tmpdir.name, "config.toml")
+        with open(self.config_file, "w") as f:
+            f.write('read_timeout = 60\nlocal_model = "file-model"\nmax_retries = 5\n')
+
+    def test_layers_in_order(self):
+        environ = {"HOWDOAI_MAX_RETRIES": "2", "GROQ_API_KEY": "env-key"}
+        loaded = Configuration.load(self.config_file, {"LOCAL_MODEL": "cli-model"}, environ=environ)
+
+        self.assertEqual(loaded.READ_TIMEOUT, 60.0)
+        self.assertIsInstance(loaded.READ_TIMEOUT, float)
+        self.assertEqual(loaded.MAX_RETRIES, 2)
+        self.assertEqual(loaded.LOCAL_MODEL, "cli-model")
+        self.assertEqual(loaded.GROQ_API_KEY, "env-key")
+        self.assertEqual(loaded.GROQ_MODEL, Configuration.GROQ_MODEL)
+
+    def test_invalid_values(self):
+        with self.assertRaises(ValueError):
+            Configuration.load(overrides={"MAX_RETRIES": "many"}, environ={}, use_default_file=False)
+        with self.assertRaises(ValueError):
+            Configuration.load(overrides={"NO_SUCH_SETTING": "1"}, environ={}, use_default_file=False)
+        with self.assertRaises(ValueError):
+            parse_overrides(["read_timeout"])
+
+    @patch.dict(os.environ, {"HOWDOAI_MAX_RETRIES": "abc", "GROQ_API_KEY": "secret", "HOWDOAI_READ_TIMEOUT": "45"})
+    def test_invalid_environment_falls_back_at_import(self):
+        config_module = sys.modules["howdoai.config"]
+
+        with self.assertLogs("howdoai.config", level="WARNING"):
+            loaded = config_module._load_at_import()
+
+        self.assertEqual(loaded.MAX_RETRIES, Configuration.MAX_RETRIES)
+        self.assertEqual(loaded.GROQ_API_KEY, "secret")
+        self.assertEqual(loaded.READ_TIMEOUT, 45.0)
+
+    @patch.dict(os.environ, {"HOWDOAI_MAX_RETRIES": "abc"})
+    @patch('sys.argv', ['howdoai', 'how to list files'])
+    @patch('sys.stderr', new_callable=StringIO)
+    def test_cli_reports_invalid_environment(self, mock_stderr):
+        with self.assertRaises(SystemExit) as context:
+            main_cli()
+
+        self.assertEqual(context.exception.code, 2)
+        self.assertIn("HOWDOAI_MAX_RETRIES", mock_stderr.getvalue())
+
+    def test_watcher_reloads_in_place(self):
+        loaded = Configuration.load(self.config_file, {"LOCAL_MODEL": "cli-model"}, environ={})
+        snapshot = loaded.snapshot()
+        watcher = ConfigWatcher(loaded)
+        with open(self.config_file, "w") as f:
+            f.write('read_timeout = 5\n')
+        os.utime(self.config_file, (0, watcher._mtime + 10))
+
+        self.assertTrue(watcher.check())
+        self.assertEqual(loaded.READ_TIMEOUT, 5.0)
+        self.assertEqual(loaded.LOCAL_MODEL, "cli-model")
+        self.assertEqual(snapshot.READ_TIMEOUT, 60.0)
+
+    def test_watcher_keeps_config_on_invalid_file(self):
+        loaded = Configuration.load(self.config_file, environ={})
+        watcher = ConfigWatcher(loaded)
+        with open(self.config_file, "w") as f:
+            f.write('read_timeout = "soon"\n')
+        os.utime(self.config_file, (0, watcher._mtime + 10))
+
+        self.assertFalse(watcher.check())
+        self.assertIsInstance(watcher.last_error, ValueError)
+        self.assertEqual(loaded.READ_TIMEOUT, 60.0)
+
+    @patch('howdoai.transports.requests.post')
+    def test_call_ai_api_reads_live_config(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"choices": [{"message": {"content": "ok"}}]}
+        mock_post.return_value = mock_response
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+
+        config.update_from(Configuration.load(
+            overrides={"READ_TIMEOUT": "45", "LOCAL_MODEL": "other-model"}, environ={}, use_default_file=False))
+        call_ai_api("Test query")
+
+        kwargs = mock_post.call_args[1]
+        self.assertEqual(kwargs['timeout'], (Configuration.CONNECT_TIMEOUT, 45.0))
+        self.assertEqual(kwargs['json']['model'], "other-model")
+
+
+class TestMultiQuestion(unittest.TestCase):
+    def test_pack_questions_respects_budget(self):
+        questions = ["how to list files?", "how to copy files?", "how to move files?"]
+        self.assertEqual(pack_questions(questions, 100, 1000, 8), [[0, 1, 2]])
+        self.assertEqual(pack_questions(questions, 100, 250, 8), [[0, 1], [2]])
+        self.assertEqual(pack_questions(questions, 100, 1000, 1), [[0], [1], [2]])
+        self.assertEqual(pack_questions(questions, 5000, 1000, 8), [[0], [1], [2]])
+
+    def test_split_batch_answer(self):
+        text = "### ANSWER 1\nUse `ls`.\n### ANSWER 2\nQuestion: how to copy files?\nUse `cp`."
+        self.assertEqual(split_batch_answer(text, 2), ["Use `ls`.", "Use `cp`."])
+        with self.assertRaises(ValueError):
+            split_batch_answer("### ANSWER 1\nUse `ls`.", 2)
+        with self.assertRaises(ValueError):
+            split_batch_answer("Use `ls` and `cp`.", 2)
+
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_main_packs_questions_into_one_request(self, mock_call_ai_api):
+        mock_call_ai_api.return_value = AIResponse(content="### ANSWER 1\nUse `ls`.\n### ANSWER 2\nUse `cp`.")
+
+        results = main(["how to list files?", "how to copy files?"], max_tokens=50, quiet=True)
+
+        mock_call_ai_api.assert_called_once_with(
+            build_batch_prompt(["how to list files?", "how to copy files?"]), False, 100,
+            priority="interactive", tenant=None)
+        self.assertEqual([r["answer"] for r in results], ["Use `ls`.", "Use `cp`."])
+        self.assertEqual(results[0]["follow_up_questions"], [])
+
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_shared_request_usage_is_split(self, mock_call_ai_api):
+        mock_call_ai_api.return_value = AIResponse(
+            content="### ANSWER 1\nUse `ls`.\n### ANSWER 2\nUse `cp`.",
+            usage={"prompt_tokens": 41, "completion_tokens": 20, "total_tokens": 61})
+
+        results = main(["how to list files?", "how to copy files?"], quiet=True)
+
+        self.assertEqual(sum(r["usage"]["total_tokens"] for r in results), 61)
+        self.assertEqual([r["usage"]["prompt_tokens"] for r in results], [21, 20])
+        self.assertEqual(build_record("how to list files?", results[0])["usage_shared_by"], 2)
+
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_main_falls_back_to_individual_requests(self, mock_call_ai_api):
+        mock_call_ai_api.side_effect = [
+            AIResponse(content="Use `ls` and `cp`."),
+            AIResponse(content="Use `ls`."),
+            AIRequestError("Request timed out", error_type="timeout"),
+        ]
+
+        results = main(["how to list files?", "how to copy files?"], quiet=True)
+
+        self.assertEqual(mock_call_ai_api.call_count, 3)
+        self.assertEqual(results[0]["answer"], "Use `ls`.")
+        self.assertEqual(results[1]["error_type"], "timeout")
+
+    @patch('sys.argv', ['howdoai', '--output', 'ndjson', 'first?', '--ask', 'second?'])
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('howdoai.main')
+    def test_cli_multiple_questions(self, mock_main, mock_stdout):
+        mock_main.return_value = [
+            {"answer": "One", "follow_up_questions": [], "execution_time": "0.10 seconds"},
+            {"answer": "Two", "follow_up_questions": [], "execution_time": "0.10 seconds"},
+        ]
+        main_cli()
+
+        lines = mock_stdout.getvalue().splitlines()
+        self.assertEqual([json.loads(line)["query"] for line in lines], ["first?", "second?"])
+        mock_main.assert_called_once_with(['first?', 'second?'], None, False, None, quiet=True, offline=False, code_only=False)
+
+    @patch('sys.argv', ['howdoai', '--output', 'ndjson', 'how', 'to', 'tar'])
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('howdoai.main')
+    def test_cli_unquoted_words_are_one_question(self, mock_main, mock_stdout):
+        mock_main.return_value = {"answer": "Use tar.", "follow_up_questions": [], "execution_time": "0.10 seconds"}
+        main_cli()
+
+        self.assertEqual(mock_main.call_args[0][0], "how to tar")
+        self.assertEqual(len(mock_stdout.getvalue().splitlines()), 1)
+
+
+class TestSpeculativePrefetch(unittest.TestCase):
+    def test_answer_cache_ttl_and_normalization(self):
+        cache = AnswerCache(ttl=60)
+        cache.put("1. How do I extract a tar archive?", False, None, {"answer": "tar -xf"})
+
+        self.assertEqual(cache.get("how do i  extract a tar archive?")["answer"], "tar -xf")
+        self.assertIsNone(cache.get("how do i extract a tar archive?", use_groq=True))
+        with patch('howdoai.speculation.time.time', return_value=time.time() + 120):
+            self.assertIsNone(cache.get("how do i extract a tar archive?"))
+
+    def test_answer_cache_persists_and_evicts(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "answers.json")
+            cache = AnswerCache(path, max_entries=2)
+            for question in ("first?", "second?", "third?"):
+                cache.put(question, False, None, {"answer": question})
+
+            reloaded = AnswerCache(path, max_entries=2)
+            self.assertIsNone(reloaded.get("first?"))
+            self.assertEqual(reloaded.get("third?")["answer"], "third?")
+
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_prefetcher_respects_budget(self, mock_call_ai_api):
+        mock_call_ai_api.return_value = AIResponse(content="Answer")
+        cache = AnswerCache()
+        prefetcher = SpeculativePrefetcher(cache, top_n=2, budget=2)
+        self.addCleanup(prefetcher.shutdown)
+
+        prefetcher.prefetch(["1. First?", "2. Second?", "3. Third?"])
+        prefetcher.wait(5)
+
+        self.assertEqual(cache.get("First?")["answer"], "Answer")
+        self.assertIsNone(cache.get("Second?"))
+        self.assertEqual(mock_call_ai_api.call_args_list[0][0][0], "First?")
+        # Finished prefetches are not kept around
+        prefetcher._executor.shutdown(wait=True)
+        self.assertEqual(prefetcher._futures, set())
+
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_prefetcher_pauses_on_rate_limit(self, mock_call_ai_api):
+        mock_call_ai_api.side_effect = AIRequestError("Rate limit exceeded", error_type="rate_limit", status_code=429)
+        prefetcher = SpeculativePrefetcher(AnswerCache(), top_n=1)
+        self.addCleanup(prefetcher.shutdown)
+
+        prefetcher.prefetch(["First?"])
+        prefetcher.wait(5)
+
+        self.assertTrue(prefetcher.paused)
+
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_prefetcher_pauses_on_follow_up_rate_limit(self, mock_call_ai_api):
+        mock_call_ai_api.side_effect = [
+            AIResponse(content="Use `ls`."),
+            AIRequestError("Rate limit exceeded", error_type="rate_limit", status_code=429),
+        ]
+        prefetcher = SpeculativePrefetcher(AnswerCache(), top_n=1)
+        self.addCleanup(prefetcher.shutdown)
+
+        prefetcher.prefetch(["First?"])
+        prefetcher.wait(5)
+
+        self.assertTrue(prefetcher.paused)
+        self.assertEqual([c[1]["retries"] for c in mock_call_ai_api.call_args_list], [1, 1])
+
+    @patch('howdoai.get_prefetcher')
+    @patch('howdoai.get_answer_cache')
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_main_uses_cache_and_prefetches(self, mock_call_ai_api, mock_get_cache, mock_get_prefetcher):
+        cache = AnswerCache()
+        cache.put("How do I extract it?", False, None,
+                  {"answer": "tar -xf archive.tar", "follow_up_questions": ["How do I list it?"]})
+        mock_get_cache.return_value = cache
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+        config.SPECULATION_ENABLED = True
+
+        result = main("how do I extract it?", quiet=True)
+
+        mock_call_ai_api.assert_not_called()
+        self.assertTrue(result["cached"])
+        self.assertEqual(result["answer"], "tar -xf archive.tar")
+        mock_get_prefetcher.return_value.prefetch.assert_called_once_with(["How do I list it?"], False, None)
+
+
+class EchoBackend(Backend):
+    name = "echo"
+
+    def complete(self, request):
+        return AIResponse(content=request.messages[-1]["content"].upper(), backend=self.name)
+
+
+class TestBackends(unittest.TestCase):
+    def test_stub_backend_is_deterministic(self):
+        first = call_ai_api("how to list files", backend="stub")
+        second = call_ai_api("how to list files", backend="stub")
+
+        self.assertEqual(first.content, "Stub answer to: how to list files")
+        self.assertEqual(first, second)
+        self.assertEqual(first.backend, "stub")
+        self.assertEqual(first.usage["completion_tokens"], 7)
+
+    def test_async_and_stream_defaults(self):
+        response = asyncio.run(acall_ai_api("ping", backend="stub"))
+        self.assertEqual(response.content, "Stub answer to: ping")
+        self.assertEqual("".join(stream_ai_api("ping", backend="stub")), "Stub answer to: ping")
+
+    def test_register_and_load_by_module_path(self):
+        register_backend("echo", EchoBackend)
+        self.assertEqual(call_ai_api("hi", backend="echo").content, "HI")
+        self.assertIsInstance(get_backend(f"{__name__}:EchoBackend"), EchoBackend)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(AIRequestError) as context:
+            call_ai_api("hi", backend="no-such-backend")
+        self.assertEqual(context.exception.error_type, "configuration_error")
+        with self.assertRaises(AIRequestError) as context:
+            get_backend(":EchoBackend")
+        self.assertEqual(context.exception.error_type, "configuration_error")
+
+    def test_many_queries_report_their_backend(self):
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+        config.BACKEND = "stub"
+
+        results = main(["how to list files?", "how to copy files?"], quiet=True)
+
+        self.assertEqual([result["backend"] for result in results], ["stub", "stub"])
+
+    @patch('howdoai.transports.requests.post')
+    def test_http_stream(self, mock_post):
+        mock_post.return_value.iter_lines.return_value = [
+            'data: {"choices": [{"delta": {"content": "tar "}}]}',
+            '',
+            'data: {"choices": [{"delta": {"content": "-cvf"}}]}',
+            'data: [DONE]',
+        ]
+        self.assertEqual("".join(stream_ai_api("how to tar")), "tar -cvf")
+        self.assertTrue(mock_post.call_args[1]['stream'])
+        self.assertTrue(mock_post.call_args[1]['json']['stream'])
+
+    @patch('sys.argv', ['howdoai', '--backend', 'stub', '--output', 'json', 'how to list files'])
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_cli_backend(self, mock_stdout):
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+
+        main_cli()
+
+        record = json.loads(mock_stdout.getvalue())
+        self.assertEqual(record["answer"], "Stub answer to: how to list files")
+        self.assertEqual(record["backend"], "stub")
+        self.assertEqual(record["model"], "stub")
+
+
+    def test_llama_cpp_stream_releases_lock_when_abandoned(self):
+        backend = LlamaCppBackend()
+        llama = MagicMock()
+        llama.create_chat_completion.side_effect = lambda **kwargs: iter(
+            [{"choices": [{"delta": {"content": word}}]} for word in ("tar ", "-cvf ", "a.tar")])
+        request = CompletionRequest(messages=[{"role": "user", "content": "tar"}], max_tokens=10,
+                                    temperature=0.0, settings=config.snapshot())
+
+        with patch.object(backend, '_load', return_value=llama):
+            stream = backend.stream(request)
+            self.assertEqual(next(stream), "tar ")
+            stream.close()
+            self.assertTrue(backend._lock.acquire(timeout=5))
+            backend._lock.release()
+
+            llama.create_chat_completion.side_effect = RuntimeError("context overflow")
+            with self.assertRaises(AIRequestError) as context:
+                list(backend.stream(request))
+        self.assertEqual(context.exception.error_type, "unexpected_error")
+
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class TestHttp2Transport(unittest.TestCase):
+    def setUp(self):
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+        config.update_from(Configuration.load(
+            overrides={"TRANSPORT": "http2", "MAX_RETRIES": 1}, environ={}, use_default_file=False))
+        # A fresh transport, so the patched client is picked up
+        register_transport("http2", Http2Transport)
+        self.addCleanup(register_transport, "http2", Http2Transport)
+
+    def mock_client(self, handler):
+        real_client = httpx.Client
+        return patch('httpx.Client', lambda **kwargs: real_client(transport=httpx.MockTransport(handler)))
+
+    def test_call_ai_api_over_http2(self):
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(json.loads(request.content))
+            return httpx.Response(200, json={"choices": [{"message": {"content": "HTTP/2 response"}}]})
+
+        with self.mock_client(handler):
+            result = call_ai_api("Test query")
+
+        self.assertEqual(result.content, "HTTP/2 response")
+        self.assertEqual(requests_seen[0]["messages"][1]["content"], "Test query")
+
+    def test_http_errors_are_mapped(self):
+        with self.mock_client(lambda request: httpx.Response(401, json={})):
+            with self.assertRaises(AIRequestError) as context:
+                call_ai_api("Test query")
+        self.assertEqual(context.exception.status_code, 401)
+        self.assertEqual(context.exception.error_type, "http_error")
+
+    def test_replaced_client_is_closed_after_its_requests(self):
+        transport = Http2Transport()
+        ok = lambda request: httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+        with self.mock_client(ok):
+            streamed = transport.post("https://api.test/v1", {}, {}, config.snapshot(), stream=True)
+            old_client = transport._generation.clients[0]
+            config.HTTP2_MAX_CONNECTIONS = 4
+            transport.post("https://api.test/v1", {}, {}, config.snapshot())
+
+            self.assertFalse(old_client.is_closed)
+            streamed.close()
+            self.assertTrue(old_client.is_closed)
+            transport.close()
+
+    def test_streams_are_capped_per_connection(self):
+        config.HTTP2_MAX_CONNECTIONS = 2
+        config.HTTP2_MAX_STREAMS_PER_CONNECTION = 2
+        transport = Http2Transport()
+        self.addCleanup(transport.close)
+        ok = lambda request: httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+        with self.mock_client(ok):
+            streamed = [transport.post("https://api.test/v1", {}, {}, config.snapshot(), stream=True)
+                        for _ in range(4)]
+            self.assertEqual(transport._generation.in_flight, [2, 2])
+
+            waiting = threading.Thread(target=transport.post, args=("https://api.test/v1", {}, {}, config.snapshot()))
+            waiting.start()
+            waiting.join(0.1)
+            self.assertTrue(waiting.is_alive())
+            streamed[0].close()
+            waiting.join(5)
+            self.assertFalse(waiting.is_alive())
+            for response in streamed[1:]:
+                response.close()
+        self.assertEqual(transport._generation.in_flight, [0, 0])
+
+    @patch.dict('sys.modules', {'httpx': None})
+    def test_missing_httpx_is_a_configuration_error(self):
+        with self.assertRaises(AIRequestError) as context:
+            call_ai_api("Test query", retries=3)
+        self.assertEqual(context.exception.error_type, "configuration_error")
+
+    def test_unknown_transport(self):
+        config.TRANSPORT = "carrier-pigeon"
+        with self.assertRaises(AIRequestError) as context:
+            call_ai_api("Test query")
+        self.assertEqual(context.exception.error_type, "configuration_error")
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.store = HistoryStore(":memory:")
+        self.addCleanup(self.store.close)
+        self.store.add("how to create a tar archive", {
+            "answer": "Use `tar -cvf archive.tar files/`.",
+            "follow_up_questions": ["How do I extract it?"],
+            "model": "test-model",
+            "timings": {"total": 1.5},
+        })
+        self.store.add("how to find large files", {"answer": "Use `du -ah | sort -h`."})
+
+    def test_search(self):
+        self.assertEqual([e.query for e in self.store.search("tar")], ["how to create a tar archive"])
+        self.assertEqual(self.store.search("archives")[0].model, "test-model")
+        self.assertEqual(self.store.search('tar "OR'), self.store.search("tar or"))
+        self.assertEqual(self.store.search("tar sort"), [])
+
+    def test_best_match(self):
+        entry = self.store.best_match("how do I make a tar file?")
+        self.assertEqual(entry.query, "how to create a tar archive")
+        self.assertEqual(entry.follow_up_questions, ["How do I extract it?"])
+        self.assertEqual(entry.timings, {"total": 1.5})
+        self.assertIsNone(self.store.best_match("kubernetes"))
+
+    @patch('howdoai.get_history_store')
+    def test_best_match_misses_unrelated_questions(self, mock_get_store):
+        mock_get_store.return_value = self.store
+
+        # Shares only stop words and "create" with the tar entry
+        missing = main("how do I create a linked list in python?", offline=True, quiet=True)
+
+        self.assertEqual(missing["error_type"], "history_miss")
+        self.assertFalse(missing["cached"])
+        self.assertIsNone(self.store.best_match("how to do it"))
+
+    @patch('howdoai.get_history_store')
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_main_offline(self, mock_call_ai_api, mock_get_store):
+        mock_get_store.return_value = self.store
+
+        result = main("make a tar archive", offline=True, quiet=True)
+        missing = main("kubernetes", offline=True, quiet=True)
+
+        mock_call_ai_api.assert_not_called()
+        self.assertEqual(result["answer"], "Use `tar -cvf archive.tar files/`.")
+        self.assertTrue(result["cached"])
+        self.assertEqual(missing["error_type"], "history_miss")
+
+    @patch('howdoai.get_history_store')
+    def test_main_offline_code_only(self, mock_get_store):
+        mock_get_store.return_value = self.store
+
+        result = main("make a tar archive", offline=True, quiet=True, code_only=True)
+
+        self.assertEqual(result["answer"], "tar -cvf archive.tar files/")
+        self.assertIsNone(result["language"])
+        self.assertEqual(result["follow_up_questions"], [])
+
+    @patch('howdoai.get_history_store')
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_main_records_answers(self, mock_call_ai_api, mock_get_store):
+        mock_call_ai_api.return_value = AIResponse(content="Use `df -h`.")
+        mock_get_store.return_value = self.store
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+        config.HISTORY_ENABLED = True
+
+        main("how to check disk space", quiet=True)
+
+        self.assertEqual(self.store.search("disk")[0].answer, "Use `df -h`.")
+
+    @patch('sys.argv', ['howdoai', '--history', 'tar', '--output', 'ndjson'])
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('howdoai.get_history_store')
+    def test_cli_history(self, mock_get_store, mock_stdout):
+        mock_get_store.return_value = self.store
+        main_cli()
+
+        records = [json.loads(line) for line in mock_stdout.getvalue().splitlines()]
+        self.assertEqual([r["query"] for r in records], ["how to create a tar archive"])
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        register_backend("echo", EchoBackend)
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+        config.BACKEND = "echo"
+
+    def test_format_from_extension(self):
+        self.assertEqual(ProfileOptions(output="run.prof").resolved_format(), "pstats")
+        self.assertEqual(ProfileOptions(output="run.folded").resolved_format(), "collapsed")
+        self.assertEqual(ProfileOptions(output="run.txt").resolved_format(), "text")
+        with self.assertRaises(ValueError):
+            Profiler(ProfileOptions(output_format="pstats"))
+        with self.assertRaises(ValueError):
+            Profiler(ProfileOptions(output=os.path.join(self.tmpdir.name, "missing", "run.prof")))
+
+    @patch('sys.stderr', new_callable=StringIO)
+    def test_main_profile_summary(self, mock_stderr):
+        result = main("how to list files", quiet=True, profile=ProfileOptions(memory=True))
+
+        self.assertNotIn("error", result)
+        self.assertGreaterEqual(result["profile"]["wall_time"], result["profile"]["own_cpu_time"])
+        self.assertIsNotNone(result["profile"]["peak_memory"])
+        self.assertIn("network wait", mock_stderr.getvalue())
+        self.assertIn("Top allocations", mock_stderr.getvalue())
+
+    def test_network_wait_is_separated(self):
+        def slow_post(*args, **kwargs):
+            time.sleep(0.05)
+            response = MagicMock(status_code=200)
+            response.json.return_value = {"choices": [{"message": {"content": "Use `ls`."}}]}
+            return response
+
+        path = os.path.join(self.tmpdir.name, "run.txt")
+        with patch('howdoai.transports.requests.post', side_effect=slow_post):
+            with Profiler(ProfileOptions(output=path)) as profiler:
+                call_ai_api("how to list files", backend="local", retries=1)
+
+        self.assertEqual(profiler.report.network_requests, 1)
+        self.assertGreaterEqual(profiler.report.network_wait, 0.05)
+        self.assertLess(profiler.report.cpu_time, profiler.report.network_wait)
+        with open(path) as f:
+            self.assertIn("howdoai profile", f.read())
+
+    def test_background_threads_are_not_counted(self):
+        def background_work():
+            network_timer.record(5.0)
+            deadline = time.thread_time() + 0.3
+            while time.thread_time() < deadline:
+                pass
+
+        background = threading.Thread(target=background_work)
+        with Profiler(ProfileOptions(output=os.path.join(self.tmpdir.name, "run.txt"))) as profiler:
+            background.start()
+            background.join()
+            network_timer.record(0.01)
+
+        self.assertEqual(profiler.report.network_requests, 1)
+        self.assertAlmostEqual(profiler.report.network_wait, 0.01)
+        self.assertLess(profiler.report.cpu_time, 0.2)
+
+    def test_collapsed_stacks(self):
+        def leaf():
+            return sum(i * i for i in range(20000))
+
+        def root():
+            return leaf() + leaf()
+
+        path = os.path.join(self.tmpdir.name, "run.folded")
+        with Profiler(ProfileOptions(output=path)) as profiler:
+            root()
+
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines, collapsed_stacks(profiler.stats))
+        self.assertTrue(any(re.search(r"root \(.*\);leaf \(.*\) \d+$", line) for line in lines))
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_cli_profile_pstats(self, mock_stdout):
+        path = os.path.join(self.tmpdir.name, "run.prof")
+        with patch('sys.argv', ['howdoai', 'how to list files', '--quiet', '--backend', 'echo', '--profile', path]):
+            main_cli()
+
+        stats = pstats.Stats(path)
+        self.assertTrue(any(name == "print_result" for _, _, name in stats.stats))
+
+
+class TestWarmUp(unittest.TestCase):
+    def setUp(self):
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+        patcher = patch.object(warmup, '_warm_up_result', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def models_response(self):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"data": [{"id": config.LOCAL_MODEL}]}
+        return response
+
+    def chat_response(self):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"choices": [{"message": {"content": "OK"}}]}
+        return response
+
+    def test_models_url(self):
+        self.assertEqual(models_url("http://localhost:1234/v1/chat/completions"), "http://localhost:1234/v1/models")
+        self.assertEqual(models_url("http://localhost:1234/v1/"), "http://localhost:1234/v1/models")
+
+    @patch('howdoai.warmup.time.sleep')
+    @patch('howdoai.transports.requests.post')
+    @patch('howdoai.warmup.requests.get')
+    def test_warm_up_waits_for_readiness_then_primes(self, mock_get, mock_post, mock_sleep):
+        mock_get.side_effect = [requests.exceptions.ConnectionError("refused"), self.models_response()]
+        mock_post.return_value = self.chat_response()
+
+        result = warm_up()
+
+        self.assertTrue(result.ready)
+        self.assertTrue(result.model_listed)
+        self.assertEqual(mock_get.call_args[0][0], "http://localhost:1234/v1/models")
+        self.assertEqual(mock_post.call_args[1]["json"]["max_tokens"], 1)
+        self.assertGreaterEqual(result.total, result.prime_time)
+        mock_sleep.assert_called_once()
+
+    @patch('howdoai.warmup.requests.get')
+    def test_warm_up_failure_is_reported(self, mock_get):
+        mock_get.side_effect = requests.exceptions.ConnectionError("refused")
+
+        result = warm_up(timeout=0)
+
+        self.assertFalse(result.ready)
+        self.assertIn("not ready", result.error)
+
+    @patch('howdoai.questionanswerer.call_ai_api')
+    @patch('howdoai.transports.requests.post')
+    @patch('howdoai.warmup.requests.get')
+    def test_main_reports_warm_up_once(self, mock_get, mock_post, mock_call_ai_api):
+        mock_get.return_value = self.models_response()
+        mock_post.return_value = self.chat_response()
+        mock_call_ai_api.return_value = AIResponse(content="Use `ls`.")
+        config.WARMUP_ON_START = True
+
+        first = main("how to list files", quiet=True)
+        second = main("how to list files", quiet=True)
+
+        self.assertIn("warm_up", first["timings"])
+        self.assertNotIn("warm_up", second["timings"])
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('howdoai.transports.requests.post')
+    def test_keep_alive_pings(self, mock_post):
+        mock_post.return_value = self.chat_response()
+
+        with KeepAlive(interval=0.01) as keep_alive:
+            deadline = time.monotonic() + 5
+            while keep_alive.pings < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertGreaterEqual(keep_alive.pings, 2)
+        self.assertEqual(keep_alive.failures, 0)
+
+    @patch('sys.argv', ['howdoai', '--warm-up', '--output', 'json'])
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('howdoai.transports.requests.post')
+    @patch('howdoai.warmup.requests.get')
+    def test_cli_warm_up_only(self, mock_get, mock_post, mock_stdout):
+        mock_get.return_value = self.models_response()
+        mock_post.return_value = self.chat_response()
+
+        main_cli()
+
+        record = json.loads(mock_stdout.getvalue())
+        self.assertTrue(record["ready"])
+        self.assertIn("prime_time", record)
+
+
+class TestCassettes(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "session.jsonl.gz")
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+        config.update_from(Configuration.load(
+            overrides={"CASSETTE_PATH": self.path, "MAX_RETRIES": 1, "GROQ_API_KEY": "secret"},
+            environ={}, use_default_file=False))
+
+    @patch('howdoai.transports.requests.post')
+    def test_record_then_replay(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.headers = {"x-request-id": "abc"}
+        mock_post.return_value.json.return_value = {"choices": [{"message": {"content": "Use `ls`."}}]}
+        config.TRANSPORT = "record"
+
+        recorded = call_ai_api("how to list files", use_groq=True)
+
+        interaction = Cassette(self.path).interactions()[0]
+        self.assertEqual(interaction["request"]["headers"]["Authorization"], "REDACTED")
+        self.assertEqual(interaction["response"]["headers"], {"x-request-id": "abc"})
+
+        mock_post.reset_mock()
+        config.TRANSPORT = "replay"
+        config.CASSETTE_REPLAY_SPEED = 0
+        replayed = call_ai_api("how to list files", use_groq=True)
+
+        mock_post.assert_not_called()
+        self.assertEqual(replayed, recorded)
+
+    def test_replay_miss(self):
+        config.TRANSPORT = "replay"
+
+        with self.assertRaises(AIRequestError) as context:
+            call_ai_api("never recorded")
+
+        self.assertEqual(context.exception.error_type, "cassette_miss")
+
+    @patch('howdoai.backends.time.sleep')
+    def test_replay_miss_is_not_retried(self, mock_sleep):
+        config.TRANSPORT = "replay"
+        config.MAX_RETRIES = 3
+
+        with self.assertRaises(AIRequestError) as context:
+            call_ai_api("never recorded")
+
+        self.assertEqual(context.exception.error_type, "cassette_miss")
+        mock_sleep.assert_not_called()
+
+    @patch('howdoai.transports.requests.post')
+    def test_streamed_timing_is_replayed(self, mock_post):
+        def lines(decode_unicode=True):
+            for word in ("Use ", "`ls`."):
+                time.sleep(0.05)
+                yield "data: " + json.dumps({"choices": [{"delta": {"content": word}}]})
+            yield "data: [DONE]"
+
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.headers = {}
+        mock_post.return_value.iter_lines.side_effect = lines
+        config.TRANSPORT = "record"
+        self.assertEqual("".join(stream_ai_api("how to list files")), "Use `ls`.")
+
+        config.TRANSPORT = "replay"
+        start = time.perf_counter()
+        self.assertEqual("".join(stream_ai_api("how to list files")), "Use `ls`.")
+        recorded_speed = time.perf_counter() - start
+
+        config.CASSETTE_REPLAY_SPEED = 0
+        start = time.perf_counter()
+        self.assertEqual("".join(stream_ai_api("how to list files")), "Use `ls`.")
+        fastest = time.perf_counter() - start
+
+        self.assertGreaterEqual(recorded_speed, 0.1)
+        self.assertLess(fastest, 0.05)
+
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('howdoai.transports.requests.post')
+    def test_cli_replay(self, mock_post, mock_stdout):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.headers = {}
+        mock_post.return_value.json.return_value = {"choices": [{"message": {"content": "Use `ls`."}}]}
+        with patch('sys.argv', ['howdoai', 'how to list files', '--output', 'json', '--record', self.path]):
+            main_cli()
+        calls = mock_post.call_count
+        mock_stdout.truncate(0)
+        mock_stdout.seek(0)
+
+        with patch('sys.argv', ['howdoai', 'how to list files', '--output', 'json', '--replay', self.path,
+                                '--replay-speed', '0']):
+            main_cli()
+
+        self.assertEqual(mock_post.call_count, calls)
+        self.assertEqual(json.loads(mock_stdout.getvalue())["answer"], "Use `ls`.")
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def setUp(self):
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+        config.MAX_CONCURRENT_REQUESTS = 1
+        config.SCHEDULER_RESERVED_INTERACTIVE_SLOTS = 0
+        self.scheduler = RequestScheduler()
+        self.order = []
+        self.threads = []
+
+    def tearDown(self):
+        for thread in self.threads:
+            thread.join(5)
+
+    def enqueue(self, priority, tenant="default"):
+        def run():
+            try:
+                ticket = self.scheduler.acquire(priority, tenant)
+            except AIRequestError as e:
+                self.order.append((e.error_type, priority, tenant))
+                return
+            self.order.append((priority, tenant))
+            self.scheduler.release(ticket)
+
+        def arrivals():
+            return sum(s["queued"] + s["granted"] + s["shed"] for s in self.scheduler.stats().values())
+
+        before = arrivals()
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.threads.append(thread)
+        deadline = time.monotonic() + 5
+        while arrivals() == before and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def drain(self, ticket):
+        self.scheduler.release(ticket)
+        for thread in self.threads:
+            thread.join(5)
+
+    def test_higher_priority_goes_first(self):
+        held = self.scheduler.acquire("normal")
+        self.enqueue("bulk")
+        self.enqueue("normal")
+        self.enqueue("interactive")
+
+        self.drain(held)
+
+        self.assertEqual([priority for priority, _ in self.order], ["interactive", "normal", "bulk"])
+        stats = self.scheduler.stats()
+        self.assertEqual(stats["bulk"]["granted"], 1)
+        self.assertGreater(stats["bulk"]["wait_max"], 0)
+
+    def test_tenants_are_served_round_robin(self):
+        held = self.scheduler.acquire("bulk", "a")
+        for _ in range(3):
+            self.enqueue("bulk", "a")
+        self.enqueue("bulk", "b")
+
+        self.drain(held)
+
+        self.assertEqual([tenant for _, tenant in self.order], ["a", "b", "a", "a"])
+
+    def test_slots_are_reserved_for_interactive_requests(self):
+        config.MAX_CONCURRENT_REQUESTS = 2
+        config.SCHEDULER_RESERVED_INTERACTIVE_SLOTS = 1
+        held = self.scheduler.acquire("bulk")
+        self.enqueue("bulk")
+
+        interactive = self.scheduler.acquire("interactive")
+
+        self.assertEqual(self.scheduler.stats()["bulk"]["queued"], 1)
+        self.scheduler.release(interactive)
+        self.drain(held)
+        self.assertEqual(self.order, [("bulk", "default")])
+
+    def test_load_shedding_drops_lowest_priority_first(self):
+        config.SCHEDULER_MAX_QUEUE_DEPTH = 1
+        held = self.scheduler.acquire("normal")
+        self.enqueue("bulk")
+        self.enqueue("interactive")
+        self.enqueue("normal")
+
+        self.drain(held)
+
+        self.assertEqual(set(self.order[:2]), {("overloaded", "bulk", "default"), ("overloaded", "normal", "default")})
+        self.assertEqual(self.order[2], ("interactive", "default"))
+        self.assertEqual(self.scheduler.stats()["bulk"]["shed"], 1)
+
+    @patch('howdoai.transports.requests.post')
+    def test_main_reports_queue_wait(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"choices": [{"message": {"content": "Use `ls`."}}]}
+
+        result = main("how to list files", quiet=True, priority="bulk", tenant="batch-job")
+
+        self.assertIsInstance(result["timings"]["queue_wait"], float)
+        with self.assertRaises(AIRequestError) as context:
+            call_ai_api("how to list files", priority="urgent")
+        self.assertEqual(context.exception.error_type, "invalid_request")
+
+
+
+class TestCodeOnly(unittest.TestCase):
+    def test_extract_code(self):
+        self.assertEqual(extract_code("```bash\ntar -czf a.tar.gz dir/"), ("tar -czf a.tar.gz dir/", "bash"))
+        self.assertEqual(extract_code("Run:\n```python\nprint(1)\nprint(2)\n```\nDone."),
+                         ("print(1)\nprint(2)", "python"))
+        self.assertEqual(extract_code("`ls -la`"), ("ls -la", None))
+        self.assertEqual(extract_code("Use `ls -la` to list them."), ("ls -la", None))
+        self.assertEqual(extract_code("ls -la"), ("ls -la", None))
+
+    @patch('howdoai.transports.requests.post')
+    def test_main_code_only(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"choices": [{"message": {"content": "```bash\nls -la"}}]}
+
+        result = main("how to list hidden files", quiet=True, code_only=True)
+
+        self.assertEqual(result["answer"], "ls -la")
+        self.assertEqual(result["language"], "bash")
+        self.assertEqual(result["follow_up_questions"], [])
+        # One request: no follow-up questions are generated
+        mock_post.assert_called_once()
+        payload = mock_post.call_args[1]['json']
+        self.assertEqual(payload["stop"], ["\n```\n"])
+        self.assertEqual(payload["max_tokens"], config.CODE_ONLY_MAX_TOKENS)
+        self.assertEqual(payload["messages"][0]["content"], config.CODE_ONLY_SYSTEM_MESSAGE)
+
+    @patch('howdoai.questionanswerer.call_ai_api')
+    def test_code_only_retries_when_stopped_before_the_code(self, mock_call_ai_api):
+        mock_call_ai_api.side_effect = [
+            AIResponse(content="Here is the command:"),
+            AIResponse(content="Here is the command:\n```\nls -la\n```\nIt lists hidden files."),
+        ]
+
+        code, language = QuestionAnswerer().generate_code("how to list hidden files", False, None)
+
+        self.assertEqual(code, "ls -la")
+        self.assertEqual(mock_call_ai_api.call_count, 2)
+        self.assertNotIn("stop", mock_call_ai_api.call_args[1])
+
+    def test_stub_backend_honours_stop(self):
+        response = call_ai_api("how to list files", backend="stub", stop=[" to"])
+        self.assertEqual(response.content, "Stub answer")
+
+    @patch('sys.argv', ['howdoai', '--backend', 'stub', '--code-only', 'how to list files'])
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_cli_code_only_prints_plain_code_when_piped(self, mock_stdout):
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+
+        main_cli()
+
+        self.assertEqual(mock_stdout.getvalue(), "Stub answer to: how to list files\n")
+
+
+
+class FailingBackend(Backend):
+    name = "failing"
+
+    def complete(self, request):
+        raise AIRequestError("Connection error occurred", error_type="connection_error")
+
+
+class TestModelRouting(unittest.TestCase):
+    def setUp(self):
+        original = config.snapshot()
+        self.addCleanup(config.update_from, original)
+
+    def test_scores_hard_queries_higher(self):
+        simple = score_query("how to list files")
+        hard = score_query("explain the difference between threads and processes, and why deadlocks happen")
+
+        self.assertLess(simple, config.ROUTING_THRESHOLD)
+        self.assertGreaterEqual(hard, config.ROUTING_THRESHOLD)
+        self.assertGreater(score_query("how to fix this:\n```\nfor (;;) {}\n```"), simple)
+
+    def test_routes_by_score_and_threshold(self):
+        router = ModelRouter()
+
+        self.assertEqual(router.route("how to list files").backend, "local")
+        self.assertEqual(router.route("how to list files").fallback, "groq")
+        self.assertEqual(router.route("why does my threading code deadlock?").backend, "groq")
+        config.ROUTING_THRESHOLD = 0.0
+        self.assertEqual(router.route("how to list files").backend, "groq")
+
+    def test_learns_from_recorded_outcomes(self):
+        config.ROUTING_MIN_SAMPLES = 3
+        router = ModelRouter()
+        route = router.route("how to list files")
+        for _ in range(3):
+            router.record(route, 0.5, failed=True)
+
+        rerouted = router.route("how to list files")
+        self.assertEqual(rerouted.backend, "groq")
+        self.assertIsNone(rerouted.fallback)
+        self.assertEqual(router.stats()["local"][str(route.bucket)]["samples"], 3)
+
+    def test_prefers_large_backend_when_it_is_as_fast(self):
+        config.ROUTING_MIN_SAMPLES = 2
+        router = ModelRouter()
+        route = router.route("how to list files")
+        for _ in range(2):
+            router.record(route, 2.0, failed=False)
+            router.record(Route("groq", route.score, route.bucket, "test"), 1.0, failed=False)
+
+        self.assertEqual(router.route("how to list files").backend, "groq")
+
+    def test_outcomes_persist(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "routing.json")
+            router = ModelRouter(path)
+            router.record(router.route("how to list files"), 0.25, failed=False)
+            # Saves are batched; nothing is written until the interval passes or the router is flushed
+            self.assertFalse(os.path.exists(path))
+            router.flush()
+
+            self.assertEqual(ModelRouter(path).stats(), router.stats())
+
+    def test_truncated_answers_do_not_escalate(self):
+        config.ROUTING_MIN_SAMPLES = 3
+        router = ModelRouter()
+        route = router.route("how to list files")
+        for _ in range(3):
+            router.record(route, 0.5, failed=False, truncated=True)
+
+        self.assertEqual(router.route("how to list files").backend, "local")
+        self.assertEqual(router.stats()["local"][str(route.bucket)]["truncation_rate"], 1.0)
+
+    def test_auto_backend_escalates_failures(self):
+        register_backend("failing", FailingBackend)
+        config.ROUTING_SMALL_BACKEND = "failing"
+        config.ROUTING_LARGE_BACKEND = "stub"
+
+        response = call_ai_api("how to list files", backend="auto")
+
+        self.assertEqual(response.backend, "stub")
+        self.assertEqual(response.content, "Stub answer to: how to list files")
+
+    def test_auto_backend_keeps_follow_ups_on_small_backend(self):
+        config.BACKEND = "auto"
+        config.ROUTING_SMALL_BACKEND = "stub"
+        config.ROUTING_LARGE_BACKEND = "failing"
+        register_backend("failing", FailingBackend)
+
+        result = main("why does my threading code deadlock when two locks are taken in different orders?",
+                      quiet=True)
+
+        # The hard question fails on the large backend and is not escalated to the small one
+        self.assertEqual(result["error_type"], "connection_error")
+        answerer = QuestionAnswerer()
+        # Follow-up questions go to the small backend whatever their prompt scores
+        answerer.generate_follow_up_questions("q", "```\nfor (;;) {}\n```\n" + "word " * 60, False, None)
+        self.assertGreater(answerer.usage["total_tokens"], 0)
 
 
 if __name__ == '__main__':